@@ -0,0 +1,184 @@
+"""
+Admission control for upstream LLM calls.
+
+RateLimiter keeps two token buckets, requests per minute and (estimated)
+tokens per minute, in a SQLite database shared by every worker on the host,
+so the budgets hold for the host as a whole rather than per process. Each
+bucket holds at most one minute of budget and refills continuously. A budget
+of 0 is unlimited.
+
+AdmissionController sits in front of the calls. A call that fits the budget
+goes ahead at once. Otherwise it waits for the buckets to refill, but only
+while fewer than `max_queue` callers in this process are waiting and only if
+the budget will be there within `max_wait` seconds. Anything else is shed:
+admit() returns False and the caller answers locally (the inferential
+classifier, the template replies), so overload costs at most `max_wait`
+seconds instead of an unbounded queue of blocked workers.
+
+admit_async() is the asyncio counterpart for the ASGI mode: waiting callers
+sleep on the event loop and the SQLite buckets are read in a worker thread.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+from sqlite_store import SQLiteConnections
+from telemetry import count, log_event, stage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL);
+"""
+
+# Rough size of a message's framing in tokens, on top of its text
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(messages, max_tokens):
+    """Upper-bound guess of a completion's token cost: ~4 characters per
+    prompt token, plus the completion's max_tokens."""
+    prompt = sum(len(m.get("content", "")) // 4 + MESSAGE_OVERHEAD_TOKENS for m in messages)
+    return prompt + max_tokens
+
+
+class RateLimiter:
+    def __init__(self, path, requests_per_minute=0, tokens_per_minute=0):
+        self.path = path
+        self.budgets = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self._connections = SQLiteConnections(path, SCHEMA)
+
+    @property
+    def enabled(self):
+        return any(budget > 0 for budget in self.budgets.values())
+
+    def _refilled(self, conn, name, now):
+        budget = self.budgets[name]
+        row = conn.execute("SELECT level, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return budget
+        level, updated_at = row
+        return min(budget, level + max(0.0, now - updated_at) * budget / 60)
+
+    def try_acquire(self, tokens):
+        """Take one request and `tokens` tokens from the buckets.
+
+        Returns 0 if they were taken, else the seconds until the buckets will
+        have refilled enough (nothing is taken then). A request larger than a
+        whole minute's budget is let through once the bucket is full.
+        """
+        if not self.enabled:
+            return 0.0
+        wanted = {"requests": 1, "tokens": tokens}
+        try:
+            conn = self._connections.get()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                levels = {name: self._refilled(conn, name, now)
+                          for name, budget in self.budgets.items() if budget > 0}
+                wait = 0.0
+                for name, level in levels.items():
+                    need = min(wanted[name], self.budgets[name])
+                    if level < need:
+                        wait = max(wait, (need - level) * 60 / self.budgets[name])
+                if wait > 0:
+                    return wait
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                    [(name, level - wanted[name], now) for name, level in levels.items()])
+                return 0.0
+        except sqlite3.Error as e:
+            # Fail open: the limiter must not take the LLM path down with it
+            log_event(logging.WARNING, "rate_limiter_failed", error=str(e))
+            return 0.0
+
+    def levels(self):
+        """Budget left in each limited bucket, across all workers."""
+        if not self.enabled:
+            return {}
+        try:
+            conn = self._connections.get()
+            now = time.time()
+            return {name: round(self._refilled(conn, name, now), 1)
+                    for name, budget in self.budgets.items() if budget > 0}
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "rate_limiter_failed", error=str(e))
+            return {}
+
+
+class AdmissionController:
+    def __init__(self, limiter, max_queue=16, max_wait=2.0):
+        self.limiter = limiter
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._counters = {"admitted": 0, "delayed": 0, "shed": 0}
+
+    def _record(self, outcome):
+        with self._lock:
+            self._counters[outcome] += 1
+        count("ora_admission_total", outcome)
+        if outcome == "shed":
+            log_event(logging.INFO, "llm_call_shed", sampled=True, waiting=self._waiting)
+
+    def _enter_queue(self):
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                return False
+            self._waiting += 1
+            return True
+
+    def _leave_queue(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def admit(self, tokens):
+        """Whether an upstream call costing `tokens` may go ahead now,
+        waiting up to max_wait seconds for budget."""
+        wait = self.limiter.try_acquire(tokens)
+        if wait == 0:
+            self._record("admitted")
+            return True
+        if wait > self.max_wait or not self._enter_queue():
+            self._record("shed")
+            return False
+        try:
+            with stage("admission_wait"):
+                deadline = time.monotonic() + self.max_wait
+                while wait > 0 and time.monotonic() + wait <= deadline:
+                    time.sleep(wait)
+                    wait = self.limiter.try_acquire(tokens)
+        finally:
+            self._leave_queue()
+        self._record("delayed" if wait == 0 else "shed")
+        return wait == 0
+
+    async def admit_async(self, tokens):
+        """admit() for event-loop callers: waits without blocking the loop."""
+        wait = await asyncio.to_thread(self.limiter.try_acquire, tokens)
+        if wait == 0:
+            self._record("admitted")
+            return True
+        if wait > self.max_wait or not self._enter_queue():
+            self._record("shed")
+            return False
+        try:
+            with stage("admission_wait"):
+                deadline = time.monotonic() + self.max_wait
+                while wait > 0 and time.monotonic() + wait <= deadline:
+                    await asyncio.sleep(wait)
+                    wait = await asyncio.to_thread(self.limiter.try_acquire, tokens)
+        finally:
+            self._leave_queue()
+        self._record("delayed" if wait == 0 else "shed")
+        return wait == 0
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._counters)
+            result["waiting"] = self._waiting
+        result.update(max_queue=self.max_queue, max_wait=self.max_wait,
+                      budgets=self.limiter.budgets, levels=self.limiter.levels())
+        return result
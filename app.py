@@ -1,44 +1,89 @@
 import os
 import json
+import logging
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
 import uuid
-from flask import Flask, request, jsonify, render_template
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Request, Response, g, request, jsonify, make_response, render_template, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
 from flask_cors import CORS
-import openai
 from dotenv import load_dotenv
 
+import audio_emotion
+from admission import AdmissionController, RateLimiter, estimate_tokens
+import avatar_assets
+from classification_cache import ClassificationCache
+from conversation_store import make_conversation_store
+from emotion_lexicon import score_text, score_texts
+from llm_client import get_breaker, get_client
+from micro_batcher import MicroBatcher
+from similarity_index import SimilarityIndex
+from single_flight import SingleFlight
+from telemetry import count, log_event, record_request, render_metrics, stage, start_request_sampling, timed
+
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Debug output to check if API key is loaded
-print(f"API Key status: {'Loaded' if openai.api_key else 'Missing'}")
-if not openai.api_key:
-    print("WARNING: No OpenAI API key found. Emotion detection will use inferential classifier.")
+if OPENAI_API_KEY:
+    log_event(logging.INFO, "api_key_loaded")
+else:
+    log_event(logging.WARNING, "api_key_missing", detail="Emotion detection will use the inferential classifier")
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 CORS(app)
 
-# In-memory conversation store
-conversations = {}
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    start_request_sampling()
 
-@app.route("/")
-def index():
-    return render_template("index.html")
+@app.after_request
+def record_request_metrics(response):
+    record_request(request.endpoint, response.status_code, time.perf_counter() - g.request_start)
+    return response
 
-@app.route("/classify", methods=["POST"])
-def classify():
-    data = request.get_json()
-    text = data.get("text", "").strip()
-    if not text:
-        return jsonify({"error": "No text to classify"}), 400
+@app.route("/metrics")
+def metrics():
+    """Prometheus metrics, summed over every process on this host."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
-    print(f"Processing text: '{text}'")
+# Conversation store, shared across workers unless CONVERSATION_STORE=memory
+conversations = make_conversation_store()
 
-    # If no API key is available, use an inferential fallback
-    if not openai.api_key:
-        return inferential_classify(text)
+# Built assets have content-hashed names, so caches may keep them for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+@app.route("/")
+def index():
+    # The avatar sheets are picked per client from its Accept header
+    response = make_response(render_template(
+        "index.html", avatar_assets=avatar_assets.page_assets(request.accept_mimetypes)))
+    response.vary.add("Accept")
+    return response
 
-    # Improved system prompt for inferring emotions without explicit statements
-    system_prompt = """
+@app.route("/assets/<name>")
+def asset(name):
+    """Avatar atlases from avatar_assets.build(), by hashed name."""
+    found = avatar_assets.asset_file(name)
+    if found is None:
+        return jsonify({"error": "Not found"}), 404
+    path, mimetype = found
+    # The name identifies the content, so it doubles as a stable ETag across
+    # workers and hosts
+    response = send_file(path, mimetype=mimetype, max_age=ASSET_MAX_AGE, conditional=True, etag=name)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# Improved system prompt for inferring emotions without explicit statements
+CLASSIFY_GUIDELINES = """
 You are an expert emotion classifier that can detect subtle emotional cues in speech.
 Analyze the text and infer the speaker's emotional state, even when emotions aren't
 explicitly stated. Look for:
@@ -52,62 +97,404 @@ Classify into one of these categories: Happy, Sad, Angry, Fearful, Anxious, Exci
 Neutral, Surprised, Disgusted, Confused, Tired, or Hungry.
 
 Also assign an intensity value from -100 (extremely negative) to +100 (extremely positive).
-
+"""
+CLASSIFY_SYSTEM_PROMPT = CLASSIFY_GUIDELINES + """
 Respond ONLY with a JSON object in this format:
 {"emotion":"Category","intensity":value}
 """
+# Used by the micro-batcher to classify several texts in one call
+CLASSIFY_BATCH_SYSTEM_PROMPT = CLASSIFY_GUIDELINES + """
+You will be given a JSON array of texts. Classify each one independently and
+respond ONLY with a JSON array holding one object per text, in the same order:
+[{"emotion":"Category","intensity":value}, ...]
+"""
 
-    try:
-        print("Making OpenAI API request...")
-        # Try to use the new OpenAI client API format
+CLASSIFY_MODEL = "gpt-4"
+CHAT_MODEL = "gpt-3.5-turbo"
+CHAT_FALLBACK_REPLY = "I'm having trouble connecting right now. Can we try again in a moment?"
+
+# Micro-batching of LLM classifications: concurrent /classify requests that
+# arrive within the window share one upstream call. A window of 0 disables it.
+CLASSIFY_MICROBATCH_WINDOW = float(os.getenv("CLASSIFY_MICROBATCH_WINDOW_MS", "0")) / 1000
+CLASSIFY_MICROBATCH_SIZE = int(os.getenv("CLASSIFY_MICROBATCH_SIZE", "8"))
+
+def classify_namespace(batched):
+    """Cache namespace of the classifications: the model and a hash of the
+    prompts that produce them. Micro-batched answers come from the batch
+    prompt, so it is part of the hash whenever micro-batching is on."""
+    prompts = CLASSIFY_SYSTEM_PROMPT + (CLASSIFY_BATCH_SYSTEM_PROMPT if batched else "")
+    return f"{CLASSIFY_MODEL}:{hashlib.sha256(prompts.encode('utf-8')).hexdigest()[:12]}"
+
+# LLM classifications shared across gunicorn workers through a local SQLite file
+classify_cache = ClassificationCache(
+    os.getenv("CLASSIFY_CACHE_PATH", os.path.join(tempfile.gettempdir(), "ora_classify_cache.sqlite3")),
+    namespace=classify_namespace(CLASSIFY_MICROBATCH_WINDOW > 0),
+    max_entries=int(os.getenv("CLASSIFY_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("CLASSIFY_CACHE_TTL", "3600")),
+)
+
+# Near-duplicate reuse of LLM classifications: on an exact cache miss, a text
+# whose estimated similarity to an earlier one reaches CLASSIFY_SIMILARITY
+# gets its answer (above 1 disables it); see similarity_index.py
+similar_classifications = SimilarityIndex(
+    classify_cache.path,
+    namespace=classify_cache.namespace,
+    threshold=float(os.getenv("CLASSIFY_SIMILARITY", "0.7")),
+    max_entries=int(os.getenv("CLASSIFY_SIMILAR_SIZE", "10000")),
+    ttl=classify_cache.ttl,
+)
+
+# Upper bound on the number of texts accepted by /classify_batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "256"))
+
+# Admission control for upstream calls: host-wide requests and tokens per
+# minute budgets (0 = unlimited) and a bounded wait, past which calls are
+# shed and answered locally; see admission.py
+llm_admission = AdmissionController(
+    RateLimiter(os.getenv("ADMISSION_DB_PATH", os.path.join(tempfile.gettempdir(), "ora_admission.sqlite3")),
+                requests_per_minute=float(os.getenv("OPENAI_RPM", "0")),
+                tokens_per_minute=float(os.getenv("OPENAI_TPM", "0"))),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "16")),
+    max_wait=float(os.getenv("ADMISSION_MAX_WAIT", "2")),
+)
+
+def admit_llm_call(path, messages, max_tokens, items=1):
+    """Whether this upstream call may go ahead: llm_admission must admit it
+    and the OpenAI circuit must not be open. Otherwise the `items` answers
+    it was for count as degraded on `path`.
+
+    Admission comes first, so a shed call never uses up a half-open
+    circuit's probe.
+    """
+    if not llm_admission.admit(estimate_tokens(messages, max_tokens)):
+        count("ora_degraded_total", path, "shed", amount=items)
+        return False
+    if not get_breaker().allow():
+        count("ora_degraded_total", path, "circuit_open", amount=items)
+        return False
+    return True
+
+# Hedged classification: with a budget (seconds) > 0 the local classifier
+# answers whenever the LLM misses the budget. 0 waits for the LLM as before.
+CLASSIFY_LATENCY_BUDGET = float(os.getenv("CLASSIFY_LATENCY_BUDGET", "0"))
+# LLM calls allowed in flight for hedging, including ones that missed the
+# budget and are only finishing to warm the cache
+HEDGE_MAX_INFLIGHT = int(os.getenv("HEDGE_MAX_INFLIGHT", "32"))
+_hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_MAX_INFLIGHT, thread_name_prefix="hedge")
+_hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_INFLIGHT)
+
+# Longest a request waits on its batch's upstream call (same setting as the
+# ASGI mode's per-call deadline) before answering locally
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "10"))
+
+# Identical texts classified concurrently share one upstream call: within a
+# process through single flight, across workers through cache leases.
+# A worker waits at most SINGLEFLIGHT_LEASE seconds for another's answer.
+SINGLEFLIGHT_LEASE = float(os.getenv("SINGLEFLIGHT_LEASE", "10"))
+SINGLEFLIGHT_POLL = 0.05
+classify_flights = SingleFlight()
+
+@app.route("/classify", methods=["POST"])
+def classify():
+    with stage("request_parse"):
+        data = request.get_json()
+    text = data.get("text", "").strip()
+    if not text:
+        return jsonify({"error": "No text to classify"}), 400
+
+    log_event(logging.DEBUG, "classify_text", text=text)
+    start = time.perf_counter()
+
+    # If no API key is available, use an inferential fallback
+    if not OPENAI_API_KEY:
+        result = infer_emotion(text)
+    elif CLASSIFY_LATENCY_BUDGET > 0:
+        result = hedged_classify(text, start + CLASSIFY_LATENCY_BUDGET)
+    else:
+        # If the API call or parsing fails, use the inferential classifier
+        result = llm_classify(text) or infer_emotion(text)
+    log_classification(result, start)
+    return jsonify(result)
+
+@app.route("/classify_batch", methods=["POST"])
+def classify_batch():
+    """Classify a list of texts in one round trip.
+
+    Results come back in request order, each shaped like
+    map_emotion_to_confidences plus "source", or {"error": ...} for empty
+    items. With a latency budget the whole batch shares one deadline.
+    """
+    with stage("request_parse"):
+        data = request.get_json()
+    texts = data.get("texts")
+    if not isinstance(texts, list) or not texts:
+        return jsonify({"error": "Expected a non-empty list of texts"}), 400
+    if len(texts) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} texts per batch"}), 400
+
+    texts = [str(t or "").strip() for t in texts]
+    results = [None if t else {"error": "No text to classify"} for t in texts]
+    pending = [i for i, t in enumerate(texts) if t]
+
+    start = time.perf_counter()
+
+    futures = {}
+    if OPENAI_API_KEY and CLASSIFY_LATENCY_BUDGET > 0:
+        futures = {i: f for i, f in ((i, submit_hedged(texts[i])) for i in pending) if f is not None}
+    elif OPENAI_API_KEY:
+        unresolved = []
+        for i in pending:
+            results[i] = llm_classify(texts[i])
+            if results[i] is None:
+                unresolved.append(i)
+        pending = unresolved
+
+    # Score everything left with the vectorized inferential classifier
+    if pending:
+        with stage("inferential_classify"):
+            scored = score_texts([texts[i] for i in pending])
+        for i, (emotion, intensity) in zip(pending, scored):
+            results[i] = map_emotion_to_confidences(emotion, intensity)
+            results[i]["source"] = "local"
+
+    # Upgrade local answers with LLM answers that arrived within the budget
+    if futures:
+        wait(futures.values(), timeout=max(0, start + CLASSIFY_LATENCY_BUDGET - time.perf_counter()))
+        for i, future in futures.items():
+            if future.done() and future.result() is not None:
+                results[i] = future.result()
+
+    for result in results:
+        if "source" in result:
+            count("ora_classifications_total", result["source"])
+    log_event(logging.INFO, "classified_batch", sampled=True, texts=len(texts),
+              ms=round((time.perf_counter() - start) * 1000, 1))
+    return jsonify({"results": results})
+
+def llm_classify(text):
+    """Classify `text` with GPT.
+
+    Returns the map_emotion_to_confidences result, or None if the API call
+    or parsing fails so the caller can fall back to the inferential classifier.
+    Successful classifications are cached by normalized text.
+    """
+    cached = cached_classification(text)
+    if cached is not None:
+        return cached
+    return classify_flights.do(classify_cache.key(text), lambda: shared_request_classification(text))
+
+def shared_request_classification(text):
+    """request_classification, unless another worker is making the same call.
+
+    In that case wait for its answer to reach the cache, and only ask GPT
+    here if it never does (the other worker failed or died).
+    """
+    if classify_cache.acquire_lease(text, SINGLEFLIGHT_LEASE):
         try:
-            client = openai.OpenAI(api_key=openai.api_key)
-            resp = client.chat.completions.create(
-                model="gpt-4" if openai.api_key else "gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Text: \"{text}\""}
-                ],
-                temperature=0.0,
-                max_tokens=50
-            )
-            raw = resp.choices[0].message.content.strip()
-        except AttributeError:
-            # Fall back to the old API format if necessary
-            resp = openai.ChatCompletion.create(
-                model="gpt-4" if openai.api_key else "gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Text: \"{text}\""}
-                ],
+            return request_classification(text)
+        finally:
+            classify_cache.release_lease(text)
+
+    classify_flights.count("remote_waits")
+    deadline = time.monotonic() + SINGLEFLIGHT_LEASE
+    while time.monotonic() < deadline:
+        time.sleep(SINGLEFLIGHT_POLL)
+        result, waiting = poll_shared_classification(text)
+        if result is not None:
+            classify_flights.count("remote_hits")
+            return result
+        if not waiting:
+            break
+    return request_classification(text)
+
+def poll_shared_classification(text):
+    """Check once on a classification another worker holds the lease for.
+
+    Returns (result, waiting): the mapped result if it has reached the
+    cache, and whether the lease is still held so waiting is worthwhile.
+    """
+    waiting = classify_cache.lease_held(text)
+    shared = classify_cache.peek(text)
+    if shared is None:
+        return None, waiting
+    log_event(logging.DEBUG, "shared_classification", text=text)
+    result = map_emotion_to_confidences(shared["emotion"], shared["intensity"])
+    result["source"] = "llm"
+    return result, False
+
+def request_classification(text):
+    """Ask GPT to classify `text`, bypassing the cache lookup."""
+    if classify_batcher is not None:
+        # Bounded, so a stuck or dead flusher cannot hold request threads
+        timeout = CLASSIFY_MICROBATCH_WINDOW + min(REQUEST_DEADLINE, sum(get_client().timeout))
+        try:
+            raw = classify_batcher.submit(text).result(timeout=timeout)
+        except FutureTimeout:
+            log_event(logging.WARNING, "openai_error", error="batched request timed out")
+            return None
+        return None if raw is None else handle_classification(text, raw)
+    messages = classify_messages(text)
+    if not admit_llm_call("classify", messages, 50):
+        return None
+    try:
+        with stage("llm_call"):
+            raw = get_client().chat_completion(
+                model=CLASSIFY_MODEL,
+                messages=messages,
                 temperature=0.0,
                 max_tokens=50
             )
-            raw = resp.choices[0].message.content.strip()
-            
-        print("OpenAI response received.")
-        print(f"Raw GPT response: {raw}")
-        
-        try:
+    except Exception as e:
+        log_event(logging.WARNING, "openai_error", error=f"{type(e).__name__}: {e}")
+        return None
+    return handle_classification(text, raw)
+
+def classify_batch_request(texts):
+    """chat_completion arguments for classifying `texts` in one call.
+
+    A batch of one uses the regular single-text prompt.
+    """
+    if len(texts) == 1:
+        return {"messages": classify_messages(texts[0]), "max_tokens": 50}
+    return {
+        "messages": [
+            {"role": "system", "content": CLASSIFY_BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Texts: {json.dumps(texts)}"}
+        ],
+        "max_tokens": 20 * len(texts) + 10
+    }
+
+def split_batch_classification(raw, count):
+    """Split a raw batched GPT response into one raw JSON object per text.
+
+    Entries that are missing or malformed come back as None, as does every
+    entry if the response is not a JSON array of `count` items.
+    """
+    if count == 1:
+        return [raw]
+    log_event(logging.DEBUG, "openai_batch_response", raw=raw)
+    try:
+        with stage("json_parse"):
+            items = json.loads(raw)
+    except ValueError as e:
+        log_event(logging.WARNING, "openai_batch_unparseable", error=str(e))
+        return [None] * count
+    if not isinstance(items, list) or len(items) != count:
+        log_event(logging.WARNING, "openai_batch_wrong_length", expected=count)
+        return [None] * count
+    return [json.dumps(item) if isinstance(item, dict) else None for item in items]
+
+def request_classifications(texts):
+    """MicroBatcher handler: classify `texts` with a single GPT call."""
+    call = classify_batch_request(texts)
+    if not admit_llm_call("classify", call["messages"], call["max_tokens"], items=len(texts)):
+        return [None] * len(texts)
+    with stage("llm_call"):
+        raw = get_client().chat_completion(model=CLASSIFY_MODEL, temperature=0.0, **call)
+    return split_batch_classification(raw, len(texts))
+
+classify_batcher = MicroBatcher(
+    request_classifications,
+    max_batch=CLASSIFY_MICROBATCH_SIZE,
+    window=CLASSIFY_MICROBATCH_WINDOW,
+    name="classify-batch",
+) if CLASSIFY_MICROBATCH_WINDOW > 0 else None
+
+def submit_hedged(text):
+    """Start the LLM classification of `text` in the background.
+
+    Returns a future resolving to the llm_classify result (cache hits are
+    returned as already-finished futures), or None when all hedge slots are
+    busy and the caller should just use the local classifier.
+    """
+    if not _hedge_slots.acquire(blocking=False):
+        log_event(logging.WARNING, "hedge_slots_exhausted")
+        return None
+    try:
+        return _hedge_pool.submit(_hedged_request, text)
+    except RuntimeError:  # pool shut down at interpreter exit
+        _hedge_slots.release()
+        return None
+
+def _hedged_request(text):
+    try:
+        return llm_classify(text)
+    finally:
+        _hedge_slots.release()
+
+def hedged_classify(text, deadline):
+    """Race the LLM against `deadline`, answering locally if it loses.
+
+    A late LLM answer still lands in the classification cache, so the next
+    request for the same text is served from there.
+    """
+    future = submit_hedged(text)
+    local = infer_emotion(text)
+    if future is None:
+        return local
+    try:
+        result = future.result(timeout=max(0, deadline - time.perf_counter()))
+    except FutureTimeout:
+        log_event(logging.INFO, "latency_budget_missed", sampled=True)
+        return local
+    return result or local
+
+def log_classification(result, start):
+    count("ora_classifications_total", result["source"])
+    log_event(logging.INFO, "classified", sampled=True, source=result["source"], emotion=result["emotion"],
+              ms=round((time.perf_counter() - start) * 1000, 1))
+
+def classify_messages(text):
+    return [
+        {"role": "system", "content": CLASSIFY_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Text: \"{text}\""}
+    ]
+
+def cached_classification(text):
+    """Return the cached classification for `text`, or for a near duplicate
+    of it, mapped to confidences, or None."""
+    with stage("cache_lookup"):
+        cached = classify_cache.get(text)
+    if cached is None:
+        with stage("similarity_lookup"):
+            similar = similar_classifications.get(text)
+        if similar is None:
+            return None
+        cached, similarity = similar
+        log_event(logging.DEBUG, "similar_cache_hit", text=text, similarity=round(similarity, 3))
+    else:
+        log_event(logging.DEBUG, "cache_hit", text=text)
+    result = map_emotion_to_confidences(cached["emotion"], cached["intensity"])
+    result["source"] = "cache"
+    return result
+
+def handle_classification(text, raw):
+    """Parse a raw GPT classification, cache it and map it to confidences.
+
+    Returns None if the response cannot be parsed.
+    """
+    log_event(logging.DEBUG, "openai_response", raw=raw)
+
+    try:
+        with stage("json_parse"):
             result = json.loads(raw)
             emotion = result.get("emotion", "Neutral")
             intensity = int(result.get("intensity", 0))
-            print(f"Successfully parsed emotion: {emotion}, intensity: {intensity}")
-            
-            # Map emotion to confidences for the p5.js visualization
-            result = map_emotion_to_confidences(emotion, intensity)
-            print(f"Returning: {result}")
-            return jsonify(result)
-            
-        except Exception as e:
-            print(f"Failed to parse JSON from GPT: {raw}, Error: {e}")
-            # If parsing fails, use the inferential classifier as fallback
-            return inferential_classify(text)
     except Exception as e:
-        print(f"OpenAI API error: {e}")
-        # If API call fails, use the inferential classifier
-        return inferential_classify(text)
+        log_event(logging.WARNING, "openai_response_unparseable", raw=raw, error=str(e))
+        return None
+
+    classified = {"emotion": emotion, "intensity": intensity}
+    classify_cache.put(text, classified)
+    similar_classifications.put(text, classified)
+
+    # Map emotion to confidences for the p5.js visualization
+    result = map_emotion_to_confidences(emotion, intensity)
+    result["source"] = "llm"
+    log_event(logging.DEBUG, "llm_classification", result=result)
+    return result
 
+@timed("map_emotion_to_confidences")
 def map_emotion_to_confidences(emotion, intensity):
     """Map the detected emotion and intensity to confidence values for visualization"""
     # Expanded emotion mapping including Tired and Hungry categories
@@ -148,324 +535,292 @@ def map_emotion_to_confidences(emotion, intensity):
 
 def inferential_classify(text):
     """More sophisticated context-based emotion classifier for when OpenAI API is unavailable"""
-    text_lower = text.lower()
-    
-    print(f"Using inferential classifier for: '{text}'")
-    
-    # Initialize score counters for each emotion
-    scores = {
-        "Happy": 0,
-        "Sad": 0,
-        "Angry": 0,
-        "Anxious": 0,
-        "Fearful": 0,
-        "Excited": 0,
-        "Neutral": 0.5,  # Slight bias for neutral as default
-        "Surprised": 0,
-        "Disgusted": 0,
-        "Confused": 0,
-        "Tired": 0,     # New category
-        "Hungry": 0     # New category
-    }
-    
-    # Enhanced contextual detection patterns with additional categories
-    patterns = {
-        "Happy": [
-            "great", "wonderful", "fantastic", "amazing", "good", "love", "awesome", 
-            "enjoy", "pleased", "delighted", "win", "success", "accomplished", 
-            "birthday", "celebrate", "proud", "perfect", "beautiful", "sunshine",
-            "excited about", "looking forward", "can't wait", "fun"
-        ],
-        "Sad": [
-            "sad", "down", "unhappy", "depressed", "miserable", "hurt", "pain", 
-            "lonely", "alone", "miss", "lost", "sorry", "regret", "cry", "tear",
-            "heartbroken", "disappointed", "grief", "upset", "funeral", "died",
-            "miss home", "homesick", "exhausted", "worn out"
-        ],
-        "Angry": [
-            "angry", "mad", "furious", "upset", "irritated", "annoyed", "frustrated",
-            "hate", "unfair", "ridiculous", "blame", "fault", "stupid", "idiot", 
-            "terrible", "worst", "ruined", "horrible", "hell", "damn", "fed up",
-            "sick of", "tired of", "had enough"
-        ],
-        "Anxious": [
-            "anxious", "nervous", "worried", "stress", "pressure", "overwhelmed",
-            "afraid", "fear", "panic", "uncertain", "doubt", "risk", "concern",
-            "interview", "test", "exam", "deadline", "meeting", "presentation",
-            "want to go home", "need to leave", "can't stay", "have to go"
-        ],
-        "Tired": [
-            "tired", "exhausted", "sleepy", "fatigue", "drained", "no energy",
-            "worn out", "need sleep", "need rest", "need a break", "can't keep going",
-            "so tired", "want to sleep", "want to rest", "want to go home", "need to lie down",
-            "long day", "hard day", "ready for bed", "eyes heavy"
-        ],
-        "Hungry": [
-            "hungry", "starving", "need food", "want to eat", "need to eat", "food",
-            "haven't eaten", "stomach growling", "stomach rumbling", "need a meal", 
-            "want a snack", "dinner", "lunch", "breakfast", "craving", "appetite"
-        ],
-        "Fearful": [
-            "scared", "terrified", "horrified", "danger", "threat", "attack",
-            "nightmare", "monster", "dark", "alone", "unknown", "help", "run", "hide",
-            "scream", "horror", "killer", "death", "dying", "terror", "emergency"
-        ],
-        "Excited": [
-            "excited", "thrilled", "eager", "looking forward", "cant wait", "anticipate",
-            "adventure", "fun", "party", "vacation", "holiday", "weekend", "opportunity",
-            "chance", "new", "start", "beginning", "future", "potential", "possibility"
-        ],
-        "Surprised": [
-            "surprised", "shocked", "unexpected", "wow", "whoa", "amazing", "unbelievable",
-            "incredible", "what", "how", "suddenly", "no way", "impossible", "cant believe",
-            "believe it", "really", "serious", "never thought", "never expected"
-        ],
-        "Disgusted": [
-            "disgusting", "gross", "sick", "nasty", "eww", "vomit", "rotten", "filthy",
-            "dirty", "ugly", "horrible", "worst", "unacceptable", "terrible", "creepy"
-        ],
-        "Confused": [
-            "confused", "unsure", "dont understand", "lost", "complicated", "complex",
-            "what do you mean", "unclear", "not sure", "dont get it", "strange",
-            "weird", "bizarre", "odd", "wonder", "question", "how", "why", "when",
-            "don't know why", "don't even know"
-        ],
-        "Neutral": [
-            "okay", "fine", "alright", "normal", "regular", "usual", "so-so", "meh"
-        ]
-    }
-    
-    # Check for emotion keywords in the text
-    for emotion, keywords in patterns.items():
-        for keyword in keywords:
-            if keyword in text_lower:
-                scores[emotion] += 1
-    
-    # Handle negations
-    negation_words = ["not", "no", "never", "don't", "doesn't", "didn't", "isn't", "aren't", "wasn't", "weren't"]
-    for negation in negation_words:
-        if negation in text_lower:
-            # Find words after negation
-            negation_idx = text_lower.find(negation)
-            negated_part = text_lower[negation_idx:]
-            
-            # Check if emotions are being negated
-            for emotion, keywords in patterns.items():
-                for keyword in keywords:
-                    if keyword in negated_part:
-                        # Reduce that emotion's score
-                        scores[emotion] -= 1
-                        # Potentially increase opposite emotions
-                        if emotion == "Happy":
-                            scores["Sad"] += 0.5
-                        elif emotion == "Sad":
-                            scores["Happy"] += 0.5
-                        elif emotion == "Tired":
-                            scores["Excited"] += 0.5
-                        elif emotion == "Excited":
-                            scores["Tired"] += 0.5
-
-    # Add special phrase handling
-    phrases = {
-        "want to go home": {"Tired": 2, "Anxious": 1},
-        "need to go home": {"Tired": 2, "Anxious": 1},
-        "long day": {"Tired": 2},
-        "so hungry": {"Hungry": 3},
-        "so tired": {"Tired": 3},
-        "don't know why": {"Confused": 2},
-        "don't even know": {"Confused": 2},
-        "just like really want": {"Anxious": 1.5, "Tired": 1},
-        "been a long day": {"Tired": 2.5},
-        "had a really long day": {"Tired": 3},
-        "feeling happy": {"Happy": 3},
-        "feeling sad": {"Sad": 3},
-        "feeling angry": {"Angry": 3},
-        "feeling tired": {"Tired": 3},
-        "feeling hungry": {"Hungry": 3},
-        "feeling anxious": {"Anxious": 3},
-        "feeling confused": {"Confused": 3},
-        "don't even know why": {"Confused": 3}
-    }
+    return jsonify(infer_emotion(text))
+
+def infer_emotion(text):
+    """Run the inferential classifier and return the map_emotion_to_confidences result."""
+    # Single pass over the text with the precompiled keyword automaton
+    with stage("inferential_classify"):
+        emotion, intensity, scores = score_text(text)
+
+    log_event(logging.DEBUG, "inferential_classification", text=text, emotion=emotion,
+              intensity=intensity, scores=scores)
 
-    for phrase, emotion_scores in phrases.items():
-        if phrase in text_lower:
-            for emotion, score in emotion_scores.items():
-                scores[emotion] += score
-    
-    # Context-based inferences (beyond simple keyword matching)
-    # Life events
-    if any(phrase in text_lower for phrase in ["got a promotion", "graduated", "passed my test", "got the job", "won", "won the"]):
-        scores["Happy"] += 2
-        scores["Excited"] += 1
-        
-    if any(phrase in text_lower for phrase in ["lost my", "broke up", "failed", "missed", "too late", "never get to"]):
-        scores["Sad"] += 2
-        
-    if any(phrase in text_lower for phrase in ["deadline", "running late", "not enough time", "have to finish", "due tomorrow"]):
-        scores["Anxious"] += 2
-        
-    # Physical symptoms
-    if any(phrase in text_lower for phrase in ["cant sleep", "heart racing", "shaking", "trembling", "sweat", "sweating"]):
-        scores["Anxious"] += 2
-        scores["Fearful"] += 1
-        
-    if any(phrase in text_lower for phrase in ["yelled", "screamed", "threw", "broke", "hit", "slammed", "cursed"]):
-        scores["Angry"] += 2
-    
-    # Specific for tiredness and hunger
-    if any(phrase in text_lower for phrase in ["need a nap", "could sleep for days", "barely keeping eyes open", "so sleepy"]):
-        scores["Tired"] += 3
-        
-    if any(phrase in text_lower for phrase in ["stomach growling", "haven't eaten all day", "need to eat soon", "starving"]):
-        scores["Hungry"] += 3
-    
-    # Weather and situational context
-    if any(phrase in text_lower for phrase in ["beautiful day", "sunny", "perfect weather", "lovely outside"]):
-        scores["Happy"] += 1
-        
-    if any(phrase in text_lower for phrase in ["rainy", "dark", "gloomy", "alone in"]):
-        scores["Sad"] += 1
-    
-    # Tone indicators
-    if "!" in text:
-        exclamation_count = text.count("!")
-        if exclamation_count >= 3:
-            scores["Excited"] += 2
-            scores["Happy"] += 1
-            scores["Surprised"] += 1
-        elif exclamation_count >= 1:
-            scores["Excited"] += 1
-            scores["Happy"] += 0.5
-    
-    if "?" in text:
-        question_count = text.count("?")
-        if question_count >= 3:
-            scores["Confused"] += 2
-            scores["Anxious"] += 1
-        elif question_count >= 1:
-            scores["Confused"] += 0.5
-    
-    # Intensity markers
-    intensifiers = ["very", "really", "extremely", "so", "totally", "absolutely", "completely", "utterly", "super"]
-    intensity_boost = 0
-    for intensifier in intensifiers:
-        if intensifier in text_lower:
-            intensity_boost += 0.2
-    
-    # Apply intensity boost to the highest emotions
-    if intensity_boost > 0:
-        top_emotions = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:2]
-        for emotion, _ in top_emotions:
-            scores[emotion] += intensity_boost
-    
-    # If no strong emotion detected, strengthen neutral
-    if max(scores.values()) < 1:
-        scores["Neutral"] = 2
-    
-    # Find the predominant emotion
-    emotion = max(scores, key=scores.get)
-    
-    # Set intensity based on the emotion and score
-    base_intensities = {
-        "Happy": 60, "Excited": 70, "Surprised": 40,  # Positive emotions
-        "Neutral": 0,  # Neutral
-        "Sad": -60, "Angry": -70, "Anxious": -40, "Tired": -30, "Hungry": -20,
-        "Fearful": -50, "Disgusted": -60, "Confused": -20  # Negative emotions
-    }
-    
-    # Adjust intensity based on score strength
-    score_factor = min(2.0, scores[emotion]) / 2.0  # Cap at 2.0 to avoid extremes
-    intensity = int(base_intensities[emotion] * score_factor * 1.2)  # Scale up slightly
-    
-    # Ensure intensity is within bounds
-    intensity = max(-100, min(100, intensity))
-    
-    print(f"Inferential detection: {emotion}, intensity: {intensity}")
-    print(f"Emotion scores: {scores}")
-    
     # Map emotion to confidences and return
-    return jsonify(map_emotion_to_confidences(emotion, intensity))
+    result = map_emotion_to_confidences(emotion, intensity)
+    result["source"] = "local"
+    return result
+
+# Uploaded audio is written here while it is classified
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(10 * 1024 * 1024)))
+AUDIO_TIMEOUT = float(os.getenv("AUDIO_TIMEOUT", "30"))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+def new_upload_file(filename):
+    """An open temp file in UPLOAD_DIR, named <uuid>_..._<filename>, that is
+    deleted when it is closed."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    return tempfile.NamedTemporaryFile(
+        "w+b", dir=UPLOAD_DIR, prefix=f"{uuid.uuid4().hex}_",
+        suffix=f"_{secure_filename(filename or '') or 'recording'}")
+
+class UploadRequest(Request):
+    """Writes multipart file parts straight to UPLOAD_DIR as they stream in,
+    instead of spooling them in memory and copying them out afterwards.
+    Flask closes, and so deletes, them when the request ends."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return new_upload_file(filename)
+
+app.request_class = UploadRequest
+
+@app.route("/classify_audio", methods=["POST"])
+def classify_audio():
+    """Classify speech emotion from an uploaded recording ("audio" form field,
+    or a raw audio/* body) with the trained MLP. Costs no API tokens."""
+    # Oversized uploads are refused before any of the body is read, and a
+    # body without a Content-Length is cut off once it passes the limit
+    if request.content_length and request.content_length > AUDIO_MAX_BYTES:
+        return jsonify({"error": "Audio file too large"}), 413
+    request.max_content_length = AUDIO_MAX_BYTES
+    try:
+        if request.mimetype.startswith("audio/"):
+            # A raw audio body, streamed to disk in chunks
+            file = new_upload_file("recording")
+            try:
+                shutil.copyfileobj(request.stream, file, UPLOAD_CHUNK_BYTES)
+            except BaseException:
+                file.close()
+                raise
+        else:
+            upload = request.files.get("audio")
+            if upload is None or not upload.filename:
+                return jsonify({"error": "No audio file uploaded"}), 400
+            file = upload.stream
+    except RequestEntityTooLarge:
+        return jsonify({"error": "Audio file too large"}), 413
+    file.flush()
+    path = file.name
+    start = time.perf_counter()
+    try:
+        result = audio_emotion.submit(path).result(timeout=AUDIO_TIMEOUT)
+    except audio_emotion.AudioDecodeError as e:
+        log_event(logging.WARNING, "audio_undecodable", error=str(e))
+        return jsonify({"error": "Could not decode audio"}), 400
+    except FutureTimeout:
+        log_event(logging.WARNING, "audio_timeout")
+        return jsonify({"error": "Audio classification timed out"}), 504
+    except BrokenProcessPool as e:
+        log_event(logging.ERROR, "audio_pool_failed", error=str(e))
+        audio_emotion.reset_pool()
+        return jsonify({"error": "Audio classification failed"}), 500
+    except Exception as e:
+        log_event(logging.ERROR, "audio_failed", error=f"{type(e).__name__}: {e}")
+        return jsonify({"error": "Audio classification failed"}), 500
+    finally:
+        file.close()
+
+    result["source"] = "model"
+    if result["speech"]:
+        count("ora_classifications_total", "model")
+    log_event(logging.INFO, "audio_classified", sampled=True, emotion=result["emotion"],
+              trimmed=result["trimmed"], ms=round((time.perf_counter() - start) * 1000, 1))
+    return jsonify(result)
 
 @app.route("/respond", methods=["POST"])
 def respond():
-    data = request.get_json()
+    with stage("request_parse"):
+        data = request.get_json()
     emotion = data.get("emotion", "Neutral")
     text    = data.get("text", "")
+    messages = respond_messages(emotion, text)
+    if not admit_llm_call("respond", messages, 60):
+        reply = fallback_reply(emotion)
+    else:
+        try:
+            with stage("llm_call"):
+                reply = get_client().chat_completion(
+                    model=CHAT_MODEL,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=60
+                )
+        except Exception as e:
+            log_event(logging.WARNING, "openai_error", endpoint="respond", error=f"{type(e).__name__}: {e}")
+            reply = fallback_reply(emotion)
+
+    chat_id = start_conversation(reply)
+    return jsonify({"message": reply, "chat_id": chat_id})
+
+def respond_messages(emotion, text):
     prompt = (
       f"You are a compassionate assistant. The user is feeling {emotion}. "
       f"They said: \"{text}\". Reply in one or two sentences showing empathy."
     )
-    try:
-        # Try to use the new OpenAI client API format first
-        try:
-            client = openai.OpenAI(api_key=openai.api_key)
-            resp = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=60
-            )
-            reply = resp.choices[0].message.content.strip()
-        except AttributeError:
-            # Fall back to the old API format if necessary
-            resp = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=60
-            )
-            reply = resp.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error in respond endpoint: {e}")
-        reply = f"I understand you're feeling {emotion.lower()}. How can I help you today?"
+    return [{"role": "user", "content": prompt}]
 
-    # Start a new chat session
-    chat_id = uuid.uuid4().hex
-    conversations[chat_id] = [
+def fallback_reply(emotion):
+    return f"I understand you're feeling {emotion.lower()}. How can I help you today?"
+
+def start_conversation(reply):
+    """Start a new chat session seeded with `reply` and return its id."""
+    return conversations.create([
       {"role": "system", "content": "You are a compassionate assistant."},
       {"role": "assistant", "content": reply}
-    ]
-    return jsonify({"message": reply, "chat_id": chat_id})
+    ])
 
 @app.route("/chat", methods=["POST"])
 def chat():
-    data = request.get_json()
+    with stage("request_parse"):
+        data = request.get_json()
     chat_id = data.get("chat_id")
     user_msg = data.get("message", "").strip()
-    if not chat_id or chat_id not in conversations:
+    history = conversations.get(chat_id) if chat_id else None
+    if history is None:
         return jsonify({"error": "Invalid chat_id"}), 400
 
-    conversations[chat_id].append({"role": "user", "content": user_msg})
-    try:
-        # Try to use the new OpenAI client API format first
+    user_entry = {"role": "user", "content": user_msg}
+    messages = history + [user_entry]
+    if not admit_llm_call("chat", messages, 60):
+        assistant_msg = CHAT_FALLBACK_REPLY
+    else:
         try:
-            client = openai.OpenAI(api_key=openai.api_key)
-            resp = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=conversations[chat_id] + [{"role": "user", "content": user_msg}],
-                temperature=0.7,
-                max_tokens=60
-            )
-            assistant_msg = resp.choices[0].message.content.strip()
-        except AttributeError:
-            # Fall back to the old API format if necessary
-            resp = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=conversations[chat_id] + [{"role": "user", "content": user_msg}],
-                temperature=0.7,
-                max_tokens=60
-            )
-            assistant_msg = resp.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error in chat endpoint: {e}")
-        assistant_msg = "I'm having trouble connecting right now. Can we try again in a moment?"
+            with stage("llm_call"):
+                assistant_msg = get_client().chat_completion(
+                    model=CHAT_MODEL,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=60
+                )
+        except Exception as e:
+            log_event(logging.WARNING, "openai_error", endpoint="chat", error=f"{type(e).__name__}: {e}")
+            assistant_msg = CHAT_FALLBACK_REPLY
     
-    conversations[chat_id].append({"role": "assistant", "content": assistant_msg})
+    conversations.append(chat_id, [user_entry, {"role": "assistant", "content": assistant_msg}])
     return jsonify({"reply": assistant_msg})
 
+def sse_event(data, event=None):
+    """Format one server-sent event carrying `data` as JSON."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return Response(events, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # don't let a proxy buffer the stream
+    })
+
+def stream_reply(messages, fallback, endpoint):
+    """Yield token events for a streamed completion and return the full reply.
+
+    If the upstream call fails before any token arrives, `fallback` is sent
+    as the only token. If it fails mid-stream an error event is sent and
+    None is returned, so the caller does not commit a partial reply. A call
+    shed by admission control also gets `fallback`.
+    """
+    if not admit_llm_call(endpoint, messages, 60):
+        yield sse_event({"token": fallback})
+        return fallback
+    parts = []
+    try:
+        for token in get_client().stream_chat_completion(
+            model=CHAT_MODEL,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=60
+        ):
+            parts.append(token)
+            yield sse_event({"token": token})
+    except Exception as e:
+        log_event(logging.WARNING, "openai_error", endpoint=f"{endpoint}_stream", error=f"{type(e).__name__}: {e}")
+        if parts:
+            yield sse_event({"error": "Stream interrupted"}, event="error")
+            return None
+        parts = [fallback]
+        yield sse_event({"token": fallback})
+    return "".join(parts).strip()
+
+@app.route("/respond_stream", methods=["POST"])
+def respond_stream():
+    """Streaming /respond: tokens as server-sent events, then a "done" event
+    with the full message and the new chat_id."""
+    with stage("request_parse"):
+        data = request.get_json()
+    emotion = data.get("emotion", "Neutral")
+    text    = data.get("text", "")
+    messages = respond_messages(emotion, text)
+
+    def generate():
+        reply = yield from stream_reply(messages, fallback_reply(emotion), "respond")
+        if reply is None:
+            return
+        chat_id = start_conversation(reply)
+        yield sse_event({"message": reply, "chat_id": chat_id}, event="done")
+
+    return sse_response(generate())
+
+@app.route("/chat_stream", methods=["POST"])
+def chat_stream():
+    """Streaming /chat. The exchange is only added to the conversation once
+    the stream has finished."""
+    with stage("request_parse"):
+        data = request.get_json()
+    chat_id = data.get("chat_id")
+    user_msg = data.get("message", "").strip()
+    history = conversations.get(chat_id) if chat_id else None
+    if history is None:
+        return jsonify({"error": "Invalid chat_id"}), 400
+
+    user_entry = {"role": "user", "content": user_msg}
+    messages = history + [user_entry]
+
+    def generate():
+        reply = yield from stream_reply(messages, CHAT_FALLBACK_REPLY, "chat")
+        if reply is None:
+            return
+        conversations.append(chat_id, [user_entry, {"role": "assistant", "content": reply}])
+        yield sse_event({"reply": reply}, event="done")
+
+    return sse_response(generate())
+
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify(classify_cache.stats())
+
+@app.route("/cache/similar/stats")
+def similar_cache_stats():
+    return jsonify(similar_classifications.stats())
+
+@app.route("/admission/stats")
+def admission_stats():
+    """Admission counters for this worker and the host-wide budget left."""
+    return jsonify(llm_admission.stats())
+
+@app.route("/classify/stats")
+def classify_stats():
+    """Upstream batching and coalescing counters for this worker process."""
+    return jsonify({
+        "microbatch": classify_batcher.stats() if classify_batcher else None,
+        "singleflight": classify_flights.stats(),
+    })
+
+@app.route("/conversations/stats")
+def conversation_stats():
+    return jsonify(conversations.stats())
+
 @app.route('/ping')
 def ping():
     return 'pong'
 
+@app.route("/health")
+def health():
+    """Liveness plus the state of this worker's OpenAI circuit breaker.
+
+    Still 200 when the circuit is open: the app keeps answering locally.
+    """
+    breaker = get_breaker().stats()
+    return jsonify({"status": "ok" if breaker["state"] == "closed" else "degraded", "openai_circuit": breaker})
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=True)  # Changed port to 5000 to match your browser URL
\ No newline at end of file
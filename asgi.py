@@ -0,0 +1,623 @@
+"""
+ASGI serving mode.
+
+The LLM-bound endpoints (/classify, /respond, /chat) run as coroutines on an
+event loop, so a single worker process can hold hundreds of conversations
+waiting on OpenAI instead of one per sync worker. Every other route is
+served by the Flask app from app.py on a worker thread.
+
+    uvicorn asgi:app --workers 2
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+
+Upstream concurrency per process is capped by OPENAI_MAX_CONCURRENCY. Each
+LLM request, streamed ones included, has a deadline of REQUEST_DEADLINE
+seconds, after which it falls back to the same local answers the sync
+endpoints use. If the browser disconnects, the in-flight upstream call is
+cancelled. /respond_stream and /chat_stream stream tokens as server-sent
+events, like their Flask versions.
+
+The shared stores (classification cache and leases, similarity index,
+conversations) are SQLite and may wait on another worker's write lock, so
+every call into them goes through asyncio.to_thread and never blocks the
+event loop.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import app as flask_app
+from admission import AdmissionController, estimate_tokens
+from llm_client import close_async_client, get_async_client, get_breaker
+from micro_batcher import AsyncMicroBatcher
+from single_flight import AsyncSingleFlight
+from telemetry import count, log_event, record_request, stage, start_request_sampling
+
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "10"))
+MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", str(1024 * 1024)))
+SPOOL_BYTES = 1024 * 1024  # larger upload bodies go to disk on their way to Flask
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# Shares the host-wide budgets of app.llm_admission; waiting is on the loop
+llm_admission = AdmissionController(
+    flask_app.llm_admission.limiter,
+    max_queue=flask_app.llm_admission.max_queue,
+    max_wait=flask_app.llm_admission.max_wait,
+)
+
+
+async def admit_llm_call(path, messages, max_tokens, items=1):
+    """Async counterpart of app.admit_llm_call."""
+    if not await llm_admission.admit_async(estimate_tokens(messages, max_tokens)):
+        count("ora_degraded_total", path, "shed", amount=items)
+        return False
+    if not get_breaker().allow():
+        count("ora_degraded_total", path, "circuit_open", amount=items)
+        return False
+    return True
+
+
+# Hedged LLM classifications in flight; referenced here so ones that miss
+# the latency budget are not garbage collected before they warm the cache.
+# At most HEDGE_MAX_INFLIGHT at a time, as in the sync mode.
+_late_classifications = set()
+_hedge_slots = asyncio.Semaphore(flask_app.HEDGE_MAX_INFLIGHT)
+
+
+async def classify(data):
+    text = data.get("text", "").strip()
+    if not text:
+        raise HTTPError(400, "No text to classify")
+
+    log_event(logging.DEBUG, "classify_text", text=text)
+    start = time.perf_counter()
+
+    if not flask_app.OPENAI_API_KEY:
+        result = flask_app.infer_emotion(text)
+    elif flask_app.CLASSIFY_LATENCY_BUDGET > 0:
+        result = await hedged_classify(text)
+    else:
+        result = await llm_classify(text) or flask_app.infer_emotion(text)
+    flask_app.log_classification(result, start)
+    return result
+
+
+async def llm_classify(text):
+    """Async counterpart of app.llm_classify."""
+    cached = await asyncio.to_thread(flask_app.cached_classification, text)
+    if cached is not None:
+        return cached
+    return await classify_flights.do(flask_app.classify_cache.key(text),
+                                     lambda: shared_request_classification(text))
+
+
+async def shared_request_classification(text):
+    """Async counterpart of app.shared_request_classification."""
+    cache = flask_app.classify_cache
+    if await asyncio.to_thread(cache.acquire_lease, text, flask_app.SINGLEFLIGHT_LEASE):
+        try:
+            return await request_classification(text)
+        finally:
+            await asyncio.to_thread(cache.release_lease, text)
+
+    classify_flights.count("remote_waits")
+    deadline = time.monotonic() + flask_app.SINGLEFLIGHT_LEASE
+    while time.monotonic() < deadline:
+        await asyncio.sleep(flask_app.SINGLEFLIGHT_POLL)
+        result, waiting = await asyncio.to_thread(flask_app.poll_shared_classification, text)
+        if result is not None:
+            classify_flights.count("remote_hits")
+            return result
+        if not waiting:
+            break
+    return await request_classification(text)
+
+
+async def request_classification(text):
+    """Async counterpart of app.request_classification."""
+    if classify_batcher is not None:
+        try:
+            raw = await asyncio.wait_for(classify_batcher.submit(text), REQUEST_DEADLINE)
+        except asyncio.TimeoutError:
+            log_event(logging.WARNING, "openai_error", error="batched request timed out")
+            return None
+        return None if raw is None else await asyncio.to_thread(flask_app.handle_classification, text, raw)
+
+    messages = flask_app.classify_messages(text)
+    if not await admit_llm_call("classify", messages, 50):
+        return None
+    try:
+        with stage("llm_call"):
+            raw = await asyncio.wait_for(get_async_client().chat_completion(
+                model=flask_app.CLASSIFY_MODEL,
+                messages=messages,
+                temperature=0.0,
+                max_tokens=50
+            ), REQUEST_DEADLINE)
+    except Exception as e:
+        log_event(logging.WARNING, "openai_error", error=f"{type(e).__name__}: {e}")
+        return None
+    return await asyncio.to_thread(flask_app.handle_classification, text, raw)
+
+
+async def request_classifications(texts):
+    """AsyncMicroBatcher handler: classify `texts` with a single GPT call."""
+    call = flask_app.classify_batch_request(texts)
+    if not await admit_llm_call("classify", call["messages"], call["max_tokens"], items=len(texts)):
+        return [None] * len(texts)
+    with stage("llm_call"):
+        raw = await asyncio.wait_for(get_async_client().chat_completion(
+            model=flask_app.CLASSIFY_MODEL,
+            temperature=0.0,
+            **call
+        ), REQUEST_DEADLINE)
+    return flask_app.split_batch_classification(raw, len(texts))
+
+
+classify_batcher = AsyncMicroBatcher(
+    request_classifications,
+    max_batch=flask_app.CLASSIFY_MICROBATCH_SIZE,
+    window=flask_app.CLASSIFY_MICROBATCH_WINDOW,
+    name="classify-batch",
+) if flask_app.CLASSIFY_MICROBATCH_WINDOW > 0 else None
+
+classify_flights = AsyncSingleFlight()
+
+
+async def hedged_classify(text):
+    """Async counterpart of app.hedged_classify.
+
+    The LLM call is shielded from the budget timeout (and from client
+    disconnects), so a late answer still warms the cache. When all hedge
+    slots are busy the local classifier answers alone.
+    """
+    local = flask_app.infer_emotion(text)
+    if _hedge_slots.locked():
+        log_event(logging.WARNING, "hedge_slots_exhausted")
+        return local
+    await _hedge_slots.acquire()  # a slot is free, so this does not wait
+    task = asyncio.ensure_future(llm_classify(text))
+    _late_classifications.add(task)
+    task.add_done_callback(_late_classifications.discard)
+    task.add_done_callback(lambda _: _hedge_slots.release())
+    try:
+        result = await asyncio.wait_for(asyncio.shield(task), flask_app.CLASSIFY_LATENCY_BUDGET)
+    except asyncio.TimeoutError:
+        log_event(logging.INFO, "latency_budget_missed", sampled=True)
+        return local
+    return result or local
+
+
+async def respond(data):
+    emotion = data.get("emotion", "Neutral")
+    text = data.get("text", "")
+    messages = flask_app.respond_messages(emotion, text)
+    if not await admit_llm_call("respond", messages, 60):
+        reply = flask_app.fallback_reply(emotion)
+    else:
+        try:
+            with stage("llm_call"):
+                reply = await asyncio.wait_for(get_async_client().chat_completion(
+                    model=flask_app.CHAT_MODEL,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=60
+                ), REQUEST_DEADLINE)
+        except Exception as e:
+            log_event(logging.WARNING, "openai_error", endpoint="respond", error=f"{type(e).__name__}: {e}")
+            reply = flask_app.fallback_reply(emotion)
+
+    chat_id = await asyncio.to_thread(flask_app.start_conversation, reply)
+    return {"message": reply, "chat_id": chat_id}
+
+
+async def chat(data):
+    chat_id = data.get("chat_id")
+    user_msg = data.get("message", "").strip()
+    history = await asyncio.to_thread(flask_app.conversations.get, chat_id) if chat_id else None
+    if history is None:
+        raise HTTPError(400, "Invalid chat_id")
+
+    user_entry = {"role": "user", "content": user_msg}
+    messages = history + [user_entry]
+    if not await admit_llm_call("chat", messages, 60):
+        assistant_msg = flask_app.CHAT_FALLBACK_REPLY
+    else:
+        try:
+            with stage("llm_call"):
+                assistant_msg = await asyncio.wait_for(get_async_client().chat_completion(
+                    model=flask_app.CHAT_MODEL,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=60
+                ), REQUEST_DEADLINE)
+        except Exception as e:
+            log_event(logging.WARNING, "openai_error", endpoint="chat", error=f"{type(e).__name__}: {e}")
+            assistant_msg = flask_app.CHAT_FALLBACK_REPLY
+
+    await asyncio.to_thread(flask_app.conversations.append, chat_id,
+                            [user_entry, {"role": "assistant", "content": assistant_msg}])
+    return {"reply": assistant_msg}
+
+
+class StreamInterrupted(Exception):
+    """The upstream stream failed after tokens were already sent."""
+
+
+async def stream_reply(messages, fallback, parts, endpoint):
+    """Async counterpart of app.stream_reply.
+
+    Yields token events and collects the reply in `parts`. Raises
+    StreamInterrupted, after sending an error event, if the upstream stream
+    breaks mid-way or runs past REQUEST_DEADLINE. A call shed by admission
+    control gets `fallback`.
+    """
+    if not await admit_llm_call(endpoint, messages, 60):
+        parts.append(fallback)
+        yield flask_app.sse_event({"token": fallback})
+        return
+    stream = get_async_client().stream_chat_completion(
+        model=flask_app.CHAT_MODEL,
+        messages=messages,
+        temperature=0.7,
+        max_tokens=60
+    )
+    deadline = time.monotonic() + REQUEST_DEADLINE
+    try:
+        while True:
+            try:
+                token = await asyncio.wait_for(stream.__anext__(), max(0, deadline - time.monotonic()))
+            except StopAsyncIteration:
+                break
+            parts.append(token)
+            yield flask_app.sse_event({"token": token})
+    except Exception as e:
+        log_event(logging.WARNING, "openai_error", endpoint=f"{endpoint}_stream", error=f"{type(e).__name__}: {e}")
+        if parts:
+            yield flask_app.sse_event({"error": "Stream interrupted"}, event="error")
+            raise StreamInterrupted()
+        parts.append(fallback)
+        yield flask_app.sse_event({"token": fallback})
+    finally:
+        await stream.aclose()
+
+
+async def respond_stream(data):
+    emotion = data.get("emotion", "Neutral")
+    text = data.get("text", "")
+    messages = flask_app.respond_messages(emotion, text)
+
+    async def events():
+        parts = []
+        async for event in stream_reply(messages, flask_app.fallback_reply(emotion), parts, "respond"):
+            yield event
+        reply = "".join(parts).strip()
+        chat_id = await asyncio.to_thread(flask_app.start_conversation, reply)
+        yield flask_app.sse_event({"message": reply, "chat_id": chat_id}, event="done")
+
+    return events()
+
+
+async def chat_stream(data):
+    chat_id = data.get("chat_id")
+    user_msg = data.get("message", "").strip()
+    history = await asyncio.to_thread(flask_app.conversations.get, chat_id) if chat_id else None
+    if history is None:
+        raise HTTPError(400, "Invalid chat_id")
+
+    user_entry = {"role": "user", "content": user_msg}
+    messages = history + [user_entry]
+
+    async def events():
+        parts = []
+        async for event in stream_reply(messages, flask_app.CHAT_FALLBACK_REPLY, parts, "chat"):
+            yield event
+        reply = "".join(parts).strip()
+        await asyncio.to_thread(flask_app.conversations.append, chat_id,
+                                [user_entry, {"role": "assistant", "content": reply}])
+        yield flask_app.sse_event({"reply": reply}, event="done")
+
+    return events()
+
+
+ASYNC_ROUTES = {
+    "/classify": classify,
+    "/respond": respond,
+    "/chat": chat,
+}
+
+STREAM_ROUTES = {
+    "/respond_stream": respond_stream,
+    "/chat_stream": chat_stream,
+}
+
+
+async def read_body(receive, limit=MAX_BODY_BYTES):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            raise HTTPError(413, "Request body too large")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def declared_length(scope):
+    """The request's Content-Length, or 0 if it has none."""
+    for name, value in scope.get("headers", []):
+        if name == b"content-length" and value.isdigit():
+            return int(value)
+    return 0
+
+
+async def spool_body(receive, limit):
+    """Read the request body into a temp file that stays in memory up to
+    SPOOL_BYTES, instead of joining it into one bytes object."""
+    body, size = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES), 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            body.close()
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            body.close()
+            raise HTTPError(413, "Request body too large")
+        body.write(chunk)
+        if not message.get("more_body"):
+            body.seek(0)
+            return body
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def send_response(send, status, headers, body):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    await send_response(send, status, [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"access-control-allow-origin", b"*"),
+    ], body)
+
+
+async def read_json(receive):
+    """Read the request body as a JSON object, or None if the client left."""
+    body = await read_body(receive)
+    if body is None:
+        return None
+    try:
+        with stage("request_parse"):
+            data = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Invalid JSON body")
+    if not isinstance(data, dict):
+        raise HTTPError(400, "Invalid JSON body")
+    return data
+
+
+async def run_until_disconnect(coro, receive):
+    """Run `coro` until it finishes or the client goes away.
+
+    On disconnect the task is cancelled, which aborts any upstream call, and
+    (False, None) is returned; otherwise (True, result).
+    """
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(wait_for_disconnect(receive))
+    done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    if task not in done:
+        task.cancel()
+        log_event(logging.INFO, "client_disconnected", sampled=True)
+        await asyncio.gather(task, return_exceptions=True)
+        return False, None
+    watcher.cancel()
+    return True, task.result()
+
+
+async def handle_recorded(handle, handler, path, receive, send):
+    """Run a native route through `handle`, recording its latency and status
+    the way app.py's after_request hook does for Flask routes."""
+    start = time.perf_counter()
+    start_request_sampling()
+    status = 499  # the client left before a response was started
+
+    async def recording_send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        await send(message)
+
+    try:
+        await handle(handler, receive, recording_send)
+    finally:
+        record_request(path.strip("/"), status, time.perf_counter() - start)
+
+
+async def send_internal_error(send, error):
+    """Log an unexpected exception and answer with the JSON error shape the
+    Flask routes use."""
+    log_event(logging.ERROR, "request_failed", error=f"{type(error).__name__}: {error}")
+    await send_json(send, 500, {"error": "Internal server error"})
+
+
+async def handle_async_route(handler, receive, send):
+    try:
+        data = await read_json(receive)
+        if data is None:
+            return
+        finished, result = await run_until_disconnect(handler(data), receive)
+        if not finished:
+            return
+    except HTTPError as e:
+        await send_json(send, e.status, {"error": e.message})
+        return
+    except Exception as e:
+        await send_internal_error(send, e)
+        return
+    await send_json(send, 200, result)
+
+
+async def handle_stream_route(handler, receive, send):
+    try:
+        data = await read_json(receive)
+        if data is None:
+            return
+        events = await handler(data)
+    except HTTPError as e:
+        await send_json(send, e.status, {"error": e.message})
+        return
+    except Exception as e:
+        await send_internal_error(send, e)
+        return
+
+    async def pump():
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            (b"access-control-allow-origin", b"*"),
+        ]})
+        try:
+            async for event in events:
+                await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+        except StreamInterrupted:
+            pass
+        except Exception as e:
+            # Headers are sent: report it in the stream instead
+            log_event(logging.ERROR, "request_failed", error=f"{type(e).__name__}: {e}")
+            error = flask_app.sse_event({"error": "Internal server error"}, event="error")
+            await send({"type": "http.response.body", "body": error.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    await run_until_disconnect(pump(), receive)
+
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body) if isinstance(body, bytes) else body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[key] = value
+        else:
+            key = f"HTTP_{key}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(environ):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    result = flask_app.app.wsgi_app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], body
+
+
+async def handle_wsgi_route(scope, receive, send):
+    try:
+        if scope["path"] == "/classify_audio":
+            if declared_length(scope) > flask_app.AUDIO_MAX_BYTES:
+                raise HTTPError(413, "Request body too large")
+            body = await spool_body(receive, flask_app.AUDIO_MAX_BYTES)
+        else:
+            body = await read_body(receive)
+    except HTTPError as e:
+        await send_json(send, e.status, {"error": e.message})
+        return
+    if body is None:
+        return
+    try:
+        status, headers, payload = await asyncio.to_thread(call_wsgi, wsgi_environ(scope, body))
+    finally:
+        if not isinstance(body, bytes):
+            body.close()
+    await send_response(send, status, headers, payload)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Build the client (and its SSL context) before the first request
+            get_async_client()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"], scope["method"]
+    if method == "GET" and path == "/classify/stats":
+        # This event loop's counters, not those of the unused Flask objects
+        await send_json(send, 200, {
+            "microbatch": classify_batcher.stats() if classify_batcher else None,
+            "singleflight": classify_flights.stats(),
+        })
+    elif method == "GET" and path == "/admission/stats":
+        await send_json(send, 200, llm_admission.stats())
+    elif method == "POST" and path in ASYNC_ROUTES:
+        await handle_recorded(handle_async_route, ASYNC_ROUTES[path], path, receive, send)
+    elif method == "POST" and path in STREAM_ROUTES:
+        await handle_recorded(handle_stream_route, STREAM_ROUTES[path], path, receive, send)
+    else:
+        await handle_wsgi_route(scope, receive, send)
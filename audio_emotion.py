@@ -0,0 +1,288 @@
+"""
+Speech emotion from uploaded audio, using the MLP trained by train_model.py.
+
+Decoding and feature extraction (librosa) are CPU-bound, so they run
+in a small process pool rather than on request threads. Each pool process
+loads the model once, when it starts: the memory-mapped compact model if it
+exists, else the pickled model and label encoder. The pool is created
+lazily in each server worker and uses the "spawn" start method, so it never
+inherits a threaded parent's state. Audio in formats other than plain WAV
+(e.g. the browser's WebM recordings) needs ffmpeg installed.
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from telemetry import log_event, stage
+
+MODEL_PATH = os.getenv("AUDIO_MODEL_PATH", "trained_emotion_model.pkl")
+ENCODER_PATH = os.getenv("AUDIO_ENCODER_PATH", "label_encoder.pkl")
+COMPACT_MODEL_PATH = os.getenv("AUDIO_COMPACT_MODEL_PATH", "emotion_model.npz")
+AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", "2"))
+# Drop silent frames before extraction, and skip inference on silent clips
+AUDIO_VAD = os.getenv("AUDIO_VAD", "1") != "0"
+
+
+class AudioDecodeError(Exception):
+    """The upload could not be decoded as audio."""
+
+
+_model = None
+_labels = None
+
+
+def load_model():
+    """Load the model and labels into this process, once.
+
+    The compact model (see compact_model.py) is used when it exists: it is
+    memory-mapped, so every process shares its weights, and needs no sklearn.
+    """
+    global _model, _labels
+    if _model is None and os.path.exists(COMPACT_MODEL_PATH):
+        from compact_model import CompactMLP
+
+        _model = CompactMLP(COMPACT_MODEL_PATH)
+        _labels = _model.labels
+        log_event(logging.INFO, "audio_model_loaded", format="compact", pid=os.getpid())
+        if not _model.scaled:
+            log_event(logging.WARNING, "audio_model_unscaled", path=COMPACT_MODEL_PATH,
+                      detail="Retrain with `python train_model.py train --force` to save the scaler")
+    if _model is None:
+        with open(MODEL_PATH, "rb") as f:
+            model = pickle.load(f)
+        with open(ENCODER_PATH, "rb") as f:
+            encoder = pickle.load(f)
+        # The model predicts encoded class indices; report the encoder's names
+        _labels = [str(label) for label in encoder.inverse_transform(model.classes_)]
+        _model = model
+        log_event(logging.INFO, "audio_model_loaded", format="pickle", pid=os.getpid())
+        if not hasattr(model, "steps"):
+            # train_model saves Pipeline(scaler, mlp); a bare MLP sees unscaled features
+            log_event(logging.WARNING, "audio_model_unscaled", path=MODEL_PATH,
+                      detail="Retrain with `python train_model.py train --force` to save the scaler")
+    return _model, _labels
+
+
+def init_worker():
+    """Pool initializer: load the model and run one extraction on a short
+    tone, so librosa's JIT compilation is not paid by the first request."""
+    from audio_features import extract_feature
+
+    load_model()
+    tone = 0.1 * np.sin(2 * np.pi * 440 * np.arange(16000, dtype=np.float32) / 16000)
+    extract_feature(tone, 16000)
+
+
+def pcm_to_mono(pcm, channels, scale, offset=0.0, out=None):
+    """Mix interleaved PCM samples down to mono float32, (pcm - offset) * scale,
+    in one pass into `out` (allocated if not given)."""
+    frames = pcm.reshape(-1, channels)
+    if out is None:
+        out = np.empty(len(frames), dtype=np.float32)
+    np.subtract(frames[:, 0], offset, out=out, casting="unsafe")
+    for channel in range(1, channels):
+        out += frames[:, channel]
+    if channels > 1:
+        out -= offset * (channels - 1)
+    out *= np.float32(scale / channels)
+    return out
+
+
+# WAVE format tags: integer PCM, IEEE float, and the "extensible" wrapper
+WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_EXTENSIBLE = 0x0001, 0x0003, 0xFFFE
+
+
+def read_wav(path):
+    """Mono float32 samples and sample rate of a PCM or float WAV file, or
+    None if the file is not one this reader handles.
+
+    The sample data is memory-mapped and converted straight into the output
+    array, so it is copied once, however many channels it has.
+    """
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = chunk[:4], int.from_bytes(chunk[4:], "little")
+            if chunk_id == b"fmt ":
+                fmt = f.read(size)
+                if len(fmt) < 16:
+                    return None
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(size, 1)
+            if size % 2:
+                f.seek(1, 1)
+        file_size = os.fstat(f.fileno()).st_size
+
+    if fmt is None:
+        return None
+    tag, channels, sample_rate = (int.from_bytes(fmt[0:2], "little"), int.from_bytes(fmt[2:4], "little"),
+                                  int.from_bytes(fmt[4:8], "little"))
+    bits = int.from_bytes(fmt[14:16], "little")
+    if tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        tag = int.from_bytes(fmt[24:26], "little")  # first bytes of the subformat GUID
+    dtype = {(WAVE_FORMAT_PCM, 8): np.uint8, (WAVE_FORMAT_PCM, 16): np.int16, (WAVE_FORMAT_PCM, 32): np.int32,
+             (WAVE_FORMAT_IEEE_FLOAT, 32): np.float32, (WAVE_FORMAT_IEEE_FLOAT, 64): np.float64}.get((tag, bits))
+    if dtype is None or channels < 1 or sample_rate < 1:
+        return None  # e.g. 24-bit PCM: left to pydub
+
+    # Streaming recorders may leave the data size unset; trust the file size
+    frame_bytes = channels * np.dtype(dtype).itemsize
+    n_frames = min(size, file_size - offset) // frame_bytes
+    if n_frames == 0:
+        raise AudioDecodeError("Audio is empty")
+    pcm = np.memmap(path, dtype=np.dtype(dtype).newbyteorder("<"), mode="r",
+                    offset=offset, shape=(n_frames * channels,))
+    if tag == WAVE_FORMAT_IEEE_FLOAT:
+        samples = pcm_to_mono(pcm, channels, 1.0)
+    elif dtype == np.uint8:
+        samples = pcm_to_mono(pcm, channels, 1 / 128, offset=128.0)
+    else:
+        samples = pcm_to_mono(pcm, channels, 1 / float(1 << (bits - 1)))
+    del pcm
+    return samples, sample_rate
+
+
+def decode_audio(path):
+    """Decode any format pydub understands to mono float32 samples in [-1, 1].
+
+    Plain WAV is read directly by read_wav; anything else (e.g. the
+    browser's WebM) goes through pydub, whose raw PCM is viewed in place
+    rather than copied through Python arrays.
+    """
+    try:
+        wav = read_wav(path)
+    except (OSError, ValueError) as e:
+        raise AudioDecodeError(f"{type(e).__name__}: {e}")
+    if wav is not None:
+        return wav
+
+    from pydub import AudioSegment
+
+    try:
+        segment = AudioSegment.from_file(path)
+    except Exception as e:
+        raise AudioDecodeError(f"{type(e).__name__}: {e}")
+    if len(segment) == 0:
+        raise AudioDecodeError("Audio is empty")
+    width = segment.sample_width
+    dtype = {1: np.int8, 2: np.int16, 4: np.int32}.get(width)
+    if dtype is None:
+        segment = segment.set_sample_width(2)
+        width, dtype = 2, np.int16
+    pcm = np.frombuffer(segment.raw_data, dtype=dtype)
+    return pcm_to_mono(pcm, segment.channels, 1 / float(1 << (8 * width - 1))), segment.frame_rate
+
+
+def classify_audio_file(path):
+    """Return {"emotion", "probabilities", "speech", "trimmed"} for the audio
+    file at `path`. "trimmed" is the fraction of the audio dropped as silence;
+    when there is no speech at all, "emotion" is None and no inference runs."""
+    from audio_features import extract_feature, extract_voiced_feature
+
+    with stage("audio_decode"):
+        samples, sample_rate = decode_audio(path)
+    if not AUDIO_VAD:
+        with stage("feature_extraction"):
+            features = extract_feature(samples, sample_rate)
+        result = classify_features(features)
+        result.update(speech=True, trimmed=0.0)
+        return result
+    with stage("feature_extraction"):
+        features, voiced_fraction = extract_voiced_feature(samples, sample_rate)
+    if features is None:
+        return {"emotion": None, "probabilities": {}, "speech": False, "trimmed": 1.0}
+    result = classify_features(features)
+    result.update(speech=True, trimmed=round(1.0 - voiced_fraction, 3))
+    return result
+
+
+def classify_features(features):
+    """Return {"emotion", "probabilities"} for one 180-dim feature vector."""
+    model, labels = load_model()
+    with stage("model_inference"):
+        probabilities = model.predict_proba(features.reshape(1, -1))[0]
+    return {
+        "emotion": labels[int(np.argmax(probabilities))],
+        "probabilities": {label: round(float(p), 4) for label, p in zip(labels, probabilities)},
+    }
+
+
+class RollingEmotion:
+    """Emotion estimates over consecutive windows of a live or long stream.
+
+    push() returns a result for each window of `window_seconds` completed by
+    the new samples, so memory stays fixed however long the session runs.
+    current() classifies the partial window at any point.
+    """
+
+    def __init__(self, sample_rate, window_seconds=3.0):
+        from audio_features import StreamingFeatureExtractor
+
+        self.extractor = StreamingFeatureExtractor(sample_rate)
+        self.window = int(window_seconds * sample_rate)
+        self._in_window = 0
+
+    def push(self, samples):
+        results = []
+        start = 0
+        while start < len(samples):
+            take = min(len(samples) - start, self.window - self._in_window)
+            self.extractor.push(samples[start:start + take])
+            self._in_window += take
+            start += take
+            if self._in_window == self.window:
+                results.append(self.current())
+                self.extractor.reset()
+                self._in_window = 0
+        return results
+
+    def current(self):
+        return classify_features(self.extractor.features())
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this worker's process pool, starting it on first use."""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(
+                    max_workers=AUDIO_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def reset_pool():
+    """Drop a pool whose processes died, so the next call starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def submit(path):
+    """Classify the audio file at `path` in the pool; returns a Future."""
+    return get_pool().submit(classify_audio_file, path)
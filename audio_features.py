@@ -0,0 +1,399 @@
+"""
+Feature extraction for the speech emotion model.
+
+Produces the same 180-dim vector as prototype.extract_feature (40 MFCC means,
+12 chroma means, 128 mel-band means at 44.1 kHz), but computes the power
+spectrogram once and derives all three feature sets from it, where librosa's
+mfcc/chroma_stft/melspectrogram each recompute it. The mel filterbank, DCT
+and chroma filterbanks are built once and cached.
+
+Because the DCT is linear, the MFCC means are the DCT of the mean log-mel
+frame, computed for 40 coefficients only. Chroma tuning estimation is
+restricted to its search band.
+
+StreamingFeatureExtractor computes the same features incrementally, for live
+or arbitrarily long audio, in constant memory.
+
+extract_voiced_feature drops silent STFT frames first, using their energy,
+which is cheap to get from the waveform, so silence costs no FFTs and does
+not dilute the means.
+
+Clips not at 44.1 kHz are still resampled first: the mel and chroma filters
+are defined on the 44.1 kHz spectrum the model was trained on.
+"""
+from functools import lru_cache
+
+import librosa
+import numpy as np
+import soxr
+
+try:
+    from librosa.core.pitch import _parabolic_interpolation
+except ImportError:  # private in librosa; estimate_tuning falls back to librosa's
+    _parabolic_interpolation = None
+
+TARGET_SAMPLE_RATE = 44100
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 40
+N_CHROMA = 12
+FEATURE_SIZE = N_MFCC + N_CHROMA + N_MELS
+
+
+@lru_cache(maxsize=None)
+def mel_basis(sample_rate, n_fft):
+    basis = librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=N_MELS)
+    basis.setflags(write=False)
+    return basis
+
+
+@lru_cache(maxsize=None)
+def dct_basis(n_mfcc, n_mels):
+    """First `n_mfcc` rows of the orthonormal DCT-II matrix, as scipy computes it."""
+    n = np.arange(n_mels)
+    basis = np.cos(np.pi / n_mels * (n + 0.5) * np.arange(n_mfcc)[:, None]) * np.sqrt(2.0 / n_mels)
+    basis[0] /= np.sqrt(2.0)
+    basis.setflags(write=False)
+    return basis
+
+
+@lru_cache(maxsize=256)
+def chroma_basis(sample_rate, n_fft, tuning):
+    # estimate_tuning returns multiples of 0.01, so few filterbanks are ever built
+    basis = librosa.filters.chroma(sr=sample_rate, n_fft=n_fft, tuning=tuning, n_chroma=N_CHROMA)
+    basis.setflags(write=False)
+    return basis
+
+
+# librosa.estimate_tuning's piptrack search band (Hz)
+TUNING_FMIN, TUNING_FMAX = 150.0, 4000.0
+TUNING_THRESHOLD = 0.1
+
+
+@lru_cache(maxsize=None)
+def tuning_band(sample_rate, n_fft):
+    """First and last FFT bin inside the tuning search band."""
+    freqs = librosa.fft_frequencies(sr=sample_rate, n_fft=n_fft)
+    bins = np.nonzero((TUNING_FMIN <= freqs) & (freqs < min(TUNING_FMAX, sample_rate / 2)))[0]
+    return int(bins[0]), int(bins[-1])
+
+
+def estimate_tuning(S, sample_rate):
+    """librosa.estimate_tuning(S=S, sr=sample_rate, bins_per_octave=12), with
+    piptrack evaluated only over its 150-4000 Hz search band.
+
+    piptrack's stencils only look one bin either side, so computing them on
+    the band plus one bin of margin gives the same peaks, pitches and
+    magnitudes as the full-spectrum version, for ~1/6 of the work at 44.1 kHz.
+    """
+    lo, hi = tuning_band(sample_rate, N_FFT)
+    if lo < 1 or hi > S.shape[0] - 2 or _parabolic_interpolation is None:
+        return librosa.estimate_tuning(S=S, sr=sample_rate, bins_per_octave=N_CHROMA)
+
+    band = S[lo - 1:hi + 2]
+    ref_value = TUNING_THRESHOLD * np.max(S, axis=0)
+    peaks = librosa.util.localmax(band * (band > ref_value), axis=0)[1:-1]
+    rows, frames = np.nonzero(peaks)
+    shift = _parabolic_interpolation(band, axis=0)[1:-1][rows, frames]
+    dskew = 0.5 * np.gradient(band, axis=0)[1:-1][rows, frames] * shift
+    pitch = (rows + lo + shift) * float(sample_rate) / N_FFT
+    mag = band[1:-1][rows, frames] + dskew
+
+    pitch_mask = pitch > 0
+    threshold = np.median(mag[pitch_mask]) if pitch_mask.any() else 0.0
+    return librosa.pitch_tuning(pitch[(mag >= threshold) & pitch_mask], bins_per_octave=N_CHROMA)
+
+
+def power_spectrogram(audio_data):
+    return np.abs(librosa.stft(audio_data, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+
+
+def features_from_spectrogram(S, sample_rate):
+    """The 180-dim feature vector from a power spectrogram of shape (freq, frames)."""
+    mel = mel_basis(sample_rate, N_FFT) @ S
+    mel_mean = mel.mean(axis=1)
+    mfcc_mean = dct_basis(N_MFCC, N_MELS) @ librosa.power_to_db(mel).mean(axis=1)
+
+    tuning = estimate_tuning(S, sample_rate)
+    chroma = librosa.util.normalize(chroma_basis(sample_rate, N_FFT, tuning) @ S, norm=np.inf, axis=0)
+    chroma_mean = chroma.mean(axis=1)
+
+    return np.hstack([mfcc_mean, chroma_mean, mel_mean]).astype(np.float32)
+
+
+def extract_feature(audio_data: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Drop-in replacement for prototype.extract_feature."""
+    if sample_rate != TARGET_SAMPLE_RATE:
+        audio_data = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=TARGET_SAMPLE_RATE)
+        sample_rate = TARGET_SAMPLE_RATE
+    return features_from_spectrogram(power_spectrogram(audio_data), sample_rate)
+
+
+# Voice activity
+VOICE_TOP_DB = 40.0     # frames this far below the loudest one are silence
+VOICE_FLOOR_DB = -55.0  # and so is any frame quieter than this (RMS, dBFS)
+VOICE_PAD_FRAMES = 2    # voiced runs are widened by this many frames each side
+
+
+def frame_energy_db(audio_data):
+    """RMS level in dB of each frame of stft(center=True), from the waveform."""
+    # Energy per hop, then per frame as the sum over the hops it spans
+    n_frames = 1 + len(audio_data) // HOP_LENGTH
+    hops_per_frame = N_FFT // HOP_LENGTH
+    padded = np.zeros((n_frames + hops_per_frame) * HOP_LENGTH, dtype=np.float32)
+    padded[N_FFT // 2:N_FFT // 2 + len(audio_data)] = audio_data
+    hop_energy = np.square(padded, out=padded).reshape(-1, HOP_LENGTH).sum(axis=1, dtype=np.float64)
+    mean_square = np.convolve(hop_energy, np.ones(hops_per_frame), mode="valid")[:n_frames] / N_FFT
+    return 10.0 * np.log10(np.maximum(mean_square, 1e-10))
+
+
+def voiced_frames(audio_data):
+    """Boolean mask of the STFT frames that contain speech (or anything not
+    silence): within VOICE_TOP_DB of the loudest frame, above VOICE_FLOOR_DB,
+    widened by VOICE_PAD_FRAMES to keep onsets and decays."""
+    level = frame_energy_db(audio_data)
+    voiced = (level > level.max() - VOICE_TOP_DB) & (level > VOICE_FLOOR_DB)
+    if VOICE_PAD_FRAMES and voiced.any():
+        widened = np.convolve(voiced, np.ones(2 * VOICE_PAD_FRAMES + 1))
+        voiced = widened[VOICE_PAD_FRAMES:VOICE_PAD_FRAMES + len(voiced)] > 0
+    return voiced
+
+
+def speech_bounds(audio_data):
+    """(start, end) sample indices spanning the voiced frames, or None."""
+    voiced = np.flatnonzero(voiced_frames(audio_data))
+    if len(voiced) == 0:
+        return None
+    start = max(0, voiced[0] * HOP_LENGTH - N_FFT // 2)
+    end = min(len(audio_data), voiced[-1] * HOP_LENGTH + N_FFT // 2)
+    return start, end
+
+
+def voiced_power_spectrogram(audio_data, voiced):
+    """power_spectrogram restricted to the frames where `voiced` is True."""
+    padded = np.pad(audio_data, N_FFT // 2)
+    frames = np.lib.stride_tricks.sliding_window_view(padded, N_FFT)[::HOP_LENGTH][voiced]
+    window = librosa.filters.get_window("hann", N_FFT, fftbins=True)
+    return (np.abs(np.fft.rfft(frames * window, axis=1)) ** 2).T
+
+
+def extract_voiced_feature(audio_data, sample_rate):
+    """extract_feature over the voiced frames only.
+
+    Returns (features, voiced_fraction); features is None when no frame is
+    voiced, so the caller can skip inference altogether.
+    """
+    if sample_rate != TARGET_SAMPLE_RATE:
+        audio_data = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=TARGET_SAMPLE_RATE)
+    voiced = voiced_frames(audio_data)
+    voiced_fraction = float(voiced.mean())
+    if not voiced.any():
+        return None, 0.0
+    S = voiced_power_spectrogram(audio_data, voiced)
+    return features_from_spectrogram(S, TARGET_SAMPLE_RATE), voiced_fraction
+
+
+# Streaming extraction
+STREAM_WARMUP_FRAMES = 256  # ~3 s at 44.1 kHz; chroma tuning is estimated on these
+TOP_DB = 80.0               # power_to_db's dynamic range floor
+DB_FLOOR = -100.0           # power_to_db of its amin, 1e-10
+DB_BIN_WIDTH = 0.1
+DB_BINS = 2000              # -100 dB to +100 dB
+
+
+class StreamingFeatureExtractor:
+    """Incremental extract_feature for live or arbitrarily long audio.
+
+    push() audio as it arrives and call features() at any point for the
+    vector over everything pushed since the last reset(). Memory does not
+    grow with the amount of audio: STFT frames are computed a block at a
+    time in preallocated buffers and only running sums are kept.
+
+    Two parts of the batch extractor depend on the whole clip and are
+    handled differently:
+
+    - power_to_db clips log-mel values to 80 dB below the loudest one seen.
+      A per-band histogram of log-mel values (0.1 dB bins) stands in for
+      the frames, so the clip can still be applied to all of them.
+    - Chroma tuning is estimated on the first STREAM_WARMUP_FRAMES frames
+      and then fixed. Shorter clips get exactly the batch tuning.
+
+    Input that is not at 44.1 kHz is resampled with a streaming soxr
+    resampler; call finish() at the end of such a stream to flush it.
+    """
+
+    def __init__(self, sample_rate, block_frames=64):
+        self.sample_rate = sample_rate
+        self.block_frames = block_frames
+        self._resampler = None
+        if sample_rate != TARGET_SAMPLE_RATE:
+            self._resampler = soxr.ResampleStream(sample_rate, TARGET_SAMPLE_RATE, 1, dtype="float32")
+        self._window = librosa.filters.get_window("hann", N_FFT, fftbins=True)
+        self._mel_basis_t = mel_basis(TARGET_SAMPLE_RATE, N_FFT).T
+        self._dct = dct_basis(N_MFCC, N_MELS)
+
+        # Working buffers, reused for every block. A final partial block can
+        # hold up to N_FFT // HOP_LENGTH frames more than a full one.
+        n_bins = N_FFT // 2 + 1
+        max_frames = block_frames + N_FFT // HOP_LENGTH
+        self._samples = np.zeros(N_FFT + (block_frames - 1) * HOP_LENGTH, dtype=np.float32)
+        self._tail = np.zeros(len(self._samples) + N_FFT, dtype=np.float32)
+        self._frames = np.empty((max_frames, N_FFT))
+        self._spectrum = np.empty((max_frames, n_bins), dtype=np.complex128)
+        self._power = np.empty((max_frames, n_bins), dtype=np.float32)
+        self._mel = np.empty((max_frames, N_MELS), dtype=np.float32)
+        self._db = np.empty((max_frames, N_MELS), dtype=np.float32)
+        self._db_index = np.empty((max_frames, N_MELS), dtype=np.intp)
+        self._band_offsets = np.arange(N_MELS) * DB_BINS
+        self._warmup = np.empty((STREAM_WARMUP_FRAMES, n_bins), dtype=np.float32)
+
+        # Running sums
+        self._mel_sum = np.zeros(N_MELS)
+        self._chroma_sum = np.zeros(N_CHROMA)
+        self._db_counts = np.zeros(N_MELS * DB_BINS)
+        self._db_sums = np.zeros(N_MELS * DB_BINS)
+        self.reset()
+
+    def reset(self):
+        """Start a new clip, e.g. for the next window of a rolling estimate.
+
+        The resampler keeps its state, since the audio itself is continuous.
+        """
+        self._samples[:] = 0
+        self._filled = N_FFT // 2  # center=True: the clip starts after N_FFT // 2 zeros
+        self._pushed = 0
+        self._frame_count = 0
+        self._warmup_count = 0
+        self._tuning = None
+        self._db_max = -np.inf
+        for total in (self._mel_sum, self._chroma_sum, self._db_counts, self._db_sums):
+            total.fill(0)
+
+    def push(self, samples):
+        """Add mono float samples at the extractor's sample rate."""
+        samples = np.asarray(samples, dtype=np.float32)
+        if self._resampler is not None:
+            samples = self._resampler.resample_chunk(samples)
+        self._push_resampled(samples)
+
+    def finish(self):
+        """Flush the resampler at the end of the stream; push() must not follow."""
+        if self._resampler is not None:
+            self._push_resampled(self._resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+
+    def _push_resampled(self, samples):
+        self._pushed += len(samples)
+        start = 0
+        while start < len(samples):
+            take = min(len(samples) - start, len(self._samples) - self._filled)
+            self._samples[self._filled:self._filled + take] = samples[start:start + take]
+            self._filled += take
+            start += take
+            if self._filled == len(self._samples):
+                self._analyze(self._samples, self.block_frames)
+                self._accumulate(self.block_frames)
+                # Keep the overlap with the next block at the front
+                consumed = self.block_frames * HOP_LENGTH
+                self._samples[:self._filled - consumed] = self._samples[consumed:self._filled]
+                self._filled -= consumed
+
+    def _analyze(self, samples, n):
+        """Power, mel and log-mel spectra of the first `n` frames of `samples`."""
+        frames = np.lib.stride_tricks.sliding_window_view(samples, N_FFT)[::HOP_LENGTH][:n]
+        np.multiply(frames, self._window, out=self._frames[:n])
+        np.fft.rfft(self._frames[:n], axis=1, out=self._spectrum[:n])
+        power = self._power[:n]
+        np.abs(self._spectrum[:n], out=power)
+        np.square(power, out=power)
+        np.matmul(power, self._mel_basis_t, out=self._mel[:n])
+        db = self._db[:n]
+        np.maximum(self._mel[:n], 1e-10, out=db)
+        np.log10(db, out=db)
+        np.multiply(db, 10.0, out=db)
+
+    def _accumulate(self, n):
+        self._mel_sum += self._mel[:n].sum(axis=0, dtype=np.float64)
+        db = self._db[:n]
+        self._db_max = max(self._db_max, float(db.max()))
+        index = self._db_index[:n]
+        np.subtract(db, DB_FLOOR, out=self._mel[:n])  # the mel rows are not needed any more
+        np.floor_divide(self._mel[:n], DB_BIN_WIDTH, out=self._mel[:n])
+        np.clip(self._mel[:n], 0, DB_BINS - 1, out=self._mel[:n])
+        index[:] = self._mel[:n]
+        index += self._band_offsets
+        np.add.at(self._db_counts, index.ravel(), 1)
+        np.add.at(self._db_sums, index.ravel(), db.ravel())
+
+        power = self._power[:n]
+        if self._tuning is None:
+            take = min(n, STREAM_WARMUP_FRAMES - self._warmup_count)
+            self._warmup[self._warmup_count:self._warmup_count + take] = power[:take]
+            self._warmup_count += take
+            if self._warmup_count == STREAM_WARMUP_FRAMES:
+                self._tuning = estimate_tuning(self._warmup.T, TARGET_SAMPLE_RATE)
+                self._chroma_sum += self._chroma(self._warmup, self._tuning).sum(axis=0)
+            power = power[take:]
+        if self._tuning is not None and len(power):
+            self._chroma_sum += self._chroma(power, self._tuning).sum(axis=0)
+        self._frame_count += n
+
+    @staticmethod
+    def _chroma(power, tuning):
+        chroma = power @ chroma_basis(TARGET_SAMPLE_RATE, N_FFT, tuning).T
+        return librosa.util.normalize(chroma, norm=np.inf, axis=1)
+
+    def _clipped_db_sum(self, threshold):
+        """Per-band sum of max(log-mel, threshold) over the accumulated frames."""
+        counts = self._db_counts.reshape(N_MELS, DB_BINS)
+        sums = self._db_sums.reshape(N_MELS, DB_BINS)
+        edge = int(np.clip((threshold - DB_FLOOR) // DB_BIN_WIDTH, -1, DB_BINS))
+        total = threshold * counts[:, :max(edge, 0)].sum(axis=1) + sums[:, edge + 1:].sum(axis=1)
+        if 0 <= edge < DB_BINS:
+            # The bin holding the threshold: clip its mean value
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = np.where(counts[:, edge] > 0, sums[:, edge] / counts[:, edge], threshold)
+            total += np.maximum(means, threshold) * counts[:, edge]
+        return total
+
+    def features(self):
+        """The 180-dim feature vector for the audio pushed since reset()."""
+        if self._pushed == 0:
+            raise ValueError("No audio has been pushed")
+
+        # Frames overlapping the end of the audio so far, zero padded as
+        # stft(center=True) would; they are not added to the running sums
+        n = 1 + self._pushed // HOP_LENGTH - self._frame_count
+        self._tail[:self._filled] = self._samples[:self._filled]
+        self._tail[self._filled:] = 0
+        self._analyze(self._tail, n)
+        frames = self._frame_count + n
+
+        mel_mean = (self._mel_sum + self._mel[:n].sum(axis=0, dtype=np.float64)) / frames
+        db = self._db[:n]
+        threshold = max(self._db_max, float(db.max())) - TOP_DB
+        db_sum = self._clipped_db_sum(threshold) + np.maximum(db, threshold).sum(axis=0, dtype=np.float64)
+        mfcc_mean = self._dct @ (db_sum / frames)
+
+        power = self._power[:n]
+        if self._tuning is not None:
+            chroma_sum = self._chroma_sum + self._chroma(power, self._tuning).sum(axis=0)
+        else:
+            warmup = np.concatenate([self._warmup[:self._warmup_count], power])
+            chroma_sum = self._chroma(warmup, estimate_tuning(warmup.T, TARGET_SAMPLE_RATE)).sum(axis=0)
+        chroma_mean = chroma_sum / frames
+
+        return np.hstack([mfcc_mean, chroma_mean, mel_mean]).astype(np.float32)
+
+
+def extract_file_feature(path, block_seconds=1.0):
+    """extract_feature for an audio file, read in blocks at constant memory."""
+    import soundfile
+
+    info = soundfile.info(path)
+    extractor = StreamingFeatureExtractor(info.samplerate)
+    for block in soundfile.blocks(path, blocksize=int(info.samplerate * block_seconds),
+                                  dtype="float32", always_2d=True):
+        extractor.push(block.mean(axis=1))
+    extractor.finish()
+    return extractor.features()
@@ -0,0 +1,317 @@
+"""
+Build step and manifest for the avatar image sequences.
+
+The eye animation draws dozens of full-size PNG frames, 1-4 MB each, so a
+page load used to move tens of megabytes. build() packs each sequence (and
+the static eye images) into one sprite atlas of frames resized to at most
+AVATAR_MAX_SIZE pixels, encoded as WebP and, where Pillow supports it, AVIF.
+Frames keep their original display size, so the page looks the same.
+
+Everything is written to AVATAR_BUILD_DIR under content-hashed names, with a
+manifest.json recording where each frame sits in its atlas. A name changes
+whenever its content does, so /assets/ responses can be cached for a year
+as immutable. The index page gets the manifest inline, with one URL per
+atlas in the best format its Accept header allows.
+
+Run `python -m avatar_assets` at deploy time. Otherwise a missing or out of
+date build is started in the background on the first page load, and pages
+load the original PNGs until it is done. They also keep the PNGs if any
+sheet has no source frames (AVATAR_SOURCE_DIR pointing at the wrong place):
+a half-empty manifest would draw a blank avatar. Without Pillow the original
+PNGs are published under hashed names, one frame per sheet.
+
+sketch.js and styles.css are not published: the page inlines its script and
+styles, so nothing would load them.
+"""
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+
+from telemetry import log_event
+
+AVATAR_SOURCE_DIR = os.getenv("AVATAR_SOURCE_DIR", "static")
+AVATAR_BUILD_DIR = os.getenv("AVATAR_BUILD_DIR", ".avatar_assets")
+AVATAR_MAX_SIZE = int(os.getenv("AVATAR_MAX_SIZE", "768"))  # longest side of a frame, in pixels
+AVATAR_QUALITY = int(os.getenv("AVATAR_QUALITY", "80"))  # WebP quality
+# AVIF's quality scale runs higher: 60 is about WebP's 80 for these frames
+AVIF_QUALITY_OFFSET = 20
+URL_PREFIX = "/assets/"
+
+# Bump when the build output changes in a way the settings above do not capture
+BUILD_VERSION = 2
+
+# Atlas name -> frames in animation order, relative to AVATAR_SOURCE_DIR.
+# Gaps in the numbering are frames that were never drawn.
+SEQUENCES = {
+    "sad": [f"sad/sad_{i}.png" for i in (1, 2, 3, 4, 5, 7)],
+    "neutral": [f"neutral/neutral_{i}.png" for i in range(1, 7)],
+    "energetic": [f"happy/energetic_{i}.png" for i in (1, 2, 3, 4, 5, 6, 7, 8, 10)],
+    "joy": ["happy/happy_static.png"],
+}
+# Emotion -> its static eye image; these share the "eyes" atlas
+EYES = {
+    "sad": "sad/sad_static.png",
+    "neutral": "neutral/neutral_static.png",
+    "excitement": "happy/energetic_static.png",
+    "joy": "happy/happy_static.png",
+    "anxiety": "sad/anxiety_static.png",
+    "fear": "sad/fear_static.png",
+}
+
+MIMETYPES = {
+    ".avif": "image/avif",
+    ".webp": "image/webp",
+    ".png": "image/png",
+}
+PUBLISHED_NAME = re.compile(r"[\w-]+\.[0-9a-f]{12}(\.avif|\.webp|\.png)")
+
+
+def _image_formats():
+    """Atlas formats this Pillow can write, best first; () without Pillow."""
+    try:
+        from PIL import features
+    except ImportError:
+        return ()
+    return tuple(ext for ext, codec in ((".avif", "avif"), (".webp", "webp")) if features.check(codec))
+
+
+def png_size(path):
+    """(width, height) from a PNG's header, without decoding it."""
+    with open(path, "rb") as f:
+        header = f.read(24)
+    if header[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError(f"{path} is not a PNG")
+    return struct.unpack(">II", header[16:24])
+
+
+def signature(source_dir):
+    """Hash of every input to the build: sources, settings and encoders."""
+    parts = [f"v{BUILD_VERSION} max={AVATAR_MAX_SIZE} q={AVATAR_QUALITY} formats={_image_formats()}"]
+    names = sorted({*sum(SEQUENCES.values(), []), *EYES.values()})
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(source_dir, name))
+        except FileNotFoundError:
+            parts.append(f"{name} missing")
+            continue
+        parts.append(f"{name} {stat.st_size} {stat.st_mtime_ns}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def _write_exact(build_dir, name, data):
+    """Write `data` to `name`, atomically, so concurrent builds can share a directory."""
+    fd, tmp = tempfile.mkstemp(dir=build_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, os.path.join(build_dir, name))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _write(build_dir, stem, ext, data):
+    """Write `data` as <stem>.<content hash><ext>; return the name."""
+    name = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+    if not os.path.exists(os.path.join(build_dir, name)):
+        _write_exact(build_dir, name, data)
+    return name
+
+
+def _pack(sizes):
+    """Row-major layout of frames on a roughly square grid.
+
+    Returns ((width, height), [(x, y), ...]).
+    """
+    columns = math.ceil(math.sqrt(len(sizes)))
+    positions, width, y = [], 0, 0
+    for row in range(0, len(sizes), columns):
+        x = 0
+        for w, h in sizes[row:row + columns]:
+            positions.append((x, y))
+            x += w
+        width = max(width, x)
+        y += max(h for _, h in sizes[row:row + columns])
+    return (width, y), positions
+
+
+def _build_atlas(build_dir, atlas, sources, formats):
+    """Resize and pack `sources` into one atlas per format. AVIF is dropped
+    when it comes out no smaller than WebP.
+
+    Returns ({mimetype: file name}, [frame, ...]) where each frame is
+    [atlas, x, y, width, height, display width, display height].
+    """
+    from PIL import Image
+
+    frames = []
+    for path in sources:
+        with Image.open(path) as image:
+            image = image.convert("RGBA")
+        display = image.size
+        image.thumbnail((AVATAR_MAX_SIZE, AVATAR_MAX_SIZE), Image.LANCZOS)
+        frames.append((image, display))
+    size, positions = _pack([image.size for image, _ in frames])
+    sheet = Image.new("RGBA", size, (0, 0, 0, 0))
+    layout = []
+    for (image, display), (x, y) in zip(frames, positions):
+        sheet.paste(image, (x, y))
+        layout.append([atlas, x, y, *image.size, *display])
+
+    encoded = {}
+    for ext in formats:
+        buffer = io.BytesIO()
+        if ext == ".webp":
+            sheet.save(buffer, format="WEBP", quality=AVATAR_QUALITY, method=6)
+        else:
+            sheet.save(buffer, format="AVIF", quality=AVATAR_QUALITY - AVIF_QUALITY_OFFSET, speed=6)
+        encoded[ext] = buffer.getvalue()
+    if ".webp" in encoded and len(encoded.get(".avif", b"")) >= len(encoded[".webp"]):
+        encoded.pop(".avif", None)
+    files = {MIMETYPES[ext]: _write(build_dir, atlas, ext, data) for ext, data in encoded.items()}
+    return files, layout
+
+
+def build(source_dir=AVATAR_SOURCE_DIR, build_dir=AVATAR_BUILD_DIR):
+    """Build the atlases, write manifest.json and return it.
+
+    Missing source images are left out of their sequence, but a sequence
+    with no frames at all means `source_dir` is not the avatar directory:
+    nothing is written and None is returned. Files from earlier builds are
+    kept, so pages that still reference them keep working.
+    """
+    groups = dict(SEQUENCES, eyes=list(EYES.values()))
+    found = {atlas: [(name, os.path.join(source_dir, name)) for name in names
+                     if os.path.exists(os.path.join(source_dir, name))]
+             for atlas, names in groups.items()}
+    empty = [atlas for atlas, sources in found.items() if not sources]
+    if empty:
+        log_event(logging.WARNING, "avatar_sources_missing", source_dir=source_dir, sheets=empty)
+        return None
+
+    os.makedirs(build_dir, exist_ok=True)
+    formats = _image_formats()
+    manifest = {"signature": signature(source_dir), "sheets": {}, "frames": {}, "eyes": {}}
+    for atlas, sources in found.items():
+        if formats:
+            files, layout = _build_atlas(build_dir, atlas, [path for _, path in sources], formats)
+            manifest["sheets"][atlas] = files
+            by_name = dict(zip((name for name, _ in sources), layout))
+        else:
+            by_name = {}
+            for i, (name, path) in enumerate(sources):
+                with open(path, "rb") as f:
+                    published = _write(build_dir, os.path.splitext(os.path.basename(name))[0], ".png", f.read())
+                sheet = f"{atlas}-{i}"
+                manifest["sheets"][sheet] = {"image/png": published}
+                by_name[name] = [sheet, 0, 0, *png_size(path), *png_size(path)]
+        if atlas == "eyes":
+            manifest["eyes"] = {emotion: by_name[name] for emotion, name in EYES.items() if name in by_name}
+        else:
+            manifest["frames"][atlas] = [by_name[name] for name, _ in sources]
+
+    _write_exact(build_dir, "manifest.json", json.dumps(manifest, indent=1).encode("utf-8"))
+    return manifest
+
+
+_manifest = None
+_builder = None
+_manifest_lock = threading.Lock()
+
+
+def _build_in_background():
+    global _manifest
+    start = time.perf_counter()
+    try:
+        result = build()
+    except Exception as e:
+        log_event(logging.ERROR, "avatar_build_failed", error=f"{type(e).__name__}: {e}")
+        return
+    if result is None:
+        return
+    _manifest = result
+    log_event(logging.INFO, "avatar_build_done", seconds=round(time.perf_counter() - start, 1))
+
+
+def manifest():
+    """The current build's manifest, or None while it is being built.
+
+    A missing or stale build is started once per process, on a background
+    thread, so no request waits for it.
+    """
+    global _manifest, _builder
+    if _manifest is None and _builder is None:
+        with _manifest_lock:
+            if _manifest is None and _builder is None:
+                try:
+                    with open(os.path.join(AVATAR_BUILD_DIR, "manifest.json")) as f:
+                        current = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    current = None
+                if current is not None and current.get("signature") == signature(AVATAR_SOURCE_DIR):
+                    _manifest = current
+                else:
+                    _builder = threading.Thread(target=_build_in_background, name="avatar-assets", daemon=True)
+                    _builder.start()
+    return _manifest
+
+
+def page_assets(accept_mimetypes):
+    """The manifest as the page uses it: one URL per sheet, in the best
+    format the client accepts; None until a build with every sheet is ready.
+
+    AVIF is only chosen when the client names it: browsers that cannot
+    decode it still send */*. Every browser the page supports decodes WebP.
+    """
+    current = manifest()
+    if current is None or any(not current["frames"].get(atlas) for atlas in SEQUENCES) or not current["eyes"]:
+        return None
+    named = {value for value, quality in accept_mimetypes if quality > 0}
+    sheets = {}
+    for sheet, files in current["sheets"].items():
+        mimetype = "image/avif" if "image/avif" in files and "image/avif" in named else next(
+            (m for m in ("image/webp", "image/png") if m in files), None)
+        sheets[sheet] = URL_PREFIX + files[mimetype]
+    return {"sheets": sheets, "frames": current["frames"], "eyes": current["eyes"]}
+
+
+def asset_file(name):
+    """(path, mimetype) of a built file, or None.
+
+    Any build's files are served, so pages rendered before a rebuild keep
+    working.
+    """
+    if not PUBLISHED_NAME.fullmatch(name):
+        return None
+    path = os.path.join(AVATAR_BUILD_DIR, name)
+    if not os.path.isfile(path):
+        return None
+    return path, MIMETYPES[os.path.splitext(name)[1]]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the avatar atlases")
+    parser.add_argument("--source", default=AVATAR_SOURCE_DIR)
+    parser.add_argument("--out", default=AVATAR_BUILD_DIR)
+    args = parser.parse_args()
+    result = build(args.source, args.out)
+    if result is None:
+        raise SystemExit(f"No avatar frames for some sheets in {args.source}")
+    total = sum(os.path.getsize(os.path.join(args.out, f))
+                for files in result["sheets"].values() for f in files.values())
+    print(f"Wrote {len(result['sheets'])} sheets ({total / 1e6:.1f} MB over all formats) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
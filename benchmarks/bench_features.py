@@ -0,0 +1,62 @@
+"""
+Audio feature extraction: prototype.extract_feature vs. the shared-STFT
+extractor in audio_features.
+
+Reports milliseconds of CPU per second of audio for clips recorded at 44.1
+and 16 kHz, after checking that both produce the same 180-dim vectors.
+
+    python -m benchmarks.bench_features --seconds 5 --repeat 5
+"""
+import argparse
+import time
+import warnings
+
+import numpy as np
+
+import audio_features
+import prototype
+
+
+def synthetic_clip(seconds, sample_rate, seed=0):
+    """A voiced-sounding test clip: a few harmonics plus noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 150 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    clip = sum(np.sin(k * phase) / k for k in range(1, 6)) * 0.2 + 0.02 * rng.standard_normal(t.size)
+    return clip.astype(np.float32)
+
+
+def best_of(extract, clip, sample_rate, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract(clip, sample_rate)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    for sample_rate in (44100, 16000):
+        clip = synthetic_clip(args.seconds, sample_rate)
+        reference = prototype.extract_feature(clip, sample_rate)
+        shared = audio_features.extract_feature(clip, sample_rate)
+        scale = np.maximum(np.abs(reference), 1e-6)
+        print(f"{sample_rate} Hz: max relative difference {np.max(np.abs(reference - shared) / scale):.2e}")
+
+        results = {}
+        for name, extract in (("prototype", prototype.extract_feature),
+                              ("shared STFT", audio_features.extract_feature)):
+            results[name] = best_of(extract, clip, sample_rate, args.repeat) / args.seconds * 1000
+            print(f"{name:>14}: {results[name]:.2f} ms per second of audio")
+        print(f"{'speedup':>14}: {results['prototype'] / results['shared STFT']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Import-time budget for the modules that workers and tools import.
+
+Imports each module in a fresh interpreter under `python -X importtime`,
+takes the best cumulative time over --repeat runs, and checks it against the
+module's budget. Also checks that none of the heavy dependencies the module
+is meant to defer (librosa, sklearn, sounddevice, ...) were imported. Exits
+non-zero on any regression, so it can run as a check.
+
+    python -m benchmarks.bench_import --repeat 5
+"""
+import argparse
+import subprocess
+import sys
+
+DEFERRED = ("librosa", "sklearn", "sounddevice", "openai", "gradio", "dotenv")
+
+# Module -> budget in milliseconds; NumPy alone accounts for most of it
+BUDGETS = {
+    "train_model": 250,
+    "audio_emotion": 250,
+    "compact_model": 250,
+}
+
+
+def import_profile(module):
+    """Cumulative import time of `module` (ms) and the top-level packages it pulled in."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    total, imported = None, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header row
+        imported.add(name.strip().split(".")[0])
+        if name.strip() == module and not name.startswith("  "):
+            total = int(cumulative) / 1000
+    return total, imported
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget, for slow machines")
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget in BUDGETS.items():
+        budget *= args.scale
+        runs = [import_profile(module) for _ in range(args.repeat)]
+        best = min(total for total, _ in runs)
+        heavy = sorted(set(DEFERRED) & set().union(*(imported for _, imported in runs)))
+        ok = best <= budget and not heavy
+        failed |= not ok
+        print(f"{module:>14}: {best:7.1f} ms (budget {budget:.0f} ms)"
+              + (f", imports {', '.join(heavy)}" if heavy else "") + ("" if ok else "  FAIL"))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Connection reuse: pooled LLMClient vs. a fresh client per request.
+
+Runs against the local OpenAI stand-in, so no network access is needed.
+
+    python -m benchmarks.bench_llm_client --requests 200
+"""
+import argparse
+import time
+
+from benchmarks.openai_standin import start_standin
+from llm_client import LLMClient
+
+MESSAGES = [{"role": "user", "content": "I had a really long day"}]
+
+
+def run(make_client, n):
+    start = time.perf_counter()
+    client = None
+    for _ in range(n):
+        client = make_client(client)
+        client.chat_completion(MESSAGES, model="gpt-3.5-turbo")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = start_standin(latency=args.latency)
+
+    def fresh(previous):
+        if previous is not None:
+            previous.close()
+        return LLMClient("test", base_url=server.base_url)
+
+    pooled_client = LLMClient("test", base_url=server.base_url)
+
+    for name, factory in (("fresh client per request", fresh), ("pooled client", lambda _: pooled_client)):
+        before = dict(server.counters)
+        elapsed = run(factory, args.requests)
+        connections = server.counters["connections"] - before["connections"]
+        print(f"{name:>26}: {elapsed / args.requests * 1000:.3f} ms/request, "
+              f"{connections} connections for {args.requests} requests")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
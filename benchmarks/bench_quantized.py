@@ -0,0 +1,94 @@
+"""
+Reduced-precision emotion MLP: accuracy drift and throughput against the
+float64 sklearn model in trained_emotion_model.pkl.
+
+Features come from the training feature cache (FEATURE_CACHE_DIR, filled by
+train_model.py). Without one, seeded synthetic clips are put through the
+extractor, so every run evaluates the same set; they are kept in memory and
+never written to the training cache. For each precision it
+reports top-1 agreement with sklearn, the largest and mean absolute
+probability differences, file size and predictions per second. It exits
+non-zero if any precision agrees on fewer than --min-agreement of the inputs.
+
+    python -m benchmarks.bench_quantized --min-agreement 0.99
+"""
+import argparse
+import glob
+import os
+import pickle
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+import audio_features
+from benchmarks.bench_features import synthetic_clip
+from compact_model import PRECISIONS, CompactMLP, export_model
+
+
+def load_features(cache_dir, n_synthetic):
+    paths = sorted(glob.glob(os.path.join(cache_dir, "*.npy")))
+    if paths:
+        return np.stack([np.load(path) for path in paths]), f"{len(paths)} cached feature vectors"
+
+    rng = np.random.default_rng(0)
+    features = []
+    for seed in range(n_synthetic):
+        clip = synthetic_clip(rng.uniform(1, 4), 44100, seed=seed) * rng.uniform(0.1, 3)
+        features.append(audio_features.extract_feature(clip, 44100))
+    return np.stack(features), f"{n_synthetic} synthetic vectors"
+
+
+def throughput(predict_proba, features, batch_size, seconds=1.0):
+    batches = [features[i:i + batch_size] for i in range(0, len(features), batch_size)]
+    done, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for batch in batches:
+            predict_proba(batch)
+        done += len(features)
+    return done / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="trained_emotion_model.pkl")
+    parser.add_argument("--encoder", default="label_encoder.pkl")
+    parser.add_argument("--cache-dir", default=os.getenv("FEATURE_CACHE_DIR", ".feature_cache"))
+    parser.add_argument("--synthetic", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+    with open(args.encoder, "rb") as f:
+        encoder = pickle.load(f)
+    features, source = load_features(args.cache_dir, args.synthetic)
+    reference = model.predict_proba(features)
+    print(f"Evaluating on {source}")
+    rate = throughput(model.predict_proba, features, args.batch_size)
+    print(f"{'sklearn':>8}: {rate:10.0f} predictions/s")
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for precision in PRECISIONS:
+            path = os.path.join(tmp, f"{precision}.npz")
+            export_model(model, encoder, path, precision=precision)
+            compact = CompactMLP(path)
+            probabilities = compact.predict_proba(features)
+            agreement = np.mean(probabilities.argmax(axis=1) == reference.argmax(axis=1))
+            drift = np.abs(probabilities - reference)
+            rate = throughput(compact.predict_proba, features, args.batch_size)
+            print(f"{precision:>8}: {rate:10.0f} predictions/s, {os.path.getsize(path) / 1024:6.0f} KiB, "
+                  f"top-1 agreement {agreement:.4f}, drift max {drift.max():.2e} mean {drift.mean():.2e}")
+            failed |= agreement < args.min_agreement
+    if failed:
+        print(f"Top-1 agreement below {args.min_agreement}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Local stand-in for the OpenAI chat-completions API.
+
+Answers POST /v1/chat/completions with a canned completion after a
+configurable delay, and counts requests, TCP connections and prompt
+characters so connection reuse and batching can be measured. GET /stats
+returns the counters. Requests with
+"stream": true get the reply as server-sent events, one word per chunk,
+with an optional delay between chunks.
+
+    python -m benchmarks.openai_standin --port 8089 --latency 0.05
+    OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CLASSIFY_REPLY = '{"emotion":"Neutral","intensity":0}'
+CHAT_REPLY = "That sounds like a lot. I'm here to listen."
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, token_latency=0.0):
+        super().__init__(address, StandinHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.lock = threading.Lock()
+        self.counters = {"connections": 0, "requests": 0, "prompt_chars": 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.lock:
+                self._send_json(200, dict(self.server.counters))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        self.server.count("requests")
+        self.server.count("prompt_chars", sum(len(m.get("content", "")) for m in payload.get("messages", [])))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if payload.get("stream"):
+            self._send_stream(payload, reply_for(payload))
+        else:
+            self._send_json(200, completion_body(payload, reply_for(payload)))
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _send_stream(self, payload, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            if i and self.server.token_latency:
+                time.sleep(self.server.token_latency)
+            token = word if i == len(words) - 1 else word + " "
+            chunk = {"choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            self._send_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self._send_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def reply_for(payload):
+    """Pick a canned reply: JSON for the classifier prompts, prose otherwise."""
+    messages = payload.get("messages", [])
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    if "JSON array of texts" in system:
+        user = next(m["content"] for m in messages if m.get("role") == "user")
+        texts = json.loads(user.split(":", 1)[1])
+        return "[" + ", ".join([CLASSIFY_REPLY] * len(texts)) + "]"
+    return CLASSIFY_REPLY if "emotion classifier" in system else CHAT_REPLY
+
+
+def completion_body(payload, content):
+    return {
+        "id": f"chatcmpl-standin-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "standin"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def start_standin(host="127.0.0.1", port=0, latency=0.0, token_latency=0.0):
+    """Start a stand-in server on a background thread and return it."""
+    server = StandinServer((host, port), latency=latency, token_latency=token_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed chunks")
+    args = parser.parse_args()
+    server = StandinServer((args.host, args.port), latency=args.latency, token_latency=args.token_latency)
+    print(f"OpenAI stand-in listening on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,234 @@
+"""
+Benchmark suite for the classifier, feature and endpoint hot paths.
+
+Each case runs a warm-up call and then times individual calls for at least
+--seconds (and at least --min-calls calls), reporting calls per second and
+p50/p99/mean latency. Cases:
+
+- inferential_classify on short and long texts
+- map_emotion_to_confidences
+- prototype.extract_feature on 1, 5 and 30 second clips
+- MLP predict_proba, sklearn and the compact model, at batch sizes 1, 16, 256
+- the /classify, /respond and /chat endpoints through the Flask app, against
+  the local OpenAI stand-in with --latency seconds of upstream delay
+
+Results are saved as JSON together with the commit and environment, so runs
+can be compared across commits:
+
+    python -m benchmarks.suite --out bench-before.json
+    python -m benchmarks.suite --out bench-after.json --compare bench-before.json
+    python -m benchmarks.suite --only features,mlp
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.bench_features import synthetic_clip
+from benchmarks.openai_standin import start_standin
+
+SHORT_TEXT = "I can't believe I finally got the job!"
+LONG_TEXT = " ".join([
+    "Today started badly because the train was late and I missed the meeting.",
+    "My manager was annoyed, and honestly I was frustrated and a bit anxious about it.",
+    "Later a friend called and we laughed about the whole thing, which helped a lot.",
+    "Now I'm tired, hungry, and not sure whether tomorrow will be any better.",
+] * 8)
+
+
+def summarize(latencies, elapsed):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "calls": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "mean_ms": round(float(latencies.mean()), 4),
+    }
+
+
+def measure(call, seconds, min_calls, concurrency=1):
+    """Time `call()` repeatedly (from `concurrency` threads) and summarize."""
+    call()
+
+    def worker(deadline):
+        latencies = []
+        while time.perf_counter() < deadline or len(latencies) < max(1, min_calls // concurrency):
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    deadline = start + seconds
+    if concurrency == 1:
+        latencies = worker(deadline)
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(itertools.chain.from_iterable(pool.map(worker, [deadline] * concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def classifier_cases(flask_app):
+    def inferential(text):
+        def call():
+            with flask_app.app.app_context():
+                flask_app.inferential_classify(text)
+        return call
+
+    return {
+        "inferential_classify/short": inferential(SHORT_TEXT),
+        "inferential_classify/long": inferential(LONG_TEXT),
+        "map_emotion_to_confidences": lambda: flask_app.map_emotion_to_confidences("Anxious", -40),
+    }
+
+
+def feature_cases():
+    import prototype
+
+    cases = {}
+    for seconds in (1, 5, 30):
+        clip = synthetic_clip(seconds, 44100)
+        cases[f"extract_feature/{seconds}s"] = lambda clip=clip: prototype.extract_feature(clip, 44100)
+    return cases
+
+
+def mlp_cases(scratch):
+    import pickle
+
+    from compact_model import CompactMLP, export_model
+
+    with open("trained_emotion_model.pkl", "rb") as f:
+        model = pickle.load(f)
+    with open("label_encoder.pkl", "rb") as f:
+        encoder = pickle.load(f)
+    # Export the pickle being compared, rather than whatever .npz is on disk
+    path = os.path.join(scratch, "emotion_model.npz")
+    export_model(model, encoder, path)
+    compact = CompactMLP(path)
+    rng = np.random.default_rng(0)
+    cases = {}
+    for batch in (1, 16, 256):
+        features = rng.normal(size=(batch, 180)).astype(np.float32)
+        cases[f"predict_proba/sklearn/{batch}"] = lambda f=features: model.predict_proba(f)
+        cases[f"predict_proba/compact/{batch}"] = lambda f=features: compact.predict_proba(f)
+    return cases
+
+
+def endpoint_cases(flask_app):
+    client = flask_app.app.test_client()
+    counter = itertools.count()
+
+    def post(path, payload):
+        response = client.post(path, json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        return response.get_json()
+
+    # Unique texts, so /classify measures the upstream path and not the cache
+    # (the suite turns the near-duplicate index off in main)
+    chat_id = post("/respond", {"emotion": "Sad", "text": "I had a long day"})["chat_id"]
+    return {
+        "endpoint/classify": lambda: post("/classify", {"text": f"{SHORT_TEXT} ({next(counter)})"}),
+        "endpoint/respond": lambda: post("/respond", {"emotion": "Sad", "text": "I had a long day"}),
+        "endpoint/chat": lambda: post("/chat", {"chat_id": chat_id, "message": "Tell me more"}),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nAgainst {baseline_path} (commit {baseline.get('commit')}):")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before:
+            print(f"{name:>34}: throughput {result['throughput'] / before['throughput']:.2f}x, "
+                  f"p50 {before['p50_ms']:.3f} -> {result['p50_ms']:.3f} ms, "
+                  f"p99 {before['p99_ms']:.3f} -> {result['p99_ms']:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0, help="minimum time per case")
+    parser.add_argument("--min-calls", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="stand-in upstream delay (s)")
+    parser.add_argument("--concurrency", type=int, default=1, help="client threads for the endpoint cases")
+    parser.add_argument("--only", help="comma-separated groups: classifier,features,mlp,endpoints")
+    parser.add_argument("--out", help="write results to this JSON file")
+    parser.add_argument("--compare", help="print ratios against an earlier results file")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+    groups = set(args.only.split(",")) if args.only else {"classifier", "features", "mlp", "endpoints"}
+
+    # The app reads its configuration at import: point it at the stand-in,
+    # and keep its cache, conversations, metrics and rate limits out of the
+    # real ones. The numbered /classify texts are near-duplicates of each
+    # other, so the similarity index is off to keep them going upstream
+    standin = start_standin(latency=args.latency)
+    scratch = tempfile.mkdtemp(prefix="ora-bench-")
+    os.environ.update({
+        "OPENAI_API_KEY": "test",
+        "OPENAI_BASE_URL": standin.base_url,
+        "CLASSIFY_CACHE_PATH": os.path.join(scratch, "cache.sqlite3"),
+        "CONVERSATION_DB_PATH": os.path.join(scratch, "conversations.sqlite3"),
+        "METRICS_DIR": os.path.join(scratch, "metrics"),
+        "ADMISSION_DB_PATH": os.path.join(scratch, "admission.sqlite3"),
+        "CLASSIFY_SIMILARITY": "2",
+    })
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as flask_app
+
+    results = {}
+    for group, make_cases in (("classifier", lambda: classifier_cases(flask_app)), ("features", feature_cases),
+                              ("mlp", lambda: mlp_cases(scratch)), ("endpoints", lambda: endpoint_cases(flask_app))):
+        if group not in groups:
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            cases = make_cases()
+        for name, call in cases.items():
+            concurrency = args.concurrency if group == "endpoints" else 1
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = measure(call, args.seconds, args.min_calls, concurrency)
+            results[name] = result
+            print(f"{name:>34}: {result['throughput']:10.1f}/s  p50 {result['p50_ms']:8.3f} ms  "
+                  f"p99 {result['p99_ms']:8.3f} ms")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Circuit breaker for the OpenAI dependency.
+
+While the circuit is closed every call goes upstream and its outcome is
+recorded; a call that raised, or took longer than `slow_call_seconds`,
+counts as a failure. Once at least `min_calls` calls in the last `window`
+seconds have a failure rate of `failure_rate` or more, the circuit opens:
+allow() returns False and callers answer locally (the inferential
+classifier, the canned replies) at once, instead of each waiting out its
+own timeout. After `open_seconds` the circuit is half-open and lets one
+probe call through every `probe_interval` seconds. A successful probe
+closes the circuit; a failed one opens it again. allow() remembers the
+probe in the caller's context (thread or asyncio task), so while half-open
+only the latest probe's outcome counts, not that of calls that were already
+in flight when the circuit opened.
+
+Each process has its own breaker (see llm_client.get_breaker). The sync and
+async clients record their calls in it.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+
+from telemetry import count, log_event
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# The probe allow() granted to this thread or task, if any
+_probe = contextvars.ContextVar("breaker_probe", default=None)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_rate=0.5, min_calls=10, window=30.0, slow_call_seconds=10.0,
+                 open_seconds=30.0, probe_interval=5.0):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._calls = deque()  # (monotonic time, failed) within the window
+        self._failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._next_probe = 0.0
+        self._probe = None  # token of the latest probe, while half-open
+        self._counters = {"rejected": 0, "probes": 0, "opened": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            self._advance(time.monotonic())
+            return self._state
+
+    def _advance(self, now):
+        if self._state == OPEN and now >= self._opened_at + self.open_seconds:
+            self._transition(HALF_OPEN)
+            self._next_probe = now
+
+    def _transition(self, state):
+        self._state = state
+        count("ora_breaker_transitions_total", state)
+        if state == OPEN:
+            self._counters["opened"] += 1
+        log_event(logging.WARNING if state == OPEN else logging.INFO, "openai_circuit", state=state)
+
+    def allow(self):
+        """Whether a call may go upstream now."""
+        now = time.monotonic()
+        with self._lock:
+            self._advance(now)
+            if self._state == CLOSED:
+                _probe.set(None)
+                return True
+            if self._state == HALF_OPEN and now >= self._next_probe:
+                self._next_probe = now + self.probe_interval
+                self._counters["probes"] += 1
+                self._probe = object()
+                _probe.set(self._probe)
+                return True
+            self._counters["rejected"] += 1
+            return False
+
+    def record(self, ok, seconds):
+        """Record the outcome of a call that went upstream.
+
+        `ok` is None for a call its caller gave up on: it only counts, as a
+        failure, if it had already been slow. A probe given up on sooner
+        lets the next probe go at once.
+        """
+        failed = (ok is not None and not ok) or seconds > self.slow_call_seconds
+        probe = _probe.get()
+        now = time.monotonic()
+        with self._lock:
+            self._advance(now)
+            if self._state == HALF_OPEN:
+                if probe is None or probe is not self._probe:
+                    return  # not the probe: a call started before the circuit opened
+                self._probe = None
+                if ok is None and not failed:
+                    self._next_probe = now
+                elif failed:
+                    self._open(now)
+                else:
+                    self._reset()
+                    self._transition(CLOSED)
+                return
+            if self._state == OPEN or (ok is None and not failed):
+                return  # a call started before the circuit opened, or cut short
+            self._calls.append((now, failed))
+            self._failures += failed
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._failures -= self._calls.popleft()[1]
+            if len(self._calls) >= self.min_calls and self._failures >= self.failure_rate * len(self._calls):
+                self._open(now)
+
+    def _open(self, now):
+        self._reset()
+        self._opened_at = now
+        self._transition(OPEN)
+
+    def _reset(self):
+        self._calls.clear()
+        self._failures = 0
+
+    def stats(self):
+        with self._lock:
+            self._advance(time.monotonic())
+            result = dict(self._counters)
+            result.update(state=self._state, calls=len(self._calls), failures=self._failures)
+        return result
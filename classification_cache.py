@@ -0,0 +1,199 @@
+"""
+Classification result cache shared by every worker process.
+
+Entries live in a local SQLite database (WAL mode) so all gunicorn workers on
+the box see each other's results. Keys are a hash of the normalized text plus
+a namespace (model and prompt version), so changing either starts a fresh
+keyspace. Entries expire after `ttl` seconds and the least recently used ones
+are evicted once the table grows past `max_entries`. Hit/miss counters are
+stored in the same database so they cover all workers.
+
+A lookup only reads: counters are flushed in batches (BatchedCounters), an
+entry's LRU time is refreshed at most every `touch_interval` seconds, and
+the entry count is kept up to date by triggers instead of counted per write.
+
+Short-lived leases let workers coalesce identical upstream calls: the worker
+holding a text's lease asks the LLM, the others wait for the answer to show
+up in the cache.
+"""
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+
+from sqlite_store import BatchedCounters, SQLiteConnections
+from telemetry import log_event
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY, value TEXT NOT NULL,
+    created_at REAL NOT NULL, accessed_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at);
+CREATE INDEX IF NOT EXISTS cache_created ON cache (created_at);
+CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL);
+INSERT OR IGNORE INTO stats (name, value) SELECT 'entries', COUNT(*) FROM cache;
+CREATE TRIGGER IF NOT EXISTS cache_added AFTER INSERT ON cache
+    BEGIN UPDATE stats SET value = value + 1 WHERE name = 'entries'; END;
+CREATE TRIGGER IF NOT EXISTS cache_removed AFTER DELETE ON cache
+    BEGIN UPDATE stats SET value = value - 1 WHERE name = 'entries'; END;
+"""
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Lower-case and collapse whitespace so trivial variants share an entry."""
+    return _WHITESPACE.sub(" ", text.strip().lower())
+
+
+class ClassificationCache:
+    def __init__(self, path, namespace, max_entries=10000, ttl=3600, touch_interval=60):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self._connections = SQLiteConnections(path, SCHEMA)
+        self._counters = BatchedCounters(self._connections, "stats")
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _connect(self):
+        return self._connections.get()
+
+    def key(self, text):
+        payload = f"{self.namespace}\n{normalize_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, text):
+        """Return the cached value for `text`, or None on a miss."""
+        if not self.enabled:
+            return None
+        try:
+            conn = self._connect()
+            key, now = self.key(text), time.time()
+            row = conn.execute(
+                "SELECT value, created_at, accessed_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                # Expired entries are left for _evict, so a miss stays a read
+                self._counters.add("misses")
+                return None
+            if now - row[2] >= self.touch_interval:
+                conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._counters.add("hits")
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            log_event(logging.ERROR, "classification_cache_failed", operation="read", error=str(e))
+            return None
+
+    def peek(self, text):
+        """Like get, but without touching the counters or the LRU order."""
+        if not self.enabled:
+            return None
+        try:
+            row = self._connect().execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (self.key(text),)).fetchone()
+        except sqlite3.Error as e:
+            log_event(logging.ERROR, "classification_cache_failed", operation="read", error=str(e))
+            return None
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def acquire_lease(self, text, ttl):
+        """Claim the upstream call for `text` for up to `ttl` seconds.
+
+        Returns False while another worker holds an unexpired lease. Always
+        True when the cache is disabled or unavailable, since no one could
+        share the answer then.
+        """
+        if not self.enabled:
+            return True
+        try:
+            conn = self._connect()
+            key, now = self.key(text), time.time()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+                return conn.execute("INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)",
+                                    (key, now + ttl)).rowcount == 1
+        except sqlite3.Error as e:
+            log_event(logging.ERROR, "classification_cache_failed", operation="lease", error=str(e))
+            return True
+
+    def lease_held(self, text):
+        if not self.enabled:
+            return False
+        try:
+            row = self._connect().execute(
+                "SELECT expires_at FROM leases WHERE key = ?", (self.key(text),)).fetchone()
+        except sqlite3.Error as e:
+            log_event(logging.ERROR, "classification_cache_failed", operation="lease_check", error=str(e))
+            return False
+        return row is not None and row[0] >= time.time()
+
+    def release_lease(self, text):
+        if not self.enabled:
+            return
+        try:
+            self._connect().execute("DELETE FROM leases WHERE key = ?", (self.key(text),))
+        except sqlite3.Error as e:
+            log_event(logging.ERROR, "classification_cache_failed", operation="lease_release", error=str(e))
+
+    def put(self, text, value):
+        if not self.enabled:
+            return
+        try:
+            conn = self._connect()
+            now = time.time()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # An upsert, not INSERT OR REPLACE, so the size triggers see
+                # replacements as updates
+                conn.execute(
+                    "INSERT INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET value = excluded.value,"
+                    " created_at = excluded.created_at, accessed_at = excluded.accessed_at",
+                    (self.key(text), json.dumps(value), now, now),
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            log_event(logging.ERROR, "classification_cache_failed", operation="write", error=str(e))
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+        conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+        size = conn.execute("SELECT value FROM stats WHERE name = 'entries'").fetchone()[0]
+        excess = size - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN"
+                " (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            conn.execute(
+                "INSERT INTO stats (name, value) VALUES ('evictions', ?)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (excess,),
+            )
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size, across all workers."""
+        result = {"enabled": self.enabled, "hits": 0, "misses": 0, "evictions": 0, "size": 0,
+                  "max_entries": self.max_entries, "ttl": self.ttl}
+        if not self.enabled:
+            return result
+        try:
+            self._counters.flush()
+            for name, value in self._connect().execute("SELECT name, value FROM stats"):
+                result["size" if name == "entries" else name] = value
+        except sqlite3.Error as e:
+            log_event(logging.ERROR, "classification_cache_failed", operation="stats", error=str(e))
+        lookups = result["hits"] + result["misses"]
+        result["hit_rate"] = round(result["hits"] / lookups, 4) if lookups else 0.0
+        return result
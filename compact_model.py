@@ -0,0 +1,195 @@
+"""
+Pickle-free format and NumPy inference for the speech emotion MLP.
+
+export_model() writes an sklearn MLPClassifier's weights and biases, its
+activations, the label names and the feature scaler's mean and scale into an
+uncompressed .npz. CompactMLP memory-maps the arrays straight out of that
+file, so loading needs neither pickle nor sklearn, and every process serving
+the model shares one copy of the weights through the page cache.
+predict_proba() is the same forward pass as MLPClassifier's.
+
+The weights can also be stored at reduced precision: float16, or int8 with
+one scale per output unit. Reduced-precision files are 4-8x smaller and are
+evaluated in float32. NumPy has no fast float16 or int8 matrix product, so
+the weights are widened to float32 once, at load time.
+benchmarks/bench_quantized.py reports how far their predictions drift from
+the float64 model.
+
+The file records whether a scaler was folded in. One exported from a bare
+MLP, which was trained on unscaled features, loads with `scaled` False so
+the server can warn about it. `python train_model.py train --force` writes
+emotion_model.npz next to the retrained pickle; to export one by hand:
+
+    python -m compact_model trained_emotion_model.pkl label_encoder.pkl emotion_model.npz
+    python -m compact_model --precision int8 trained_emotion_model.pkl label_encoder.pkl emotion_model_int8.npz
+"""
+import zipfile
+
+import numpy as np
+
+FORMAT_VERSION = 1
+PRECISIONS = ("float64", "float16", "int8")
+
+
+def quantize_int8(weights):
+    """Symmetric per-output-unit int8 quantization: weights ~ q * scale."""
+    scale = np.abs(weights).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(weights / scale), -127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+def export_model(model, encoder, path, scaler=None, precision="float64"):
+    """Write `model` (an MLPClassifier) to `path`.
+
+    `encoder` maps the model's classes to label names. `scaler` is the
+    StandardScaler the training features went through, if any; it is folded
+    into the file so callers pass raw feature vectors. `model` may also be
+    the Pipeline(scaler, MLPClassifier) that train_model saves. `precision`
+    is one of PRECISIONS and applies to the weights.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {PRECISIONS}, not {precision!r}")
+    if hasattr(model, "steps"):
+        if len(model.steps) != 2:
+            raise ValueError("expected a Pipeline of a scaler and an MLPClassifier")
+        scaler, model = model[0], model[-1]
+    n_features = model.coefs_[0].shape[0]
+    mean = np.zeros(n_features) if scaler is None or scaler.mean_ is None else scaler.mean_
+    scale = np.ones(n_features) if scaler is None or scaler.scale_ is None else scaler.scale_
+    arrays = {
+        "format_version": np.array(FORMAT_VERSION),
+        "precision": np.array(precision),
+        "activation": np.array(model.activation),
+        "out_activation": np.array(model.out_activation_),
+        "labels": np.array([str(label) for label in encoder.inverse_transform(model.classes_)]),
+        "scaler_mean": np.asarray(mean, dtype=np.float64),
+        "scaler_scale": np.asarray(scale, dtype=np.float64),
+        "scaled": np.array(scaler is not None),
+    }
+    for i, (weights, bias) in enumerate(zip(model.coefs_, model.intercepts_)):
+        if precision == "int8":
+            arrays[f"W{i}"], arrays[f"W{i}_scale"] = quantize_int8(weights)
+        else:
+            arrays[f"W{i}"] = np.ascontiguousarray(weights, dtype=precision)
+        arrays[f"b{i}"] = np.ascontiguousarray(bias, dtype=np.float64)
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def _mmap_npz(path):
+    """Memory-map every array of an uncompressed .npz, by name."""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: {info.filename} is compressed")
+            # Local file header: 30 bytes plus the name and extra fields
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = np.frombuffer(f.read(4), dtype="<u2")
+            f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            arrays[info.filename[:-len(".npy")]] = np.memmap(
+                path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                order="F" if fortran_order else "C")
+    return arrays
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _logistic(x):
+    return np.divide(1.0, 1.0 + np.exp(-x), out=x)
+
+
+def _softmax(x):
+    x -= x.max(axis=1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=1, keepdims=True)
+    return x
+
+
+ACTIVATIONS = {
+    "identity": lambda x: x,
+    "relu": _relu,
+    "tanh": lambda x: np.tanh(x, out=x),
+    "logistic": _logistic,
+    "softmax": _softmax,
+}
+
+
+class CompactMLP:
+    def __init__(self, path):
+        arrays = _mmap_npz(path)
+        version = int(arrays["format_version"][()])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported model format version {version}")
+        self.precision = str(arrays["precision"][()])
+        self.dtype = np.float64 if self.precision == "float64" else np.float32
+        self.labels = [str(label) for label in arrays["labels"]]
+        self.mean = arrays["scaler_mean"].astype(self.dtype, copy=False)
+        self.scale = arrays["scaler_scale"].astype(self.dtype, copy=False)
+        if "scaled" in arrays:
+            self.scaled = bool(arrays["scaled"][()])
+        else:
+            # Files written before the flag: an identity scaler means there was none
+            self.scaled = not (np.all(self.mean == 0) and np.all(self.scale == 1))
+        n_layers = sum(1 for name in arrays if name.startswith("W") and name[1:].isdigit())
+        self.layers = []
+        for i in range(n_layers):
+            weights = arrays[f"W{i}"]
+            if self.precision == "int8":
+                weights = weights.astype(np.float32) * arrays[f"W{i}_scale"]
+            self.layers.append((weights.astype(self.dtype, copy=False),
+                                arrays[f"b{i}"].astype(self.dtype, copy=False)))
+        self.activation = ACTIVATIONS[str(arrays["activation"][()])]
+        self.out_activation = str(arrays["out_activation"][()])
+
+    def predict_proba(self, features):
+        """Class probabilities for raw feature vectors of shape (n, 180)."""
+        x = (np.asarray(features, dtype=self.dtype) - self.mean) / self.scale
+        for i, (weights, bias) in enumerate(self.layers):
+            x = x @ weights
+            x += bias
+            if i < len(self.layers) - 1:
+                x = self.activation(x)
+        if self.out_activation == "logistic":
+            # Binary classifier: one output unit for the positive class
+            p = _logistic(x)
+            return np.hstack([1 - p, p])
+        return ACTIVATIONS[self.out_activation](x)
+
+    def predict(self, features, batch_size=1024):
+        """Label names for feature vectors of shape (n, 180), `batch_size` rows
+        at a time so the activations stay small for large inputs."""
+        features = np.asarray(features)
+        top = np.concatenate([self.predict_proba(features[i:i + batch_size]).argmax(axis=1)
+                              for i in range(0, len(features), batch_size)] or [np.zeros(0, dtype=int)])
+        return [self.labels[i] for i in top]
+
+
+def main():
+    import argparse
+    import pickle
+
+    parser = argparse.ArgumentParser(description="Export a pickled MLPClassifier (or scaler + MLP pipeline) to the compact format")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float64")
+    parser.add_argument("model")
+    parser.add_argument("encoder")
+    parser.add_argument("output")
+    args = parser.parse_args()
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+    with open(args.encoder, "rb") as f:
+        encoder = pickle.load(f)
+    export_model(model, encoder, args.output, precision=args.precision)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Conversation stores for /respond and /chat sessions.
+
+Both backends evict sessions that have been idle longer than `ttl` seconds
+and, past `max_sessions`, the least recently used ones, so memory stays flat
+however long the server runs. Each session also keeps at most
+`max_messages` messages: the first (system) message plus the most recent
+turns.
+
+    memory  - per-process dict; only correct with a single worker
+    sqlite  - local SQLite file shared by every worker on the host (default)
+
+Messages are stored compactly as (role code, content) pairs, and in SQLite
+the chat id is kept as its 16 raw bytes. A session's last use is written at
+most every `touch_interval` seconds when it is only read. If the database
+cannot be used (busy past its timeout, unreadable), the SQLite store logs a
+warning and behaves as if the session were unknown, like the other SQLite
+stores, instead of failing the request.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlite_store import SQLiteConnections
+from telemetry import log_event
+
+ROLES = ("system", "user", "assistant")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+# Expired sessions are swept at most this often (seconds)
+SWEEP_INTERVAL = 30
+
+
+def pack(message):
+    return ROLE_CODES[message["role"]], message["content"]
+
+
+def unpack(role_code, content):
+    return {"role": ROLES[role_code], "content": content}
+
+
+class MemoryConversationStore:
+    def __init__(self, ttl=3600, max_sessions=10000, max_messages=100):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self._sessions = OrderedDict()  # chat_id -> (last_used, [(role_code, content), ...])
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def create(self, messages):
+        """Start a session holding `messages` and return its chat_id."""
+        chat_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._sessions[chat_id] = (now, [pack(m) for m in messages])
+            self._evict(now)
+        return chat_id
+
+    def get(self, chat_id):
+        """Return the session's messages, or None if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is None:
+                return None
+            if now - session[0] > self.ttl:
+                del self._sessions[chat_id]
+                self._evictions += 1
+                return None
+            self._sessions[chat_id] = (now, session[1])
+            self._sessions.move_to_end(chat_id)
+            return [unpack(*m) for m in session[1]]
+
+    def append(self, chat_id, messages):
+        """Add `messages` to a session. Returns False if the session is gone."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is None:
+                return False
+            packed = session[1] + [pack(m) for m in messages]
+            if self.max_messages and len(packed) > self.max_messages:
+                packed = packed[:1] + packed[len(packed) - self.max_messages + 1:]
+            self._sessions[chat_id] = (now, packed)
+            self._sessions.move_to_end(chat_id)
+            return True
+
+    def _evict(self, now):
+        # Sessions are ordered by last use, so expired ones are at the front
+        while self._sessions:
+            chat_id, (last_used, _) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[chat_id]
+            self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions), "evictions": self._evictions,
+                    "max_sessions": self.max_sessions, "ttl": self.ttl}
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    chat_id BLOB PRIMARY KEY, last_used REAL NOT NULL, next_seq INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id BLOB NOT NULL REFERENCES sessions (chat_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL, role INTEGER NOT NULL, content TEXT NOT NULL,
+    PRIMARY KEY (chat_id, seq)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+class SQLiteConversationStore:
+    def __init__(self, path, ttl=3600, max_sessions=10000, max_messages=100, touch_interval=60):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.touch_interval = touch_interval
+        self._connections = SQLiteConnections(path, SCHEMA)
+        self._last_sweep = 0.0
+
+    @staticmethod
+    def _key(chat_id):
+        try:
+            return uuid.UUID(hex=chat_id).bytes
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+    def create(self, messages):
+        """Start a session holding `messages` and return its chat_id, or None
+        if the database is unavailable."""
+        chat_id = uuid.uuid4()
+        now = time.time()
+        try:
+            conn = self._connections.get()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("INSERT INTO sessions (chat_id, last_used, next_seq) VALUES (?, ?, ?)",
+                             (chat_id.bytes, now, len(messages)))
+                conn.executemany("INSERT INTO messages (chat_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                                 [(chat_id.bytes, seq, *pack(m)) for seq, m in enumerate(messages)])
+            self._evict(conn, now)
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "conversation_store_failed", operation="create", error=str(e))
+            return None
+        return chat_id.hex
+
+    def get(self, chat_id):
+        key = self._key(chat_id)
+        if key is None:
+            return None
+        now = time.time()
+        try:
+            conn = self._connections.get()
+            row = conn.execute("SELECT last_used FROM sessions WHERE chat_id = ?", (key,)).fetchone()
+            if row is None or now - row[0] > self.ttl:
+                return None
+            if now - row[0] >= self.touch_interval:
+                conn.execute("UPDATE sessions SET last_used = ? WHERE chat_id = ?", (now, key))
+            return [unpack(role, content) for role, content in conn.execute(
+                "SELECT role, content FROM messages WHERE chat_id = ? ORDER BY seq", (key,))]
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "conversation_store_failed", operation="get", error=str(e))
+            return None
+
+    def append(self, chat_id, messages):
+        key = self._key(chat_id)
+        if key is None:
+            return False
+        now = time.time()
+        try:
+            conn = self._connections.get()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT next_seq FROM sessions WHERE chat_id = ?", (key,)).fetchone()
+                if row is None:
+                    return False
+                seq = row[0]
+                conn.executemany("INSERT INTO messages (chat_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                                 [(key, seq + i, *pack(m)) for i, m in enumerate(messages)])
+                conn.execute("UPDATE sessions SET last_used = ?, next_seq = ? WHERE chat_id = ?",
+                             (now, seq + len(messages), key))
+                if self.max_messages:
+                    # Keep the first (system) message and the newest turns
+                    conn.execute(
+                        "DELETE FROM messages WHERE chat_id = ? AND seq > 0 AND seq < ?",
+                        (key, seq + len(messages) - self.max_messages + 1),
+                    )
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "conversation_store_failed", operation="append", error=str(e))
+            return False
+        return True
+
+    def _evict(self, conn, now):
+        sweep = now - self._last_sweep >= SWEEP_INTERVAL
+        if sweep:
+            self._last_sweep = now
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            evicted = 0
+            if sweep:
+                evicted += conn.execute("DELETE FROM sessions WHERE last_used < ?", (now - self.ttl,)).rowcount
+            excess = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_sessions
+            if excess > 0:
+                evicted += conn.execute(
+                    "DELETE FROM sessions WHERE chat_id IN"
+                    " (SELECT chat_id FROM sessions ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                ).rowcount
+            if evicted:
+                conn.execute(
+                    "INSERT INTO stats (name, value) VALUES ('evictions', ?)"
+                    " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    (evicted,),
+                )
+
+    def stats(self):
+        result = {"backend": "sqlite", "sessions": 0, "evictions": 0,
+                  "max_sessions": self.max_sessions, "ttl": self.ttl}
+        try:
+            conn = self._connections.get()
+            evictions = conn.execute("SELECT value FROM stats WHERE name = 'evictions'").fetchone()
+            result["sessions"] = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            result["evictions"] = evictions[0] if evictions else 0
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "conversation_store_failed", operation="stats", error=str(e))
+        return result
+
+
+def make_conversation_store():
+    """Build the store selected by CONVERSATION_STORE (sqlite or memory)."""
+    settings = {
+        "ttl": float(os.getenv("CONVERSATION_TTL", "3600")),
+        "max_sessions": int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000")),
+        "max_messages": int(os.getenv("CONVERSATION_MAX_MESSAGES", "100")),
+    }
+    backend = os.getenv("CONVERSATION_STORE", "sqlite")
+    if backend == "memory":
+        return MemoryConversationStore(**settings)
+    if backend == "sqlite":
+        path = os.getenv("CONVERSATION_DB_PATH",
+                         os.path.join(tempfile.gettempdir(), "ora_conversations.sqlite3"))
+        return SQLiteConversationStore(path, **settings)
+    raise ValueError(f"Unknown CONVERSATION_STORE: {backend}")
@@ -0,0 +1,433 @@
+"""
+Keyword lexicon and single-pass matcher for the inferential emotion classifier.
+
+Every keyword, phrase, negation word and intensifier is compiled once at import
+into an Aho-Corasick automaton. Scoring a text takes one linear pass over it,
+which records where each term first and last starts, and the scores are then
+computed from those offsets. Matching keeps the original plain-substring
+semantics (e.g. "hit" also matches inside "white"), so scores are unchanged.
+
+`score_texts` scores many texts at once: the offsets are turned into a
+texts x features matrix and multiplied by a fixed feature x emotion weight
+matrix, so every emotion score for the batch comes out of one product.
+"""
+import numpy as np
+
+# Initial score counters for each emotion
+BASE_SCORES = {
+    "Happy": 0,
+    "Sad": 0,
+    "Angry": 0,
+    "Anxious": 0,
+    "Fearful": 0,
+    "Excited": 0,
+    "Neutral": 0.5,  # Slight bias for neutral as default
+    "Surprised": 0,
+    "Disgusted": 0,
+    "Confused": 0,
+    "Tired": 0,     # New category
+    "Hungry": 0     # New category
+}
+
+# Enhanced contextual detection patterns with additional categories
+EMOTION_PATTERNS = {
+    "Happy": [
+        "great", "wonderful", "fantastic", "amazing", "good", "love", "awesome",
+        "enjoy", "pleased", "delighted", "win", "success", "accomplished",
+        "birthday", "celebrate", "proud", "perfect", "beautiful", "sunshine",
+        "excited about", "looking forward", "can't wait", "fun"
+    ],
+    "Sad": [
+        "sad", "down", "unhappy", "depressed", "miserable", "hurt", "pain",
+        "lonely", "alone", "miss", "lost", "sorry", "regret", "cry", "tear",
+        "heartbroken", "disappointed", "grief", "upset", "funeral", "died",
+        "miss home", "homesick", "exhausted", "worn out"
+    ],
+    "Angry": [
+        "angry", "mad", "furious", "upset", "irritated", "annoyed", "frustrated",
+        "hate", "unfair", "ridiculous", "blame", "fault", "stupid", "idiot",
+        "terrible", "worst", "ruined", "horrible", "hell", "damn", "fed up",
+        "sick of", "tired of", "had enough"
+    ],
+    "Anxious": [
+        "anxious", "nervous", "worried", "stress", "pressure", "overwhelmed",
+        "afraid", "fear", "panic", "uncertain", "doubt", "risk", "concern",
+        "interview", "test", "exam", "deadline", "meeting", "presentation",
+        "want to go home", "need to leave", "can't stay", "have to go"
+    ],
+    "Tired": [
+        "tired", "exhausted", "sleepy", "fatigue", "drained", "no energy",
+        "worn out", "need sleep", "need rest", "need a break", "can't keep going",
+        "so tired", "want to sleep", "want to rest", "want to go home", "need to lie down",
+        "long day", "hard day", "ready for bed", "eyes heavy"
+    ],
+    "Hungry": [
+        "hungry", "starving", "need food", "want to eat", "need to eat", "food",
+        "haven't eaten", "stomach growling", "stomach rumbling", "need a meal",
+        "want a snack", "dinner", "lunch", "breakfast", "craving", "appetite"
+    ],
+    "Fearful": [
+        "scared", "terrified", "horrified", "danger", "threat", "attack",
+        "nightmare", "monster", "dark", "alone", "unknown", "help", "run", "hide",
+        "scream", "horror", "killer", "death", "dying", "terror", "emergency"
+    ],
+    "Excited": [
+        "excited", "thrilled", "eager", "looking forward", "cant wait", "anticipate",
+        "adventure", "fun", "party", "vacation", "holiday", "weekend", "opportunity",
+        "chance", "new", "start", "beginning", "future", "potential", "possibility"
+    ],
+    "Surprised": [
+        "surprised", "shocked", "unexpected", "wow", "whoa", "amazing", "unbelievable",
+        "incredible", "what", "how", "suddenly", "no way", "impossible", "cant believe",
+        "believe it", "really", "serious", "never thought", "never expected"
+    ],
+    "Disgusted": [
+        "disgusting", "gross", "sick", "nasty", "eww", "vomit", "rotten", "filthy",
+        "dirty", "ugly", "horrible", "worst", "unacceptable", "terrible", "creepy"
+    ],
+    "Confused": [
+        "confused", "unsure", "dont understand", "lost", "complicated", "complex",
+        "what do you mean", "unclear", "not sure", "dont get it", "strange",
+        "weird", "bizarre", "odd", "wonder", "question", "how", "why", "when",
+        "don't know why", "don't even know"
+    ],
+    "Neutral": [
+        "okay", "fine", "alright", "normal", "regular", "usual", "so-so", "meh"
+    ]
+}
+
+NEGATION_WORDS = ["not", "no", "never", "don't", "doesn't", "didn't", "isn't", "aren't", "wasn't", "weren't"]
+
+# Negating an emotion potentially increases its opposite
+NEGATION_OPPOSITES = {"Happy": "Sad", "Sad": "Happy", "Tired": "Excited", "Excited": "Tired"}
+
+# Special phrase handling
+PHRASE_SCORES = {
+    "want to go home": {"Tired": 2, "Anxious": 1},
+    "need to go home": {"Tired": 2, "Anxious": 1},
+    "long day": {"Tired": 2},
+    "so hungry": {"Hungry": 3},
+    "so tired": {"Tired": 3},
+    "don't know why": {"Confused": 2},
+    "don't even know": {"Confused": 2},
+    "just like really want": {"Anxious": 1.5, "Tired": 1},
+    "been a long day": {"Tired": 2.5},
+    "had a really long day": {"Tired": 3},
+    "feeling happy": {"Happy": 3},
+    "feeling sad": {"Sad": 3},
+    "feeling angry": {"Angry": 3},
+    "feeling tired": {"Tired": 3},
+    "feeling hungry": {"Hungry": 3},
+    "feeling anxious": {"Anxious": 3},
+    "feeling confused": {"Confused": 3},
+    "don't even know why": {"Confused": 3}
+}
+
+# Context-based inferences (beyond simple keyword matching): if any phrase of
+# a rule occurs, its boosts are applied once
+CONTEXT_RULES = [
+    # Life events
+    (["got a promotion", "graduated", "passed my test", "got the job", "won", "won the"],
+     {"Happy": 2, "Excited": 1}),
+    (["lost my", "broke up", "failed", "missed", "too late", "never get to"],
+     {"Sad": 2}),
+    (["deadline", "running late", "not enough time", "have to finish", "due tomorrow"],
+     {"Anxious": 2}),
+    # Physical symptoms
+    (["cant sleep", "heart racing", "shaking", "trembling", "sweat", "sweating"],
+     {"Anxious": 2, "Fearful": 1}),
+    (["yelled", "screamed", "threw", "broke", "hit", "slammed", "cursed"],
+     {"Angry": 2}),
+    # Specific for tiredness and hunger
+    (["need a nap", "could sleep for days", "barely keeping eyes open", "so sleepy"],
+     {"Tired": 3}),
+    (["stomach growling", "haven't eaten all day", "need to eat soon", "starving"],
+     {"Hungry": 3}),
+    # Weather and situational context
+    (["beautiful day", "sunny", "perfect weather", "lovely outside"],
+     {"Happy": 1}),
+    (["rainy", "dark", "gloomy", "alone in"],
+     {"Sad": 1}),
+]
+
+# Intensity markers
+INTENSIFIERS = ["very", "really", "extremely", "so", "totally", "absolutely", "completely", "utterly", "super"]
+INTENSIFIER_STEP = 0.2
+
+# Base intensity for each emotion
+BASE_INTENSITIES = {
+    "Happy": 60, "Excited": 70, "Surprised": 40,  # Positive emotions
+    "Neutral": 0,  # Neutral
+    "Sad": -60, "Angry": -70, "Anxious": -40, "Tired": -30, "Hungry": -20,
+    "Fearful": -50, "Disgusted": -60, "Confused": -20  # Negative emotions
+}
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over a fixed list of terms.
+
+    `scan` walks the text once and returns, per term id, the offset where the
+    term first starts and the offset where it last starts (-1 if absent).
+    """
+
+    def __init__(self, terms):
+        self.terms = list(terms)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for term_id, term in enumerate(self.terms):
+            state = 0
+            for ch in term:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((term_id, len(term)))
+
+        # Breadth-first pass to fill failure links and merge outputs
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def scan(self, text):
+        first = [-1] * len(self.terms)
+        last = [-1] * len(self.terms)
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for term_id, length in out[state]:
+                start = i - length + 1
+                if first[term_id] < 0:
+                    first[term_id] = start
+                last[term_id] = start
+        return first, last
+
+
+def _compile():
+    term_ids = {}
+
+    def intern(term):
+        if term not in term_ids:
+            term_ids[term] = len(term_ids)
+        return term_ids[term]
+
+    pattern_ids = [(emotion, intern(keyword))
+                   for emotion, keywords in EMOTION_PATTERNS.items()
+                   for keyword in keywords]
+    negation_ids = [intern(word) for word in NEGATION_WORDS]
+    phrase_ids = [(intern(phrase), emotion_scores)
+                  for phrase, emotion_scores in PHRASE_SCORES.items()]
+    context_ids = [([intern(phrase) for phrase in phrases], boosts)
+                   for phrases, boosts in CONTEXT_RULES]
+    intensifier_ids = [intern(word) for word in INTENSIFIERS]
+
+    automaton = KeywordAutomaton(term_ids)
+    return automaton, pattern_ids, negation_ids, phrase_ids, context_ids, intensifier_ids
+
+
+(AUTOMATON, _PATTERN_IDS, _NEGATION_IDS, _PHRASE_IDS,
+ _CONTEXT_IDS, _INTENSIFIER_IDS) = _compile()
+
+EMOTIONS = list(BASE_SCORES)
+
+
+def _build_weights():
+    """Weight matrix for the batch scorer.
+
+    Feature columns are: a bias, one presence flag per term, one negation
+    count per term (how many negation words occur at or before its last
+    occurrence), one flag per context rule, and four tone flags.
+    All weights are multiples of 0.5, so the product is exact in float64.
+    """
+    n_terms = len(AUTOMATON.terms)
+    col = {emotion: j for j, emotion in enumerate(EMOTIONS)}
+
+    bias = np.array([[BASE_SCORES[e] for e in EMOTIONS]], dtype=np.float64)
+    presence = np.zeros((n_terms, len(EMOTIONS)))
+    negated = np.zeros((n_terms, len(EMOTIONS)))
+    for emotion, term_id in _PATTERN_IDS:
+        presence[term_id, col[emotion]] += 1
+        negated[term_id, col[emotion]] -= 1
+        opposite = NEGATION_OPPOSITES.get(emotion)
+        if opposite:
+            negated[term_id, col[opposite]] += 0.5
+    for term_id, emotion_scores in _PHRASE_IDS:
+        for emotion, score in emotion_scores.items():
+            presence[term_id, col[emotion]] += score
+
+    context = np.zeros((len(_CONTEXT_IDS), len(EMOTIONS)))
+    for rule, (_, boosts) in enumerate(_CONTEXT_IDS):
+        for emotion, boost in boosts.items():
+            context[rule, col[emotion]] += boost
+
+    tone = np.zeros((4, len(EMOTIONS)))
+    tone[0, [col["Excited"], col["Happy"], col["Surprised"]]] = [2, 1, 1]  # 3+ "!"
+    tone[1, [col["Excited"], col["Happy"]]] = [1, 0.5]                     # 1-2 "!"
+    tone[2, [col["Confused"], col["Anxious"]]] = [2, 1]                    # 3+ "?"
+    tone[3, col["Confused"]] = 0.5                                         # 1-2 "?"
+
+    membership = np.zeros((n_terms, len(_CONTEXT_IDS)), dtype=np.int64)
+    for rule, (term_ids, _) in enumerate(_CONTEXT_IDS):
+        membership[term_ids, rule] = 1
+
+    return np.vstack([bias, presence, negated, context, tone]), membership
+
+
+WEIGHTS, _CONTEXT_MEMBERSHIP = _build_weights()
+_BASE_INTENSITY_VECTOR = np.array([BASE_INTENSITIES[e] for e in EMOTIONS], dtype=np.float64)
+
+# Boost per number of intensifiers, summed step by step like score_text does
+_BOOST_TABLE = [0]
+for _ in INTENSIFIERS:
+    _BOOST_TABLE.append(_BOOST_TABLE[-1] + INTENSIFIER_STEP)
+_BOOST_TABLE = np.array(_BOOST_TABLE, dtype=np.float64)
+
+
+def matched_terms(text):
+    """The lexicon terms (keywords, phrases, negations, intensifiers) that
+    occur in `text`, with the same substring semantics as score_text."""
+    first, _ = AUTOMATON.scan(text.lower())
+    return {term for term, start in zip(AUTOMATON.terms, first) if start >= 0}
+
+
+def score_text(text):
+    """Score `text` against the lexicon.
+
+    Returns `(emotion, intensity, scores)` where `scores` holds the raw score
+    for every emotion.
+    """
+    first, last = AUTOMATON.scan(text.lower())
+    scores = dict(BASE_SCORES)
+
+    # Check for emotion keywords in the text
+    matched = [(emotion, term_id) for emotion, term_id in _PATTERN_IDS if first[term_id] >= 0]
+    for emotion, _ in matched:
+        scores[emotion] += 1
+
+    # Handle negations: a keyword is negated when it occurs at or after the
+    # first occurrence of a negation word
+    for negation_id in _NEGATION_IDS:
+        negation_idx = first[negation_id]
+        if negation_idx < 0:
+            continue
+        for emotion, term_id in matched:
+            if last[term_id] >= negation_idx:
+                scores[emotion] -= 1
+                opposite = NEGATION_OPPOSITES.get(emotion)
+                if opposite:
+                    scores[opposite] += 0.5
+
+    for term_id, emotion_scores in _PHRASE_IDS:
+        if first[term_id] >= 0:
+            for emotion, score in emotion_scores.items():
+                scores[emotion] += score
+
+    for term_ids, boosts in _CONTEXT_IDS:
+        if any(first[term_id] >= 0 for term_id in term_ids):
+            for emotion, boost in boosts.items():
+                scores[emotion] += boost
+
+    # Tone indicators
+    exclamation_count = text.count("!")
+    if exclamation_count >= 3:
+        scores["Excited"] += 2
+        scores["Happy"] += 1
+        scores["Surprised"] += 1
+    elif exclamation_count >= 1:
+        scores["Excited"] += 1
+        scores["Happy"] += 0.5
+
+    question_count = text.count("?")
+    if question_count >= 3:
+        scores["Confused"] += 2
+        scores["Anxious"] += 1
+    elif question_count >= 1:
+        scores["Confused"] += 0.5
+
+    intensity_boost = 0
+    for term_id in _INTENSIFIER_IDS:
+        if first[term_id] >= 0:
+            intensity_boost += INTENSIFIER_STEP
+
+    # Apply intensity boost to the highest emotions
+    if intensity_boost > 0:
+        top_emotions = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:2]
+        for emotion, _ in top_emotions:
+            scores[emotion] += intensity_boost
+
+    # If no strong emotion detected, strengthen neutral
+    if max(scores.values()) < 1:
+        scores["Neutral"] = 2
+
+    # Find the predominant emotion
+    emotion = max(scores, key=scores.get)
+
+    # Adjust intensity based on score strength
+    score_factor = min(2.0, scores[emotion]) / 2.0  # Cap at 2.0 to avoid extremes
+    intensity = int(BASE_INTENSITIES[emotion] * score_factor * 1.2)  # Scale up slightly
+
+    # Ensure intensity is within bounds
+    intensity = max(-100, min(100, intensity))
+
+    return emotion, intensity, scores
+
+
+def score_texts(texts):
+    """Vectorized `score_text` for a list of texts.
+
+    Returns a list of `(emotion, intensity)` tuples in input order, equal to
+    what `score_text` returns for each text.
+    """
+    n = len(texts)
+    if n == 0:
+        return []
+
+    offsets = [AUTOMATON.scan(text.lower()) for text in texts]
+    first = np.array([f for f, _ in offsets], dtype=np.int64)
+    last = np.array([l for _, l in offsets], dtype=np.int64)
+
+    present = first >= 0
+    negation_first = first[:, _NEGATION_IDS][:, None, :]
+    negated = ((negation_first >= 0) & (negation_first <= last[:, :, None])).sum(axis=2)
+    context = (present.astype(np.int64) @ _CONTEXT_MEMBERSHIP) > 0
+
+    exclamations = np.array([text.count("!") for text in texts])
+    questions = np.array([text.count("?") for text in texts])
+    tone = np.column_stack([
+        exclamations >= 3, (exclamations >= 1) & (exclamations < 3),
+        questions >= 3, (questions >= 1) & (questions < 3),
+    ])
+
+    features = np.hstack([np.ones((n, 1)), present, negated, context, tone]).astype(np.float64)
+    scores = features @ WEIGHTS
+
+    # Apply intensity boost to the two highest emotions
+    rows = np.arange(n)
+    boost = _BOOST_TABLE[present[:, _INTENSIFIER_IDS].sum(axis=1)]
+    top_two = np.argsort(-scores, axis=1, kind="stable")[:, :2]
+    scores[rows, top_two[:, 0]] += boost
+    scores[rows, top_two[:, 1]] += boost
+
+    # If no strong emotion detected, strengthen neutral
+    scores[scores.max(axis=1) < 1, EMOTIONS.index("Neutral")] = 2
+
+    best = scores.argmax(axis=1)
+    score_factor = np.minimum(2.0, scores[rows, best]) / 2.0
+    intensities = np.trunc(_BASE_INTENSITY_VECTOR[best] * score_factor * 1.2)
+    intensities = np.clip(intensities, -100, 100).astype(int)
+
+    return [(EMOTIONS[b], int(i)) for b, i in zip(best, intensities)]
@@ -0,0 +1,103 @@
+"""
+On-disk cache of per-file audio feature vectors for the training pipeline.
+
+Each WAV's 180-dim vector is stored as its own .npy file, named by a hash of
+the file's absolute path, size and mtime plus the feature configuration, so
+an edited or replaced file, or a change to the extractor, misses the cache
+and everything else is read back instead of recomputed. Entries are written
+to a temporary file and renamed into place, so pool processes and concurrent
+runs can share a cache directory.
+
+extract_files() fans the misses out over a process pool.
+"""
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import audio_features
+
+# Bump when the features change in a way the constants below do not capture
+EXTRACTOR_VERSION = 1
+FEATURE_CONFIG = (
+    f"v{EXTRACTOR_VERSION} sr={audio_features.TARGET_SAMPLE_RATE} n_fft={audio_features.N_FFT} "
+    f"hop={audio_features.HOP_LENGTH} mfcc={audio_features.N_MFCC} chroma={audio_features.N_CHROMA} "
+    f"mels={audio_features.N_MELS}"
+)
+
+
+class FeatureCache:
+    def __init__(self, directory, config=FEATURE_CONFIG):
+        self.directory = directory
+        self.config = config
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, path):
+        stat = os.stat(path)
+        payload = f"{self.config}\n{os.path.abspath(path)}\n{stat.st_size}\n{stat.st_mtime_ns}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, key):
+        try:
+            return np.load(self._path(key), mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key, features):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.asarray(features, dtype=np.float32))
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def extract_file(path):
+    """The feature vector for one audio file, loaded at 44.1 kHz as in training."""
+    import librosa
+
+    audio, sample_rate = librosa.load(path, sr=audio_features.TARGET_SAMPLE_RATE)
+    return audio_features.extract_feature(audio, sample_rate)
+
+
+def extract_files(paths, cache=None, workers=None):
+    """Feature vectors for `paths`, as an (n, 180) array in the same order.
+
+    Files found in `cache` are read from it; the rest are extracted in a pool
+    of `workers` processes (default: one per CPU) and added to it.
+    """
+    features = np.empty((len(paths), audio_features.FEATURE_SIZE), dtype=np.float32)
+    keys = [cache.key(path) for path in paths] if cache is not None else [None] * len(paths)
+    missing = []
+    for i, key in enumerate(keys):
+        cached = cache.get(key) if cache is not None else None
+        if cached is None:
+            missing.append(i)
+        else:
+            features[i] = cached
+
+    if missing:
+        todo = [paths[i] for i in missing]
+        workers = min(workers or os.cpu_count() or 1, len(todo))
+        if workers == 1:
+            _store(features, missing, keys, map(extract_file, todo), cache)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, len(todo) // (workers * 4))
+                _store(features, missing, keys, pool.map(extract_file, todo, chunksize=chunksize), cache)
+    print(f"Features: {len(paths) - len(missing)} cached, {len(missing)} extracted")
+    return features
+
+
+def _store(features, indices, keys, results, cache):
+    for i, vector in zip(indices, results):
+        features[i] = vector
+        if cache is not None:
+            cache.put(keys[i], vector)
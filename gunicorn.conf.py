@@ -0,0 +1,12 @@
+"""
+gunicorn settings read from the working directory (`gunicorn app:app` or
+`gunicorn asgi:app -k uvicorn.workers.UvicornWorker`).
+"""
+
+
+def on_starting(server):
+    # Metrics files from a previous master would carry its counters into
+    # this deploy; see telemetry.py
+    from telemetry import reset_metrics
+
+    reset_metrics()
@@ -0,0 +1,400 @@
+"""
+Process-wide client for the OpenAI chat-completions API.
+
+One `requests.Session` per worker process keeps HTTP connections alive and
+pooled between requests, instead of building a new client (and a new TLS
+connection) for every call. Calls use explicit connect/read timeouts and
+retry transient failures with full-jitter exponential backoff.
+
+The client is created lazily on first use in each process and is dropped in
+the child after fork(), so gunicorn workers never share a parent's sockets.
+Point OPENAI_BASE_URL at a local stand-in server (see
+benchmarks/openai_standin.py) to run without network access.
+
+`AsyncLLMClient` is the asyncio counterpart used by the ASGI serving mode
+(asgi.py); it also caps the number of in-flight upstream calls.
+
+Both clients record each call's outcome and latency in the process's
+circuit breaker (get_breaker()); callers check it before calling. Transport
+errors, timeouts, 5xx and 429 count as failures; other 4xx mean upstream
+answered, so they count as successes.
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import CircuitBreaker
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# Connections per httpx pool in AsyncLLMClient
+POOL_SHARD_SIZE = 16
+
+
+class LLMError(Exception):
+    """Raised when a chat completion cannot be obtained.
+
+    `status` is the HTTP status upstream answered with, or None if it did
+    not answer.
+    """
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def upstream_failed(status):
+    """Whether an HTTP status says upstream is unhealthy, rather than that
+    the request was refused."""
+    return status >= 500 or status in (408, 429)
+
+
+def backoff_delay(attempt, base, cap, retry_after=None):
+    """Full-jitter exponential backoff, or the server's Retry-After if given."""
+    if retry_after is not None:
+        return min(cap, retry_after)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(headers):
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def completion_content(body):
+    """Return the stripped content of the first choice of a completion body."""
+    try:
+        return body["choices"][0]["message"]["content"].strip()
+    except (KeyError, IndexError, TypeError, AttributeError) as e:
+        raise LLMError(f"Malformed completion response: {e}")
+
+
+def completion_payload(messages, model, temperature, max_tokens, stream=False):
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+STREAM_DONE = object()
+
+
+def parse_stream_line(line):
+    """Parse one line of a streamed completion.
+
+    Returns the content delta (possibly ""), STREAM_DONE at the end of the
+    stream, or None for lines that carry no data.
+    """
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return STREAM_DONE
+    try:
+        return json.loads(data)["choices"][0].get("delta", {}).get("content") or ""
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+        raise LLMError(f"Malformed stream chunk: {e}")
+
+
+class LLMClient:
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, connect_timeout=3.05, read_timeout=20.0,
+                 max_retries=2, backoff_base=0.25, backoff_cap=4.0, pool_size=10):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+
+    def post(self, path, payload, timeout=None, stream=False):
+        """POST `payload` to the API, retrying transient failures.
+
+        Returns the successful `requests.Response`.
+        """
+        start, ok = time.monotonic(), False
+        try:
+            resp = self._post(path, payload, timeout, stream)
+            ok = True
+            return resp
+        except LLMError as e:
+            ok = e.status is not None and not upstream_failed(e.status)
+            raise
+        finally:
+            get_breaker().record(ok, time.monotonic() - start)
+
+    def _post(self, path, payload, timeout, stream):
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                resp = self.session.post(url, json=payload, timeout=timeout or self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = LLMError(f"{type(e).__name__}: {e}")
+            else:
+                if resp.status_code < 400:
+                    return resp
+                error = LLMError(f"HTTP {resp.status_code}: {resp.text[:200]}", status=resp.status_code)
+                if resp.status_code not in RETRY_STATUSES:
+                    raise error
+                retry_after = parse_retry_after(resp.headers)
+                resp.close()
+            if attempt < self.max_retries:
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap, retry_after))
+        raise error
+
+    def chat_completion(self, messages, model, temperature=0.7, max_tokens=60, timeout=None):
+        """Return the stripped content of the first choice."""
+        resp = self.post("chat/completions", completion_payload(messages, model, temperature, max_tokens),
+                         timeout=timeout)
+        try:
+            body = resp.json()
+        except ValueError as e:
+            raise LLMError(f"Malformed completion response: {e}")
+        return completion_content(body)
+
+    def stream_chat_completion(self, messages, model, temperature=0.7, max_tokens=60):
+        """Yield content deltas of a streamed completion as they arrive."""
+        resp = self.post("chat/completions",
+                         completion_payload(messages, model, temperature, max_tokens, stream=True),
+                         stream=True)
+        with resp:
+            # chunk_size=None yields each chunk as soon as it arrives
+            for line in resp.iter_lines(chunk_size=None):
+                delta = parse_stream_line(line.decode("utf-8"))
+                if delta is STREAM_DONE:
+                    return
+                if delta:
+                    yield delta
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncLLMClient:
+    """asyncio client with the same pooling, timeout and retry behaviour.
+
+    At most `max_concurrency` upstream calls are in flight per process; extra
+    callers wait for a slot (callers bound the wait with their own deadline).
+    """
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, connect_timeout=3.05, read_timeout=20.0,
+                 max_retries=2, backoff_base=0.25, backoff_cap=4.0, pool_size=100, max_concurrency=100):
+        import httpx  # only needed for the ASGI serving mode
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # httpcore's pool does O(waiting requests x connections) work on every
+        # release, which dominates CPU with ~100 connections in one pool, so
+        # connections are spread over several small pools used round-robin
+        shards = max(1, -(-pool_size // POOL_SHARD_SIZE))
+        self._pools = [self._make_pool(httpx, api_key, base_url, connect_timeout, read_timeout,
+                                       -(-pool_size // shards))
+                       for _ in range(shards)]
+        self._next_pool = 0
+        self._transient = (httpx.TransportError,)
+
+    @staticmethod
+    def _make_pool(httpx, api_key, base_url, connect_timeout, read_timeout, size):
+        # httpx writes headers and body separately; without TCP_NODELAY the
+        # body stalls behind Nagle on reused keep-alive connections
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+            socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)],
+        )
+        return httpx.AsyncClient(
+            base_url=base_url.rstrip("/") + "/",
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=transport,
+        )
+
+    def _pool(self):
+        self._next_pool = (self._next_pool + 1) % len(self._pools)
+        return self._pools[self._next_pool]
+
+    async def post(self, path, payload):
+        start, ok = time.monotonic(), False
+        try:
+            resp = await self._post(path, payload)
+            ok = True
+            return resp
+        except LLMError as e:
+            ok = e.status is not None and not upstream_failed(e.status)
+            raise
+        except asyncio.CancelledError:
+            # Cut off by the caller's deadline, or the client went away. Only
+            # a call that had already run slow says anything about upstream.
+            ok = None
+            raise
+        finally:
+            get_breaker().record(ok, time.monotonic() - start)
+
+    async def _post(self, path, payload):
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                try:
+                    resp = await self._pool().post(path.lstrip("/"), json=payload)
+                except self._transient as e:
+                    error = LLMError(f"{type(e).__name__}: {e}")
+                else:
+                    if resp.status_code < 400:
+                        return resp
+                    error = LLMError(f"HTTP {resp.status_code}: {resp.text[:200]}", status=resp.status_code)
+                    if resp.status_code not in RETRY_STATUSES:
+                        raise error
+                    retry_after = parse_retry_after(resp.headers)
+                if attempt < self.max_retries:
+                    await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap, retry_after))
+            raise error
+
+    async def chat_completion(self, messages, model, temperature=0.7, max_tokens=60):
+        resp = await self.post("chat/completions", completion_payload(messages, model, temperature, max_tokens))
+        try:
+            body = resp.json()
+        except ValueError as e:
+            raise LLMError(f"Malformed completion response: {e}")
+        return completion_content(body)
+
+    async def stream_chat_completion(self, messages, model, temperature=0.7, max_tokens=60):
+        """Yield content deltas of a streamed completion as they arrive.
+
+        Streams are not retried once started, since tokens may already have
+        been forwarded to the browser.
+        """
+        payload = completion_payload(messages, model, temperature, max_tokens, stream=True)
+        async with self._semaphore:
+            # The outcome is recorded when the headers arrive, so a long
+            # stream of tokens does not count as a slow call
+            start, ok, recorded = time.monotonic(), False, False
+            try:
+                async with self._pool().stream("POST", "chat/completions", json=payload) as resp:
+                    get_breaker().record(resp.status_code < 400 or not upstream_failed(resp.status_code),
+                                         time.monotonic() - start)
+                    recorded = True
+                    if resp.status_code >= 400:
+                        await resp.aread()
+                        raise LLMError(f"HTTP {resp.status_code}: {resp.text[:200]}", status=resp.status_code)
+                    async for line in resp.aiter_lines():
+                        delta = parse_stream_line(line)
+                        if delta is STREAM_DONE:
+                            return
+                        if delta:
+                            yield delta
+            except self._transient as e:
+                raise LLMError(f"{type(e).__name__}: {e}")
+            except asyncio.CancelledError:
+                ok = None
+                raise
+            finally:
+                if not recorded:
+                    get_breaker().record(ok, time.monotonic() - start)
+
+    async def aclose(self):
+        for pool in self._pools:
+            await pool.aclose()
+
+
+def _settings():
+    return {
+        "api_key": os.getenv("OPENAI_API_KEY", ""),
+        "base_url": os.getenv("OPENAI_BASE_URL", DEFAULT_BASE_URL),
+        "connect_timeout": float(os.getenv("OPENAI_CONNECT_TIMEOUT", "3.05")),
+        "read_timeout": float(os.getenv("OPENAI_READ_TIMEOUT", "20")),
+        "max_retries": int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+    }
+
+
+_client = None
+_async_client = None
+_breaker = None
+_client_lock = threading.Lock()
+
+
+def get_breaker():
+    """Return this process's circuit breaker for upstream calls."""
+    global _breaker
+    if _breaker is None:
+        with _client_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failure_rate=float(os.getenv("BREAKER_FAILURE_RATE", "0.5")),
+                    min_calls=int(os.getenv("BREAKER_MIN_CALLS", "10")),
+                    window=float(os.getenv("BREAKER_WINDOW", "30")),
+                    slow_call_seconds=float(os.getenv("BREAKER_SLOW_CALL", "10")),
+                    open_seconds=float(os.getenv("BREAKER_OPEN_SECONDS", "30")),
+                    probe_interval=float(os.getenv("BREAKER_PROBE_INTERVAL", "5")),
+                )
+    return _breaker
+
+
+def get_client():
+    """Return this process's shared LLMClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(pool_size=int(os.getenv("OPENAI_POOL_SIZE", "10")), **_settings())
+    return _client
+
+
+def get_async_client():
+    """Return this process's shared AsyncLLMClient, creating it on first use.
+
+    Must be called from the event loop that will use it.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncLLMClient(
+            pool_size=int(os.getenv("OPENAI_ASYNC_POOL_SIZE", "100")),
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "100")),
+            **_settings()
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def _reset_after_fork():
+    # The parent's pooled sockets must not be shared with a forked worker
+    global _client, _async_client, _breaker, _client_lock
+    _client = None
+    _async_client = None
+    _breaker = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,156 @@
+"""
+Micro-batching of concurrent calls into one upstream request.
+
+Callers submit single items; a collector waits up to `window` seconds (or
+until `max_batch` items are queued) and hands the whole batch to `handler`,
+which must return one result per item, in order. Each caller's future then
+resolves to its own result. If the handler raises or returns the wrong
+number of results, every item in the batch resolves to None so callers can
+fall back individually.
+
+`MicroBatcher` is for sync workers (a collector thread per process);
+`AsyncMicroBatcher` is its asyncio counterpart for the ASGI mode.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from telemetry import log_event
+
+
+def _split_results(results, count, name):
+    if results is None:
+        return [None] * count
+    if len(results) != count:
+        log_event(logging.ERROR, "microbatch_wrong_length", batcher=name, expected=count, got=len(results))
+        return [None] * count
+    return results
+
+
+class MicroBatcher:
+    def __init__(self, handler, max_batch=8, window=0.005, max_inflight=8, name="micro-batch"):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.window = window
+        self.max_inflight = max_inflight
+        self.name = name
+        self._lock = threading.Lock()
+        self._pid = None
+        self._counters = {"items": 0, "batches": 0, "failed_batches": 0}
+
+    def _start(self):
+        # Threads do not survive fork(), so each worker process starts its own
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.SimpleQueue()
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_inflight,
+                                                        thread_name_prefix=self.name)
+                    threading.Thread(target=self._collect, args=(self._queue,), daemon=True).start()
+                    self._pid = os.getpid()
+
+    def submit(self, item):
+        """Queue `item` and return a Future for its result."""
+        self._start()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self, pending):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.handler(items)
+        except Exception as e:
+            log_event(logging.ERROR, "microbatch_failed", batcher=self.name, items=len(items),
+                      error=f"{type(e).__name__}: {e}")
+            results = None
+        self._record(len(items), results is None)
+        for (_, future), result in zip(batch, _split_results(results, len(items), self.name)):
+            if future.set_running_or_notify_cancel():
+                future.set_result(result)
+
+    def _record(self, size, failed):
+        with self._lock:
+            self._counters["items"] += size
+            self._counters["batches"] += 1
+            self._counters["failed_batches"] += failed
+
+    def stats(self):
+        """Counters for this process; items / batches is the mean batch size."""
+        with self._lock:
+            result = dict(self._counters)
+        result["mean_batch_size"] = round(result["items"] / result["batches"], 2) if result["batches"] else 0.0
+        result.update(max_batch=self.max_batch, window_ms=self.window * 1000)
+        return result
+
+
+class AsyncMicroBatcher(MicroBatcher):
+    """asyncio MicroBatcher; `handler` is a coroutine function.
+
+    The collector task is started on first use, on the caller's event loop.
+    """
+
+    def __init__(self, handler, max_batch=8, window=0.005, name="micro-batch"):
+        super().__init__(handler, max_batch=max_batch, window=window, name=name)
+        self._collector = None
+        self._dispatches = set()
+
+    def submit(self, item):
+        loop = asyncio.get_running_loop()
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._collector = loop.create_task(self._collect(self._queue))
+        future = loop.create_future()
+        self._queue.put_nowait((item, future))
+        return future
+
+    async def _collect(self, pending):
+        while True:
+            batch = [await pending.get()]
+            deadline = time.monotonic() + self.window
+            # Poll rather than wait_for(pending.get()): a get cancelled by the
+            # timeout can drop an item it had already dequeued
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(pending.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(remaining, 0.001))
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = await self.handler(items)
+        except Exception as e:
+            log_event(logging.ERROR, "microbatch_failed", batcher=self.name, items=len(items),
+                      error=f"{type(e).__name__}: {e}")
+            results = None
+        self._record(len(items), results is None)
+        for (_, future), result in zip(batch, _split_results(results, len(items), self.name)):
+            if not future.done():
+                future.set_result(result)
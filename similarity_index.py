@@ -0,0 +1,226 @@
+"""
+Near-duplicate lookup over earlier LLM classifications.
+
+Speech transcripts of the same thought rarely match exactly ("I'm so tired",
+"im so tired today"), so the exact-text cache misses them and each variant
+costs an upstream call. This index finds a previously classified text that
+is similar enough to reuse its {"emotion", "intensity"}.
+
+Texts are normalized (lower case, punctuation dropped) and reduced to
+shingles: their words and adjacent word pairs. Each text gets a MinHash
+signature of NUM_PERM values, split into BANDS bands; texts sharing any band
+are candidates, and the best candidate whose estimated Jaccard similarity
+reaches `threshold` is a hit. Word shingles rather than character n-grams:
+on short utterances character n-grams rate "so angry" and "so hungry" as
+closer than "so tired" and "so tired today". The emotion lexicon terms a
+text contains (keywords, phrases, negations, intensifiers; see
+emotion_lexicon.matched_terms) and the emotion names it uses are part of
+every band key, so two texts only match when they carry the same emotional
+evidence: "not tired" never matches "tired", nor "I feel happy" "I feel
+sad", however long the rest of the sentence.
+
+Like ClassificationCache, entries live in a SQLite database shared by all
+workers, expire after `ttl` seconds and are evicted least recently used past
+`max_entries`, and lookups stay reads in the same way (batched counters,
+coarse LRU times, a trigger-maintained size). Only signatures are stored,
+never the texts.
+"""
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+from classification_cache import normalize_text
+from emotion_lexicon import EMOTIONS, NEGATION_WORDS, matched_terms
+from sqlite_store import BatchedCounters, SQLiteConnections
+from telemetry import count, log_event
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS similar_entries (
+    key TEXT PRIMARY KEY, signature BLOB NOT NULL, value TEXT NOT NULL,
+    created_at REAL NOT NULL, accessed_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS similar_entries_accessed ON similar_entries (accessed_at);
+CREATE TABLE IF NOT EXISTS similar_bands (
+    band INTEGER NOT NULL,
+    key TEXT NOT NULL REFERENCES similar_entries (key) ON DELETE CASCADE,
+    PRIMARY KEY (band, key)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS similar_bands_key ON similar_bands (key);
+CREATE INDEX IF NOT EXISTS similar_entries_created ON similar_entries (created_at);
+CREATE TABLE IF NOT EXISTS similar_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO similar_stats (name, value) SELECT 'entries', COUNT(*) FROM similar_entries;
+CREATE TRIGGER IF NOT EXISTS similar_added AFTER INSERT ON similar_entries
+    BEGIN UPDATE similar_stats SET value = value + 1 WHERE name = 'entries'; END;
+CREATE TRIGGER IF NOT EXISTS similar_removed AFTER DELETE ON similar_entries
+    BEGIN UPDATE similar_stats SET value = value - 1 WHERE name = 'entries'; END;
+"""
+
+NUM_PERM = 128
+BANDS = 32  # of NUM_PERM // BANDS rows each: texts at 0.7 similarity share a band >99.9% of the time
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed: every worker must compute the same signatures
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_NEGATIONS = frozenset(_PUNCTUATION.sub("", word) for word in NEGATION_WORDS)
+_EMOTION_NAMES = frozenset(emotion.lower() for emotion in EMOTIONS)
+
+
+def _digest(data, size):
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=size).digest()
+
+
+def shingles(text):
+    """(shingles, lexicon terms) of the normalized text. The shingles are its
+    words and adjacent word pairs; the terms are its lexicon matches, the
+    emotion names it uses ("happy") and negations written without
+    apostrophes ("dont")."""
+    normalized = normalize_text(text)
+    words = _PUNCTUATION.sub("", normalized).split()
+    terms = matched_terms(normalized) | _NEGATIONS.intersection(words) | _EMOTION_NAMES.intersection(words)
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}, sorted(terms)
+
+
+def signature(features):
+    """MinHash signature (NUM_PERM uint32 values) of a set of shingles."""
+    hashes = np.array([int.from_bytes(_digest(f, 4), "little") for f in features], dtype=np.uint64)
+    # Overflow in a * h wraps, which is fine for hashing
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+class SimilarityIndex:
+    def __init__(self, path, namespace, threshold=0.7, max_entries=10000, ttl=3600, touch_interval=60):
+        self.path = path
+        self.namespace = namespace
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self._connections = SQLiteConnections(path, SCHEMA)
+        self._counters = BatchedCounters(self._connections, "similar_stats")
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.threshold <= 1
+
+    def _connect(self):
+        return self._connections.get()
+
+    def _bands(self, sig, terms):
+        """One signed 64-bit key per band, scoped to the namespace and the
+        text's lexicon terms."""
+        prefix = f"{self.namespace}\n{'|'.join(terms)}\n"
+        rows = sig.reshape(BANDS, -1)
+        return [int.from_bytes(_digest(f"{prefix}{i}:{row.tobytes().hex()}", 8), "little", signed=True)
+                for i, row in enumerate(rows)]
+
+    def _prepare(self, text):
+        """(key, signature, band keys) for `text`, or None if it has no words."""
+        features, terms = shingles(text)
+        if not features:
+            return None
+        sig = signature(features)
+        key = hashlib.sha256(f"{self.namespace}\n{' '.join(sorted(features))}".encode("utf-8")).hexdigest()
+        return key, sig, self._bands(sig, terms)
+
+    def _count(self, outcome):
+        count("ora_similar_lookups_total", outcome)
+        self._counters.add("hits" if outcome == "hit" else "misses")
+
+    def get(self, text):
+        """Return (value, similarity) of the closest earlier text at or above
+        the threshold, or None."""
+        if not self.enabled:
+            return None
+        prepared = self._prepare(text)
+        if prepared is None:
+            return None
+        _, sig, bands = prepared
+        try:
+            conn = self._connect()
+            now = time.time()
+            rows = conn.execute(
+                "SELECT key, signature, value, accessed_at FROM similar_entries WHERE created_at >= ? AND key IN"
+                f" (SELECT key FROM similar_bands WHERE band IN ({','.join('?' * len(bands))}))",
+                (now - self.ttl, *bands),
+            ).fetchall()
+            best = None
+            for key, candidate, value, accessed_at in rows:
+                similarity = float(np.mean(np.frombuffer(candidate, dtype=np.uint32) == sig))
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = similarity, key, value, accessed_at
+            if best is None:
+                self._count("miss")
+                return None
+            similarity, key, value, accessed_at = best
+            if now - accessed_at >= self.touch_interval:
+                conn.execute("UPDATE similar_entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count("hit")
+            return json.loads(value), similarity
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "similarity_index_failed", error=str(e))
+            return None
+
+    def put(self, text, value):
+        if not self.enabled:
+            return
+        prepared = self._prepare(text)
+        if prepared is None:
+            return
+        key, sig, bands = prepared
+        try:
+            conn = self._connect()
+            now = time.time()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM similar_entries WHERE key = ?", (key,))
+                conn.execute(
+                    "INSERT INTO similar_entries (key, signature, value, created_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, sig.tobytes(), json.dumps(value), now, now),
+                )
+                conn.executemany("INSERT OR IGNORE INTO similar_bands (band, key) VALUES (?, ?)",
+                                 [(band, key) for band in bands])
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "similarity_index_failed", error=str(e))
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM similar_entries WHERE created_at < ?", (now - self.ttl,))
+        size = conn.execute("SELECT value FROM similar_stats WHERE name = 'entries'").fetchone()[0]
+        excess = size - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM similar_entries WHERE key IN"
+                " (SELECT key FROM similar_entries ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            conn.execute(
+                "INSERT INTO similar_stats (name, value) VALUES ('evictions', ?)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (excess,),
+            )
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size, across all workers."""
+        result = {"enabled": self.enabled, "hits": 0, "misses": 0, "evictions": 0, "size": 0,
+                  "max_entries": self.max_entries, "threshold": self.threshold, "ttl": self.ttl}
+        if not self.enabled:
+            return result
+        try:
+            self._counters.flush()
+            for name, value in self._connect().execute("SELECT name, value FROM similar_stats"):
+                result["size" if name == "entries" else name] = value
+        except sqlite3.Error as e:
+            log_event(logging.WARNING, "similarity_index_failed", error=str(e))
+        lookups = result["hits"] + result["misses"]
+        result["hit_rate"] = round(result["hits"] / lookups, 4) if lookups else 0.0
+        return result
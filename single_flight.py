@@ -0,0 +1,83 @@
+"""
+Coalescing of identical in-flight calls ("single flight").
+
+The first caller for a key runs the call; callers arriving with the same key
+while it is in flight wait for it and get the same result (or exception)
+instead of starting their own. Nothing is remembered once the call finishes:
+caching is the classification cache's job.
+
+`SingleFlight` is for sync workers, `AsyncSingleFlight` for the ASGI mode.
+Both are per process; across workers see ClassificationCache.acquire_lease.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key, fn):
+        """Return fn(), sharing one call among concurrent callers of `key`."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            self._counters["leaders" if leader else "coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._counters)
+            result["in_flight"] = len(self._calls)
+        return result
+
+
+class AsyncSingleFlight(SingleFlight):
+    """asyncio SingleFlight; `fn` is a coroutine function.
+
+    The shared call runs as its own task, so one waiter going away (client
+    disconnect) does not cancel it for the others. It is cancelled only
+    once every waiter has gone.
+    """
+
+    async def do(self, key, fn):
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = [asyncio.ensure_future(fn()), 0]
+            call[0].add_done_callback(lambda _: self._calls.pop(key, None))
+            self._counters["leaders"] += 1
+        else:
+            self._counters["coalesced"] += 1
+
+        task = call[0]
+        call[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if call[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            call[1] -= 1
@@ -27,6 +27,7 @@ let frameUpdateInterval = 150;
 let useDrawnEyes = true;
 let animateDrawings = true;
 let interactionPoints = [];
+let avatarSheets = {};
 
 function preload() {
   // style groups
@@ -37,6 +38,38 @@ function preload() {
     negative: ["anger"]
   };
   
+  if (window.AVATAR_ASSETS) {
+    // Sprite atlases from the asset build; frames are cut out in setup()
+    for (const [sheet, url] of Object.entries(AVATAR_ASSETS.sheets)) {
+      avatarSheets[sheet] = loadImage(url);
+    }
+  } else {
+    loadAvatarImages();
+  }
+  
+  // Add styles for enhanced emotion display
+  const style = document.createElement('style');
+  style.textContent = `
+    @keyframes pulse {
+      0% { transform: scale(0.8); opacity: 0.7; }
+      50% { transform: scale(1.2); opacity: 1; }
+      100% { transform: scale(0.8); opacity: 0.7; }
+    }
+    
+    @keyframes fadeIn {
+      from { opacity: 0; transform: translateY(20px); }
+      to { opacity: 1; transform: translateY(0); }
+    }
+    
+    #emotion-panel {
+      animation: fadeIn 0.5s ease-out;
+    }
+  `;
+  document.head.appendChild(style);
+}
+
+// One full-size PNG per frame, when there is no asset build
+function loadAvatarImages() {
   // sad sequence (skip missing 6)
   emotionSequences.sad = [];
   [1,2,3,4,5,7].forEach(i => {
@@ -75,29 +108,34 @@ function preload() {
   eyeImages.anxiety    = loadImage(`/static/sad/anxiety_static.png`);
   eyeImages.fear       = loadImage(`/static/sad/fear_static.png`);
   eyeImages.anger      = eyeImages.excitement;
-  
-  // Add styles for enhanced emotion display
-  const style = document.createElement('style');
-  style.textContent = `
-    @keyframes pulse {
-      0% { transform: scale(0.8); opacity: 0.7; }
-      50% { transform: scale(1.2); opacity: 1; }
-      100% { transform: scale(0.8); opacity: 0.7; }
-    }
-    
-    @keyframes fadeIn {
-      from { opacity: 0; transform: translateY(20px); }
-      to { opacity: 1; transform: translateY(0); }
-    }
-    
-    #emotion-panel {
-      animation: fadeIn 0.5s ease-out;
-    }
-  `;
-  document.head.appendChild(style);
+}
+
+function avatarFrame([sheet, x, y, w, h, displayWidth, displayHeight]) {
+  const img = avatarSheets[sheet].get(x, y, w, h);
+  // Drawn at the original frame's size
+  img.displayWidth = displayWidth;
+  img.displayHeight = displayHeight;
+  return img;
+}
+
+function sliceAvatarFrames() {
+  const frames = name => (AVATAR_ASSETS.frames[name] || []).map(avatarFrame);
+  emotionSequences.sad        = frames('sad');
+  emotionSequences.neutral    = frames('neutral');
+  emotionSequences.excitement = frames('energetic');
+  emotionSequences.anxiety    = emotionSequences.excitement.slice();
+  emotionSequences.fear       = emotionSequences.excitement.slice();
+  emotionSequences.joy        = frames('joy');
+  emotionSequences.anger      = emotionSequences.excitement.slice();
+  for (const [emotion, frame] of Object.entries(AVATAR_ASSETS.eyes)) {
+    eyeImages[emotion] = avatarFrame(frame);
+  }
+  eyeImages.anger = eyeImages.excitement;
 }
 
 function setup() {
+  if (window.AVATAR_ASSETS) sliceAvatarFrames();
+
   // Add error handler to catch p5.AudioIn issues
   window.addEventListener('error', function(e) {
     console.log('Error caught:', e);
@@ -355,7 +393,8 @@ function drawCustomEye(){
   if(seq.length){
     tint(map(confidences[currentEmotion],0,1,0,360),80,100,transitionProgress);
     const img = seq[timelapseFrame];
-    image(img,-img.width/2,-img.height/2);
+    const w = img.displayWidth || img.width, h = img.displayHeight || img.height;
+    image(img,-w/2,-h/2,w,h);
     noTint();
   } else {
     drawEmotionIris();
@@ -0,0 +1,81 @@
+"""
+Shared SQLite plumbing for the local stores that all workers on a host use.
+
+Each thread of each process gets its own connection in WAL mode, so readers
+never block the writer. A connection inherited across fork() is never
+reused: the owning pid is checked on every access.
+
+BatchedCounters keeps hot-path counters in memory and adds them to a shared
+table in batches, so a lookup that only reads does not take the write lock.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class SQLiteConnections:
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.executescript(self.schema)
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+
+class BatchedCounters:
+    """Per-process counters flushed into `table` (name TEXT PRIMARY KEY,
+    value INTEGER) every `flush_every` increments or `flush_seconds`."""
+
+    def __init__(self, connections, table, flush_every=100, flush_seconds=10.0):
+        self.connections = connections
+        self.table = table
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pid = os.getpid()
+        self._flushed_at = time.monotonic()
+
+    def add(self, name):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Counts inherited across fork() belong to the parent
+                self._pending, self._pid = {}, os.getpid()
+            self._pending[name] = self._pending.get(name, 0) + 1
+            due = (sum(self._pending.values()) >= self.flush_every
+                   or time.monotonic() - self._flushed_at >= self.flush_seconds)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Add the pending counts to the table. Raises sqlite3.Error, keeping
+        them pending, if the write fails."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pending, self._pid = {}, os.getpid()
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            self.connections.get().executemany(
+                f"INSERT INTO {self.table} (name, value) VALUES (?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(pending.items()),
+            )
+        except sqlite3.Error:
+            with self._lock:
+                for name, value in pending.items():
+                    self._pending[name] = self._pending.get(name, 0) + value
+            raise
@@ -0,0 +1,351 @@
+"""
+Metrics and structured logging for the app, the ASGI server and the audio
+pool.
+
+Metrics: per-stage latency histograms and counters, exposed in Prometheus
+text format by /metrics. Every process (gunicorn workers, audio pool
+processes) adds to its own small memory-mapped file in METRICS_DIR, and
+render_metrics() sums all of them, so a scrape sees the whole host whichever
+worker answers it. The set of series is fixed here, so every process lays
+its file out the same way. A scrape folds the files of processes that have
+exited into one retired file, so counters never go backwards while the
+directory and the cost of a scrape stay bounded by the live processes.
+reset_metrics() clears the directory; gunicorn.conf.py calls it when the
+master starts, so a deploy starts from zero.
+
+Logging: log_event() writes one JSON object per line. Records go through a
+queue to a background thread, so request threads never block on stdout.
+Events below LOG_LEVEL cost one comparison. Routine per-request events are
+only emitted for a LOG_SAMPLE_RATE fraction of requests (all events of a
+sampled request are kept together); warnings and errors are never sampled.
+"""
+import atexit
+import contextvars
+import fcntl
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "ora_metrics"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+# Histogram upper bounds, in seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGES = (
+    "request_parse", "cache_lookup", "llm_call", "json_parse", "inferential_classify",
+    "map_emotion_to_confidences", "audio_decode", "feature_extraction", "model_inference", "admission_wait",
+    "similarity_lookup",
+)
+ENDPOINTS = (
+    "classify", "classify_batch", "classify_audio", "respond", "chat", "respond_stream", "chat_stream", "other",
+)
+STATUS_CLASSES = ("2xx", "3xx", "4xx", "5xx")
+SOURCES = ("llm", "cache", "local", "model")
+LLM_PATHS = ("classify", "respond", "chat")
+
+# name -> (type, help, label names, label values per label)
+METRICS = {
+    "ora_stage_duration_seconds": ("histogram", "Time spent in each processing stage.",
+                                   ("stage",), (STAGES,)),
+    "ora_stage_errors_total": ("counter", "Stages that ended in an exception.", ("stage",), (STAGES,)),
+    "ora_request_duration_seconds": ("histogram", "Request handling time by endpoint.",
+                                     ("endpoint",), (ENDPOINTS,)),
+    "ora_requests_total": ("counter", "Requests by endpoint and status class.",
+                           ("endpoint", "status"), (ENDPOINTS, STATUS_CLASSES)),
+    "ora_classifications_total": ("counter", "Classifications by where the answer came from.",
+                                  ("source",), (SOURCES,)),
+    "ora_similar_lookups_total": ("counter", "Near-duplicate lookups after an exact cache miss, by outcome.",
+                                  ("outcome",), (("hit", "miss"),)),
+    "ora_admission_total": ("counter", "Upstream LLM calls admitted at once, after waiting, or shed.",
+                            ("outcome",), (("admitted", "delayed", "shed"),)),
+    "ora_degraded_total": ("counter", "Answers served locally because their LLM call was shed or the circuit was open.",
+                           ("path", "reason"), (LLM_PATHS, ("shed", "circuit_open"))),
+    "ora_breaker_transitions_total": ("counter", "OpenAI circuit breaker state changes, by new state.",
+                                      ("state",), (("closed", "open", "half_open"),)),
+    "ora_log_events_total": ("counter", "Log events, emitted or dropped by sampling.",
+                             ("outcome",), (("emitted", "sampled_out"),)),
+}
+
+
+def _label_sets(values):
+    sets = [()]
+    for options in values:
+        sets = [labels + (option,) for labels in sets for option in options]
+    return sets
+
+
+class Metrics:
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.offsets = {}  # (name, label values) -> first slot
+        size = 0
+        for name, (kind, _, _, values) in METRICS.items():
+            for labels in _label_sets(values):
+                self.offsets[name, labels] = size
+                # Histograms: one count per bucket plus +Inf, then sum and count
+                size += len(BUCKETS) + 3 if kind == "histogram" else 1
+        self.size = size
+        layout = json.dumps([METRICS, BUCKETS])
+        self.layout_id = hashlib.sha256(layout.encode("utf-8")).hexdigest()[:12]
+        self._lock = threading.Lock()
+        self._values = None
+        self._pid = None
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{self.layout_id}-{pid}.metrics")
+
+    def _files(self):
+        """(pid, path) of every metrics file with this layout; pid is None
+        for the retired file."""
+        prefix = f"{self.layout_id}-"
+        for entry in os.listdir(self.directory):
+            if entry.startswith(prefix) and entry.endswith(".metrics"):
+                owner = entry[len(prefix):-len(".metrics")]
+                yield (int(owner) if owner.isdigit() else None), os.path.join(self.directory, entry)
+
+    def _read(self, path):
+        try:
+            values = np.fromfile(path, dtype=np.float64)
+        except OSError:
+            return None
+        return values if len(values) == self.size else None
+
+    def _retire_exited(self):
+        """Fold the files of exited processes into the retired file."""
+        exited = [(pid, path) for pid, path in self._files() if pid is not None and not _alive(pid)]
+        if not exited:
+            return
+        with open(os.path.join(self.directory, f"{self.layout_id}.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            retired_path = self._path("retired")
+            retired = self._read(retired_path)
+            retired = np.zeros(self.size) if retired is None else retired
+            folded = []
+            for _, path in exited:
+                values = self._read(path)  # None if another scrape already folded it
+                if values is not None:
+                    retired += values
+                    folded.append(path)
+            if not folded:
+                return
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                retired.tofile(f)
+            os.replace(tmp, retired_path)
+            for path in folded:
+                os.unlink(path)
+
+    def _mine(self):
+        """This process's slots, mapped from its file (created on first use)."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    os.makedirs(self.directory, exist_ok=True)
+                    path = self._path(os.getpid())
+                    mode = "r+" if os.path.exists(path) else "w+"
+                    self._values = np.memmap(path, dtype=np.float64, mode=mode, shape=(self.size,))
+                    self._pid = os.getpid()
+        return self._values
+
+    def inc(self, name, labels, amount=1):
+        offset = self.offsets.get((name, labels))
+        if offset is None:
+            return
+        values = self._mine()
+        with self._lock:
+            values[offset] += amount
+
+    def observe(self, name, labels, seconds):
+        offset = self.offsets.get((name, labels))
+        if offset is None:
+            return
+        bucket = np.searchsorted(BUCKETS, seconds)  # first bound >= seconds; len(BUCKETS) is +Inf
+        values = self._mine()
+        with self._lock:
+            values[offset + bucket] += 1
+            values[offset + len(BUCKETS) + 1] += seconds
+            values[offset + len(BUCKETS) + 2] += 1
+
+    def totals(self):
+        """The sum of every process's slots."""
+        self._mine()
+        self._retire_exited()
+        total = np.zeros(self.size)
+        for _, path in self._files():
+            values = self._read(path)
+            if values is not None:
+                total += values
+        return total
+
+    def render(self):
+        """Prometheus text exposition of the host-wide totals."""
+        total = self.totals()
+        lines = []
+        for name, (kind, help_text, label_names, values) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels in _label_sets(values):
+                offset = self.offsets[name, labels]
+                pairs = [f'{key}="{value}"' for key, value in zip(label_names, labels)]
+                if kind == "counter":
+                    lines.append(f"{name}{{{','.join(pairs)}}} {_number(total[offset])}")
+                    continue
+                cumulative = np.cumsum(total[offset:offset + len(BUCKETS) + 1])
+                for bound, count in zip(BUCKETS + ("+Inf",), cumulative):
+                    le = ",".join(pairs + [f'le="{bound}"'])
+                    lines.append(f"{name}_bucket{{{le}}} {_number(count)}")
+                lines.append(f"{name}_sum{{{','.join(pairs)}}} {_number(total[offset + len(BUCKETS) + 1])}")
+                lines.append(f"{name}_count{{{','.join(pairs)}}} {_number(total[offset + len(BUCKETS) + 2])}")
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+metrics = Metrics()
+render_metrics = metrics.render
+
+
+def reset_metrics(directory=METRICS_DIR):
+    """Remove every metrics file in `directory`. Only safe before any
+    process has started writing to it."""
+    if os.path.isdir(directory):
+        for entry in os.listdir(directory):
+            if entry.endswith((".metrics", ".lock", ".tmp")):
+                os.unlink(os.path.join(directory, entry))
+
+
+def count(name, *labels, amount=1):
+    metrics.inc(name, labels, amount)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as stage `name`; exceptions count as errors."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        metrics.inc("ora_stage_errors_total", (name,))
+        raise
+    finally:
+        metrics.observe("ora_stage_duration_seconds", (name,), time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator form of stage()."""
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_request(endpoint, status, seconds):
+    endpoint = endpoint if endpoint in ENDPOINTS else "other"
+    metrics.observe("ora_request_duration_seconds", (endpoint,), seconds)
+    metrics.inc("ora_requests_total", (endpoint, f"{status // 100}xx"))
+
+
+# Structured logging
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+            "pid": record.process,
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+
+class _RecordQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Formatting happens on the listener thread, not the request thread
+        return record
+
+
+log = logging.getLogger("ora")
+log.setLevel(LOG_LEVEL)
+log.propagate = False
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+_sampled = contextvars.ContextVar("log_sampled", default=None)
+
+
+def _ensure_listener():
+    """Start the writer thread in this process (again, after a fork)."""
+    global _listener, _listener_pid
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        records = queue.SimpleQueue()
+        output = logging.StreamHandler()
+        output.setFormatter(JSONFormatter())
+        for handler in list(log.handlers):
+            log.removeHandler(handler)
+        log.addHandler(_RecordQueueHandler(records))
+        _listener = logging.handlers.QueueListener(records, output)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+@atexit.register
+def _flush_logs():
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+
+def start_request_sampling():
+    """Decide once per request whether its sampled events are logged."""
+    _sampled.set(random.random() < LOG_SAMPLE_RATE)
+
+
+def log_event(level, event, sampled=False, **fields):
+    """Log `event` with structured `fields`.
+
+    Events with sampled=True are routine per-request records: they are only
+    emitted for the fraction of requests picked by start_request_sampling()
+    (or of calls, outside a request).
+    """
+    if not log.isEnabledFor(level):
+        return
+    if sampled and level < logging.WARNING:
+        keep = _sampled.get()
+        if keep is None:
+            keep = random.random() < LOG_SAMPLE_RATE
+        if not keep:
+            metrics.inc("ora_log_events_total", ("sampled_out",))
+            return
+    if _listener_pid != os.getpid():
+        _ensure_listener()
+    metrics.inc("ora_log_events_total", ("emitted",))
+    log.log(level, event, extra={"fields": fields})
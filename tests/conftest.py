@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Keep metrics and the app's SQLite stores out of the shared temp directory;
+# set before any module under test reads them at import time
+_scratch = tempfile.mkdtemp(prefix="ora-tests-")
+os.environ["METRICS_DIR"] = os.path.join(_scratch, "metrics")
+os.environ["CLASSIFY_CACHE_PATH"] = os.path.join(_scratch, "classify-cache.sqlite3")
+os.environ["ADMISSION_DB_PATH"] = os.path.join(_scratch, "admission.sqlite3")
+os.environ["CONVERSATION_DB_PATH"] = os.path.join(_scratch, "conversations.sqlite3")
+os.environ["OPENAI_API_KEY"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeClock:
+    """Stands in for the `time` module of the code under test."""
+
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionController, RateLimiter, estimate_tokens
+
+
+@pytest.fixture(autouse=True)
+def fake_time(clock, monkeypatch):
+    monkeypatch.setattr(admission, "time", clock)
+
+
+def limiter(tmp_path, **budgets):
+    return RateLimiter(str(tmp_path / "admission.sqlite3"), **budgets)
+
+
+def test_unlimited_by_default(tmp_path):
+    rate = limiter(tmp_path)
+    assert not rate.enabled
+    assert all(rate.try_acquire(10 ** 6) == 0 for _ in range(100))
+
+
+def test_request_bucket_refills_over_the_minute(tmp_path, clock):
+    rate = limiter(tmp_path, requests_per_minute=3)
+    assert [rate.try_acquire(1) for _ in range(3)] == [0, 0, 0]
+    assert rate.try_acquire(1) == pytest.approx(20)
+    clock.advance(10)
+    assert rate.try_acquire(1) == pytest.approx(10)
+    clock.advance(10)
+    assert rate.try_acquire(1) == 0
+
+
+def test_token_bucket_waits_for_the_missing_tokens(tmp_path):
+    rate = limiter(tmp_path, tokens_per_minute=600)
+    assert rate.try_acquire(500) == 0
+    assert rate.try_acquire(200) == pytest.approx(10)
+    assert rate.levels() == {"tokens": 100}
+
+
+def test_oversized_request_waits_for_a_full_bucket(tmp_path, clock):
+    rate = limiter(tmp_path, tokens_per_minute=600)
+    assert rate.try_acquire(100) == 0
+    assert rate.try_acquire(1000) == pytest.approx(10)
+    clock.advance(10)
+    assert rate.try_acquire(1000) == 0
+    assert rate.levels() == {"tokens": -400}
+
+
+def test_buckets_are_shared_by_every_limiter_on_the_database(tmp_path):
+    first = limiter(tmp_path, requests_per_minute=2)
+    second = limiter(tmp_path, requests_per_minute=2)
+    assert first.try_acquire(1) == 0
+    assert second.try_acquire(1) == 0
+    assert first.try_acquire(1) > 0
+
+
+def test_fails_open_when_the_database_is_unavailable(tmp_path):
+    rate = RateLimiter(str(tmp_path), requests_per_minute=1)
+    assert rate.try_acquire(1) == 0
+    assert rate.try_acquire(1) == 0
+
+
+def test_waits_for_budget_within_max_wait(tmp_path, clock):
+    controller = AdmissionController(limiter(tmp_path, tokens_per_minute=60), max_wait=2)
+    assert controller.admit(60)
+    start = clock.now
+    assert controller.admit(1)
+    assert clock.now - start == pytest.approx(1)
+    stats = controller.stats()
+    assert (stats["admitted"], stats["delayed"], stats["shed"]) == (1, 1, 0)
+    assert stats["waiting"] == 0
+
+
+def test_sheds_when_the_wait_exceeds_max_wait(tmp_path, clock):
+    controller = AdmissionController(limiter(tmp_path, tokens_per_minute=60), max_wait=0.5)
+    assert controller.admit(60)
+    start = clock.now
+    assert not controller.admit(1)
+    assert clock.now == start
+    assert controller.stats()["shed"] == 1
+
+
+def test_sheds_when_the_queue_is_full(tmp_path):
+    controller = AdmissionController(limiter(tmp_path, tokens_per_minute=60), max_queue=0, max_wait=2)
+    assert controller.admit(60)
+    assert not controller.admit(1)
+    assert controller.stats()["shed"] == 1
+
+
+def test_admit_async(tmp_path, monkeypatch):
+    # Real time here: the waits are asyncio sleeps on the event loop
+    monkeypatch.undo()
+    controller = AdmissionController(limiter(tmp_path, tokens_per_minute=6000), max_wait=1)
+    impatient = AdmissionController(controller.limiter, max_wait=0.01)
+
+    async def run():
+        assert await controller.admit_async(6000)
+        assert not await impatient.admit_async(10)
+        assert await controller.admit_async(10)
+
+    asyncio.run(run())
+    assert controller.stats()["delayed"] == 1
+    assert impatient.stats()["shed"] == 1
+
+
+def test_estimate_tokens():
+    messages = [{"role": "user", "content": "x" * 400}]
+    assert estimate_tokens(messages, 60) == 100 + admission.MESSAGE_OVERHEAD_TOKENS + 60
@@ -0,0 +1,268 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app as ora
+from classification_cache import ClassificationCache
+from emotion_lexicon import score_texts
+from micro_batcher import MicroBatcher
+from similarity_index import SimilarityIndex
+
+
+@pytest.fixture
+def client():
+    return ora.app.test_client()
+
+
+def test_classify_batch_scores_locally_in_request_order(client):
+    texts = ["I feel great and joyful", "", "It has been a long day", "  "]
+    response = client.post("/classify_batch", json={"texts": texts})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert results[1] == results[3] == {"error": "No text to classify"}
+    expected = score_texts([texts[0], texts[2]])
+    for result, (emotion, intensity) in zip([results[0], results[2]], expected):
+        assert (result["emotion"], result["intensity"], result["source"]) == (emotion, intensity, "local")
+        assert result == {**ora.map_emotion_to_confidences(emotion, intensity), "source": "local"}
+
+
+@pytest.mark.parametrize("body", [{}, {"texts": []}, {"texts": "one text"}])
+def test_classify_batch_needs_a_list_of_texts(client, body):
+    assert client.post("/classify_batch", json=body).status_code == 400
+
+
+def test_classify_batch_limits_the_batch_size(client, monkeypatch):
+    monkeypatch.setattr(ora, "MAX_BATCH_SIZE", 2)
+    assert client.post("/classify_batch", json={"texts": ["a", "b", "c"]}).status_code == 400
+
+
+class FakeClient:
+    """Answers chat completions with `reply` after `delay` seconds and
+    records the calls. Streams
+    `tokens`, then raises `error` if one is given."""
+
+    timeout = (1.0, 1.0)
+
+    def __init__(self, reply="", tokens=(), error=None, delay=0.0):
+        self.reply = reply
+        self.tokens = tokens
+        self.error = error
+        self.delay = delay
+        self.calls = []
+
+    def chat_completion(self, **kwargs):
+        self.calls.append(kwargs)
+        time.sleep(self.delay)
+        return self.reply
+
+    def stream_chat_completion(self, **kwargs):
+        yield from self.tokens
+        if self.error:
+            raise self.error
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Installs a FakeClient and enables the LLM path."""
+    def use(reply="", **settings):
+        fake = FakeClient(reply, **settings)
+        monkeypatch.setattr(ora, "OPENAI_API_KEY", "test-key")
+        monkeypatch.setattr(ora, "get_client", lambda: fake)
+        return fake
+    return use
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(ora, "classify_cache", ClassificationCache(
+        str(tmp_path / "cache.sqlite3"), ora.classify_cache.namespace))
+    monkeypatch.setattr(ora, "similar_classifications", SimilarityIndex(
+        str(tmp_path / "cache.sqlite3"), ora.similar_classifications.namespace))
+
+
+def test_classify_caches_llm_answers(client, upstream):
+    fake = upstream('{"emotion": "Tired", "intensity": -40}')
+    first = client.post("/classify", json={"text": "What a long day"}).get_json()
+    second = client.post("/classify", json={"text": "  what a LONG day "}).get_json()
+    assert (first["emotion"], first["source"]) == ("Tired", "llm")
+    assert (second["emotion"], second["source"]) == ("Tired", "cache")
+    assert len(fake.calls) == 1
+    assert client.get("/cache/stats").get_json()["hits"] == 1
+
+
+def test_unparseable_answers_fall_back_and_are_not_cached(client, upstream):
+    fake = upstream("Tired, I think")
+    for _ in range(2):
+        result = client.post("/classify", json={"text": "The week dragged on forever"}).get_json()
+        assert result["source"] == "local"
+    assert len(fake.calls) == 2
+
+
+def test_hedged_classify_answers_locally_past_the_budget(client, upstream, monkeypatch):
+    monkeypatch.setattr(ora, "CLASSIFY_LATENCY_BUDGET", 0.05)
+    upstream('{"emotion": "Tired", "intensity": -40}', delay=0.3)
+    start = time.perf_counter()
+    result = client.post("/classify", json={"text": "What a long day"}).get_json()
+    assert result["source"] == "local"
+    assert time.perf_counter() - start < 0.25
+    # The late answer still reaches the cache
+    deadline = time.monotonic() + 2
+    while ora.classify_cache.peek("What a long day") is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.post("/classify", json={"text": "What a long day"}).get_json()["source"] == "cache"
+
+
+def test_hedged_classify_uses_a_timely_llm_answer(client, upstream, monkeypatch):
+    monkeypatch.setattr(ora, "CLASSIFY_LATENCY_BUDGET", 1)
+    upstream('{"emotion": "Tired", "intensity": -40}')
+    assert client.post("/classify", json={"text": "What a long day"}).get_json()["source"] == "llm"
+
+
+def test_hedges_are_skipped_when_all_slots_are_busy(client, upstream, monkeypatch):
+    monkeypatch.setattr(ora, "CLASSIFY_LATENCY_BUDGET", 1)
+    monkeypatch.setattr(ora, "_hedge_slots", threading.BoundedSemaphore(1))
+    ora._hedge_slots.acquire()
+    fake = upstream('{"emotion": "Tired", "intensity": -40}')
+    assert client.post("/classify", json={"text": "What a long day"}).get_json()["source"] == "local"
+    assert fake.calls == []
+
+
+def test_identical_concurrent_classifications_share_one_call(client, upstream):
+    fake = upstream('{"emotion": "Tired", "intensity": -40}', delay=0.2)
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: client.post("/classify", json={"text": "What a long day"}).get_json(),
+                                range(4)))
+    assert len(fake.calls) == 1
+    assert {result["emotion"] for result in results} == {"Tired"}
+    assert ora.classify_flights.stats()["in_flight"] == 0
+
+
+def test_a_lease_held_elsewhere_is_waited_on(client, upstream, monkeypatch):
+    monkeypatch.setattr(ora, "SINGLEFLIGHT_POLL", 0.01)
+    fake = upstream('{"emotion": "Tired", "intensity": -40}')
+    assert ora.classify_cache.acquire_lease("What a long day", 10)  # another worker's call
+
+    def answer_elsewhere():
+        time.sleep(0.1)
+        ora.classify_cache.put("What a long day", {"emotion": "Sad", "intensity": -50})
+        ora.classify_cache.release_lease("What a long day")
+
+    threading.Thread(target=answer_elsewhere).start()
+    result = client.post("/classify", json={"text": "What a long day"}).get_json()
+    assert (result["emotion"], result["source"]) == ("Sad", "llm")
+    assert fake.calls == []
+
+
+def test_micro_batched_answers_are_split_per_text(client, upstream, monkeypatch):
+    fake = upstream('[{"emotion": "Tired", "intensity": -40}, {"emotion": "Happy", "intensity": 70}]')
+    monkeypatch.setattr(ora, "classify_batcher", MicroBatcher(ora.request_classifications, window=0.2))
+    texts = ["What a long day", "I feel great and joyful"]
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(lambda text: client.post("/classify", json={"text": text}).get_json(), texts))
+    assert len(fake.calls) == 1
+    assert fake.calls[0]["messages"][0]["content"] == ora.CLASSIFY_BATCH_SYSTEM_PROMPT
+    emotions = {result["emotion"] for result in results}
+    assert emotions == {"Tired", "Happy"} and {result["source"] for result in results} == {"llm"}
+
+
+@pytest.mark.parametrize("raw", ["not json", '{"emotion": "Tired"}', '[{"emotion": "Tired"}]'])
+def test_unusable_batch_answers_are_dropped(raw):
+    assert ora.split_batch_classification(raw, 2) == [None, None]
+
+
+def test_batch_answers_that_are_not_objects_are_dropped():
+    items = ora.split_batch_classification('[{"emotion": "Tired", "intensity": -40}, "Happy"]', 2)
+    assert json.loads(items[0]) == {"emotion": "Tired", "intensity": -40}
+    assert items[1] is None
+
+
+def test_micro_batched_classification_is_bounded_by_the_deadline(client, upstream, monkeypatch):
+    fake = upstream()
+    fake.timeout = (0.05, 0.05)
+    monkeypatch.setattr(ora, "REQUEST_DEADLINE", 0.1)
+    release = threading.Event()
+    monkeypatch.setattr(ora, "classify_batcher", MicroBatcher(lambda texts: release.wait(5), window=0.01))
+    start = time.perf_counter()
+    result = client.post("/classify", json={"text": "What a long day"}).get_json()
+    release.set()
+    assert result["source"] == "local"
+    assert time.perf_counter() - start < 1
+
+
+def test_the_batch_prompt_is_part_of_the_cache_namespace():
+    assert ora.classify_namespace(True) != ora.classify_namespace(False)
+    assert ora.classify_cache.namespace == ora.classify_namespace(ora.CLASSIFY_MICROBATCH_WINDOW > 0)
+    assert ora.similar_classifications.namespace == ora.classify_cache.namespace
+
+
+def events(response):
+    """(event, data) pairs of a server-sent event stream."""
+    parsed = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        if not block:
+            continue
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        parsed.append((fields.get("event"), json.loads(fields["data"])))
+    return parsed
+
+
+def start_chat():
+    return ora.start_conversation("How are you feeling?")
+
+
+def test_respond_stream_saves_the_conversation_when_done(client, upstream):
+    upstream(tokens=["That ", "sounds ", "hard."])
+    response = client.post("/respond_stream", json={"emotion": "Sad", "text": "bad day"})
+    assert response.mimetype == "text/event-stream"
+    stream = events(response)
+    assert [data["token"] for event, data in stream[:-1]] == ["That ", "sounds ", "hard."]
+    event, done = stream[-1]
+    assert (event, done["message"]) == ("done", "That sounds hard.")
+    history = ora.conversations.get(done["chat_id"])
+    assert history[-1] == {"role": "assistant", "content": "That sounds hard."}
+
+
+def test_chat_stream_appends_the_exchange_when_done(client, upstream):
+    chat_id = start_chat()
+    upstream(tokens=["Glad ", "to hear it."])
+    stream = events(client.post("/chat_stream", json={"chat_id": chat_id, "message": "Better now"}))
+    assert stream[-1] == ("done", {"reply": "Glad to hear it."})
+    assert ora.conversations.get(chat_id)[-2:] == [
+        {"role": "user", "content": "Better now"},
+        {"role": "assistant", "content": "Glad to hear it."},
+    ]
+
+
+def test_interrupted_chat_stream_saves_nothing(client, upstream):
+    chat_id = start_chat()
+    before = ora.conversations.get(chat_id)
+    upstream(tokens=["Glad "], error=ConnectionError("reset"))
+    stream = events(client.post("/chat_stream", json={"chat_id": chat_id, "message": "Better now"}))
+    assert stream == [(None, {"token": "Glad "}), ("error", {"error": "Stream interrupted"})]
+    assert ora.conversations.get(chat_id) == before
+
+
+def test_interrupted_respond_stream_starts_no_conversation(client, upstream, monkeypatch):
+    started = []
+    monkeypatch.setattr(ora, "start_conversation", started.append)
+    upstream(tokens=["That "], error=ConnectionError("reset"))
+    stream = events(client.post("/respond_stream", json={"emotion": "Sad", "text": "bad day"}))
+    assert stream[-1][0] == "error"
+    assert started == []
+
+
+def test_failure_before_the_first_token_sends_the_fallback(client, upstream):
+    chat_id = start_chat()
+    upstream(error=ConnectionError("refused"))
+    stream = events(client.post("/chat_stream", json={"chat_id": chat_id, "message": "Hi"}))
+    assert stream == [(None, {"token": ora.CHAT_FALLBACK_REPLY}),
+                      ("done", {"reply": ora.CHAT_FALLBACK_REPLY})]
+    assert ora.conversations.get(chat_id)[-1]["content"] == ora.CHAT_FALLBACK_REPLY
+
+
+def test_chat_stream_rejects_unknown_chats(client):
+    response = client.post("/chat_stream", json={"chat_id": "0" * 32, "message": "Hi"})
+    assert response.status_code == 400
@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import app as ora
+import asgi
+
+
+class FakeAsyncClient:
+    """Answers with `reply` and streams `tokens`, pausing `delay` seconds
+    before each token."""
+
+    def __init__(self, reply="", tokens=(), delay=0.0):
+        self.reply = reply
+        self.tokens = tokens
+        self.delay = delay
+        self.closed = False
+
+    async def chat_completion(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        return self.reply
+
+    async def stream_chat_completion(self, **kwargs):
+        try:
+            for token in self.tokens:
+                await asyncio.sleep(self.delay)
+                yield token
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    def use(**settings):
+        fake = FakeAsyncClient(**settings)
+        monkeypatch.setattr(ora, "OPENAI_API_KEY", "test-key")
+        monkeypatch.setattr(asgi, "get_async_client", lambda: fake)
+        return fake
+    return use
+
+
+def request(method, path, **kwargs):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(run())
+
+
+def events(response):
+    parsed = []
+    for block in response.text.split("\n\n"):
+        if block:
+            fields = dict(line.split(": ", 1) for line in block.split("\n"))
+            parsed.append((fields.get("event"), json.loads(fields["data"])))
+    return parsed
+
+
+def test_classify_without_a_key_answers_locally():
+    response = request("POST", "/classify", json={"text": "I feel great and joyful"})
+    assert response.status_code == 200
+    assert response.json() == ora.infer_emotion("I feel great and joyful")
+
+
+@pytest.mark.parametrize("body, error", [
+    (b"not json", "Invalid JSON body"),
+    (b"[1, 2]", "Invalid JSON body"),
+    (b'{"text": "  "}', "No text to classify"),
+])
+def test_bad_requests_get_json_errors(body, error):
+    response = request("POST", "/classify", content=body)
+    assert (response.status_code, response.json()) == (400, {"error": error})
+
+
+def test_oversized_bodies_are_rejected(monkeypatch):
+    monkeypatch.setattr(asgi.read_body, "__defaults__", (10,))
+    response = request("POST", "/classify", json={"text": "x" * 100})
+    assert (response.status_code, response.json()) == (413, {"error": "Request body too large"})
+
+
+def test_unexpected_errors_get_a_json_500(monkeypatch):
+    async def broken(data):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(asgi.ASYNC_ROUTES, "/classify", broken)
+    response = request("POST", "/classify", json={"text": "hello"})
+    assert (response.status_code, response.json()) == (500, {"error": "Internal server error"})
+
+
+def test_other_routes_are_served_by_flask():
+    response = request("GET", "/conversations/stats")
+    assert response.status_code == 200
+    assert response.json()["backend"] == ora.conversations.stats()["backend"]
+
+
+def test_respond_then_chat(upstream):
+    upstream(reply="That sounds hard.")
+    chat_id = request("POST", "/respond", json={"emotion": "Sad", "text": "bad day"}).json()["chat_id"]
+    upstream(reply="Glad to hear it.")
+    response = request("POST", "/chat", json={"chat_id": chat_id, "message": "Better now"})
+    assert response.json() == {"reply": "Glad to hear it."}
+    assert ora.conversations.get(chat_id)[1:] == [
+        {"role": "assistant", "content": "That sounds hard."},
+        {"role": "user", "content": "Better now"},
+        {"role": "assistant", "content": "Glad to hear it."},
+    ]
+
+
+def test_slow_upstream_falls_back_at_the_deadline(upstream, monkeypatch):
+    monkeypatch.setattr(asgi, "REQUEST_DEADLINE", 0.05)
+    upstream(reply="too late", delay=1)
+    response = request("POST", "/respond", json={"emotion": "Sad", "text": "bad day"})
+    assert response.json()["message"] == ora.fallback_reply("Sad")
+
+
+def test_streams_stop_at_the_deadline(upstream, monkeypatch):
+    monkeypatch.setattr(asgi, "REQUEST_DEADLINE", 0.3)
+    fake = upstream(tokens=["one ", "two ", "three ", "four "], delay=0.1)
+    chat_id = ora.start_conversation("How are you feeling?")
+    before = ora.conversations.get(chat_id)
+    stream = events(request("POST", "/chat_stream", json={"chat_id": chat_id, "message": "Hi"}))
+    assert stream[-1] == ("error", {"error": "Stream interrupted"})
+    assert 1 <= len(stream) - 1 < 4
+    assert fake.closed
+    assert ora.conversations.get(chat_id) == before
+
+
+def test_completed_streams_are_saved(upstream):
+    upstream(tokens=["That ", "sounds ", "hard."])
+    stream = events(request("POST", "/respond_stream", json={"emotion": "Sad", "text": "bad day"}))
+    assert [data["token"] for _, data in stream[:-1]] == ["That ", "sounds ", "hard."]
+    event, done = stream[-1]
+    assert (event, done["message"]) == ("done", "That sounds hard.")
+    upstream(tokens=["Glad ", "to hear it."])
+    stream = events(request("POST", "/chat_stream", json={"chat_id": done["chat_id"], "message": "Better"}))
+    assert stream[-1] == ("done", {"reply": "Glad to hear it."})
+    assert ora.conversations.get(done["chat_id"])[-1] == {"role": "assistant", "content": "Glad to hear it."}
+
+
+def test_hedged_classify_answers_locally_past_the_budget(upstream, monkeypatch):
+    monkeypatch.setattr(ora, "CLASSIFY_LATENCY_BUDGET", 0.05)
+    upstream(reply='{"emotion": "Tired", "intensity": -40}', delay=1)
+    response = request("POST", "/classify", json={"text": "Another long day"})
+    assert response.json()["source"] == "local"
+
+
+def test_hedges_are_skipped_when_all_slots_are_busy(upstream, monkeypatch):
+    monkeypatch.setattr(ora, "CLASSIFY_LATENCY_BUDGET", 1)
+    monkeypatch.setattr(asgi, "_hedge_slots", asyncio.Semaphore(0))
+    fake = upstream(reply='{"emotion": "Tired", "intensity": -40}')
+    calls = []
+    monkeypatch.setattr(fake, "chat_completion", lambda **kwargs: calls.append(kwargs))
+    response = request("POST", "/classify", json={"text": "Yet another long day"})
+    assert response.json()["source"] == "local"
+    assert calls == []
+    assert not asgi._late_classifications
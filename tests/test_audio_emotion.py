@@ -0,0 +1,161 @@
+import io
+import os
+import wave
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+import app as ora
+import audio_emotion
+
+SAMPLE_RATE = 16000
+
+
+def tone(seconds=1.0, frequency=220.0, amplitude=0.3):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def wav_bytes(samples, channels=1, sample_rate=SAMPLE_RATE):
+    """16-bit PCM WAV of float `samples` (frames x channels, or mono)."""
+    pcm = np.clip(np.asarray(samples) * 32767, -32768, 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """The app, with uploads in a temp directory and audio classified
+    inline instead of in the process pool."""
+    def submit(path):
+        future = Future()
+        try:
+            future.set_result(audio_emotion.classify_audio_file(path))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    monkeypatch.setattr(ora, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(audio_emotion, "submit", submit)
+    return ora.app.test_client()
+
+
+def test_classifies_an_uploaded_recording(client):
+    body = {"audio": (io.BytesIO(wav_bytes(tone())), "clip.wav")}
+    response = client.post("/classify_audio", data=body, content_type="multipart/form-data")
+    assert response.status_code == 200
+    result = response.get_json()
+    _, labels = audio_emotion.load_model()
+    assert result["source"] == "model" and result["speech"]
+    assert result["emotion"] in labels
+    assert set(result["probabilities"]) == set(labels)
+    assert sum(result["probabilities"].values()) == pytest.approx(1, abs=1e-3)
+
+
+def test_classifies_a_raw_audio_body(client):
+    response = client.post("/classify_audio", data=wav_bytes(tone()), content_type="audio/wav")
+    assert response.status_code == 200
+    assert response.get_json()["speech"]
+
+
+def test_needs_an_audio_file(client):
+    response = client.post("/classify_audio", data={}, content_type="multipart/form-data")
+    assert (response.status_code, response.get_json()) == (400, {"error": "No audio file uploaded"})
+
+
+def test_rejects_undecodable_audio(client):
+    body = {"audio": (io.BytesIO(b"RIFF....WAVEnot really"), "clip.wav")}
+    response = client.post("/classify_audio", data=body, content_type="multipart/form-data")
+    assert (response.status_code, response.get_json()) == (400, {"error": "Could not decode audio"})
+
+
+def test_rejects_oversized_uploads(client, monkeypatch):
+    monkeypatch.setattr(ora, "AUDIO_MAX_BYTES", 1000)
+    response = client.post("/classify_audio", data=wav_bytes(tone()), content_type="audio/wav")
+    assert response.status_code == 413
+
+
+def test_classify_features_returns_a_distribution():
+    features = np.random.default_rng(0).normal(size=180).astype(np.float32)
+    result = audio_emotion.classify_features(features)
+    assert result["emotion"] == max(result["probabilities"], key=result["probabilities"].get)
+
+
+def test_silent_recordings_skip_inference(client, monkeypatch):
+    monkeypatch.setattr(audio_emotion, "classify_features", lambda features: pytest.fail("inference ran"))
+    response = client.post("/classify_audio", data=wav_bytes(np.zeros(SAMPLE_RATE)), content_type="audio/wav")
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result["speech"], result["emotion"], result["trimmed"]) == (False, None, 1.0)
+
+
+def test_trimmed_reports_the_silence_dropped(client):
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    clip = np.concatenate([silence, tone(), silence])
+    result = client.post("/classify_audio", data=wav_bytes(clip), content_type="audio/wav").get_json()
+    assert result["speech"] and 0.5 < result["trimmed"] < 0.75
+
+
+def test_vad_can_be_turned_off(client, monkeypatch):
+    monkeypatch.setattr(audio_emotion, "AUDIO_VAD", False)
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    clip = np.concatenate([silence, tone(), silence])
+    result = client.post("/classify_audio", data=wav_bytes(clip), content_type="audio/wav").get_json()
+    assert (result["speech"], result["trimmed"]) == (True, 0.0)
+
+
+@pytest.mark.parametrize("format, subtype", [("WAV", "PCM_U8"), ("WAV", "PCM_16"), ("WAV", "PCM_32"),
+                                             ("WAV", "FLOAT"), ("WAV", "DOUBLE"), ("WAVEX", "PCM_16"),
+                                             ("WAVEX", "FLOAT")])
+@pytest.mark.parametrize("channels", [1, 2])
+def test_read_wav_matches_soundfile(tmp_path, format, subtype, channels):
+    soundfile = pytest.importorskip("soundfile")
+    samples = np.stack([tone(0.25), tone(0.25, frequency=330.0, amplitude=0.2)], axis=1)[:, :channels]
+    path = str(tmp_path / "clip.wav")
+    soundfile.write(path, samples, SAMPLE_RATE, format=format, subtype=subtype)
+    expected, sample_rate = soundfile.read(path, dtype="float32", always_2d=True)
+    mono, rate = audio_emotion.read_wav(path)
+    assert rate == sample_rate == SAMPLE_RATE and mono.dtype == np.float32
+    np.testing.assert_allclose(mono, expected.mean(axis=1), atol=1e-6)
+
+
+def test_read_wav_leaves_other_formats_to_pydub(tmp_path):
+    soundfile = pytest.importorskip("soundfile")
+    path = str(tmp_path / "clip.wav")
+    soundfile.write(path, tone(0.25), SAMPLE_RATE, subtype="PCM_24")
+    assert audio_emotion.read_wav(path) is None
+    (tmp_path / "clip.webm").write_bytes(b"\x1aE\xdf\xa3 not a wav")
+    assert audio_emotion.read_wav(str(tmp_path / "clip.webm")) is None
+
+
+def test_read_wav_refuses_empty_audio(tmp_path):
+    path = tmp_path / "empty.wav"
+    path.write_bytes(wav_bytes(np.zeros(0)))
+    with pytest.raises(audio_emotion.AudioDecodeError):
+        audio_emotion.read_wav(str(path))
+
+
+def test_read_wav_trusts_the_file_size_over_an_unset_data_size(tmp_path):
+    data = bytearray(wav_bytes(tone(0.25)))
+    data[40:44] = (0xFFFFFFFF).to_bytes(4, "little")  # data chunk size, as left by a streaming recorder
+    path = tmp_path / "stream.wav"
+    path.write_bytes(bytes(data))
+    samples, _ = audio_emotion.read_wav(str(path))
+    assert len(samples) == int(0.25 * SAMPLE_RATE)
+
+
+@pytest.mark.parametrize("multipart", [True, False])
+def test_uploads_are_deleted_after_the_request(client, multipart):
+    if multipart:
+        response = client.post("/classify_audio", data={"audio": (io.BytesIO(wav_bytes(tone())), "clip.wav")},
+                               content_type="multipart/form-data")
+    else:
+        response = client.post("/classify_audio", data=wav_bytes(tone()), content_type="audio/wav")
+    assert response.status_code == 200
+    assert os.listdir(ora.UPLOAD_DIR) == []
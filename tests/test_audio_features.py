@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+import audio_features
+import prototype
+
+
+def chirp(seconds, sample_rate, noise=0.01):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = 0.3 * np.sin(2 * np.pi * (200 + 100 * t) * t)
+    signal += noise * np.random.default_rng(1).normal(size=len(t))
+    return signal.astype(np.float32)
+
+
+def assert_same_features(actual, expected):
+    assert actual.shape == (audio_features.FEATURE_SIZE,)
+    np.testing.assert_allclose(actual, expected, rtol=1e-3, atol=1e-3)
+
+
+@pytest.mark.parametrize("sample_rate", [44100, 16000])
+def test_matches_the_librosa_reference(sample_rate):
+    audio = chirp(1.5, sample_rate)
+    assert_same_features(audio_features.extract_feature(audio, sample_rate),
+                         prototype.extract_feature(audio, sample_rate))
+
+
+def test_matches_the_librosa_reference_on_noise():
+    audio = (0.1 * np.random.default_rng(0).normal(size=44100)).astype(np.float32)
+    assert_same_features(audio_features.extract_feature(audio, 44100), prototype.extract_feature(audio, 44100))
+
+
+def stream(audio, sample_rate, block=1001, extractor=None):
+    extractor = extractor or audio_features.StreamingFeatureExtractor(sample_rate)
+    for start in range(0, len(audio), block):
+        extractor.push(audio[start:start + block])
+    return extractor
+
+
+@pytest.mark.parametrize("sample_rate, seconds", [(44100, 1.0), (44100, 5.0), (16000, 4.0)])
+def test_streaming_matches_batch_extraction(sample_rate, seconds):
+    audio = chirp(seconds, sample_rate)
+    extractor = stream(audio, sample_rate)
+    extractor.finish()
+    assert_same_features(extractor.features(), audio_features.extract_feature(audio, sample_rate))
+
+
+def test_streaming_features_are_available_mid_stream():
+    audio = chirp(2.0, 44100)
+    extractor = stream(audio[:44100], 44100)
+    assert_same_features(extractor.features(), audio_features.extract_feature(audio[:44100], 44100))
+    stream(audio[44100:], 44100, extractor=extractor)
+    assert_same_features(extractor.features(), audio_features.extract_feature(audio, 44100))
+
+
+def test_reset_starts_a_new_clip():
+    first, second = chirp(1.0, 44100), chirp(1.0, 44100, noise=0.2)
+    extractor = stream(first, 44100)
+    extractor.reset()
+    stream(second, 44100, extractor=extractor)
+    assert_same_features(extractor.features(), audio_features.extract_feature(second, 44100))
+
+
+def test_streaming_needs_audio():
+    with pytest.raises(ValueError):
+        audio_features.StreamingFeatureExtractor(44100).features()
+
+
+def test_extract_file_feature(tmp_path):
+    import soundfile
+
+    audio = chirp(2.0, 22050)
+    path = str(tmp_path / "clip.wav")
+    soundfile.write(path, np.column_stack([audio, audio]), 22050, subtype="FLOAT")
+    assert_same_features(audio_features.extract_file_feature(path, block_seconds=0.3),
+                         audio_features.extract_feature(audio, 22050))
+
+
+def test_rolling_emotion_reports_one_result_per_window():
+    import audio_emotion
+
+    rolling = audio_emotion.RollingEmotion(16000, window_seconds=1.0)
+    results = rolling.push(chirp(2.5, 16000))
+    assert len(results) == 2
+    assert all(result["emotion"] in result["probabilities"] for result in results)
+    assert rolling.current()["emotion"] is not None
+
+
+def padded_with_silence(audio, sample_rate, seconds=1.0):
+    silence = np.zeros(int(seconds * sample_rate), dtype=np.float32)
+    return np.concatenate([silence, audio, silence])
+
+
+def test_silence_around_speech_is_not_voiced():
+    speech = chirp(1, 44100)
+    audio = padded_with_silence(speech, 44100)
+    voiced = audio_features.voiced_frames(audio)
+    assert 0.25 < voiced.mean() < 0.45
+    start, end = audio_features.speech_bounds(audio)
+    # Padding widens the bounds by a few frames at most
+    assert 44100 - 2 * audio_features.N_FFT <= start <= 44100
+    assert 2 * 44100 <= end <= 2 * 44100 + 2 * audio_features.N_FFT
+
+
+def test_voiced_features_ignore_the_silence():
+    speech = chirp(1, 44100)
+    audio = padded_with_silence(speech, 44100)
+    features, voiced_fraction = audio_features.extract_voiced_feature(audio, 44100)
+    assert voiced_fraction < 0.5
+    # Silent frames drag the band means towards the floor; dropping them
+    # keeps the vector close to that of the speech alone
+    reference = audio_features.extract_feature(speech, 44100)
+    full = audio_features.extract_feature(audio, 44100)
+    assert np.abs(features - reference).sum() < 0.2 * np.abs(full - reference).sum()
+
+
+def test_silence_has_no_speech():
+    silence = np.zeros(44100, dtype=np.float32)
+    assert audio_features.speech_bounds(silence) is None
+    assert audio_features.extract_voiced_feature(silence, 44100) == (None, 0.0)
+    quiet = 1e-4 * np.random.default_rng(0).normal(size=44100).astype(np.float32)
+    assert not audio_features.voiced_frames(quiet).any()
@@ -0,0 +1,106 @@
+import json
+import os
+
+import pytest
+from flask import render_template_string
+from werkzeug.datastructures import MIMEAccept
+
+import app as ora
+import avatar_assets
+
+Image = pytest.importorskip("PIL.Image")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_sources(directory, skip=()):
+    """Small PNGs for every frame and eye image, except the names in `skip`."""
+    names = {*sum(avatar_assets.SEQUENCES.values(), []), *avatar_assets.EYES.values()}
+    for i, name in enumerate(sorted(names - set(skip))):
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGBA", (40 + i, 30), (i * 9 % 256, 100, 150, 255)).save(path)
+
+
+@pytest.fixture
+def build_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "build"
+    monkeypatch.setattr(avatar_assets, "AVATAR_BUILD_DIR", str(directory))
+    return directory
+
+
+def render_page(accept=()):
+    """index.html as the index route renders it for an Accept header."""
+    with open(os.path.join(ROOT, "index.html")) as f:
+        template = f.read()
+    with ora.app.test_request_context():
+        return render_template_string(template, avatar_assets=avatar_assets.page_assets(MIMEAccept(accept)))
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """Serve `manifest` as the current build."""
+    def serve(manifest):
+        monkeypatch.setattr(avatar_assets, "manifest", lambda: manifest)
+    return serve
+
+
+def test_builds_every_sheet(tmp_path, build_dir):
+    write_sources(tmp_path / "static")
+    manifest = avatar_assets.build(str(tmp_path / "static"), str(build_dir))
+    assert set(manifest["frames"]) == set(avatar_assets.SEQUENCES)
+    assert [len(frames) for frames in manifest["frames"].values()] == [
+        len(names) for names in avatar_assets.SEQUENCES.values()]
+    assert set(manifest["eyes"]) == set(avatar_assets.EYES)
+    assert json.loads((build_dir / "manifest.json").read_text()) == manifest
+    for files in manifest["sheets"].values():
+        assert all((build_dir / name).is_file() for name in files.values())
+
+
+def test_missing_frames_are_left_out_of_their_sequence(tmp_path, build_dir):
+    write_sources(tmp_path / "static", skip=["sad/sad_7.png"])
+    manifest = avatar_assets.build(str(tmp_path / "static"), str(build_dir))
+    assert len(manifest["frames"]["sad"]) == len(avatar_assets.SEQUENCES["sad"]) - 1
+
+
+@pytest.mark.parametrize("skip", [None, avatar_assets.SEQUENCES["energetic"]], ids=["missing", "partial"])
+def test_nothing_is_built_without_every_sheet(tmp_path, build_dir, skip):
+    source = tmp_path / "static"
+    if skip is not None:
+        write_sources(source, skip=skip)
+    assert avatar_assets.build(str(source), str(build_dir)) is None
+    assert not (build_dir / "manifest.json").exists()
+
+
+def test_pages_get_one_url_per_sheet(tmp_path, build_dir, serve):
+    write_sources(tmp_path / "static")
+    manifest = avatar_assets.build(str(tmp_path / "static"), str(build_dir))
+    serve(manifest)
+    assets = avatar_assets.page_assets(MIMEAccept([("text/html", 1), ("*/*", 0.8)]))
+    assert set(assets) == {"sheets", "frames", "eyes"}
+    assert {url[len(avatar_assets.URL_PREFIX):] for url in assets["sheets"].values()} == {
+        files.get("image/webp", files.get("image/png")) for files in manifest["sheets"].values()}
+    assert "window.AVATAR_ASSETS = null;" not in render_page()
+
+
+def test_pages_keep_the_pngs_for_an_incomplete_manifest(tmp_path, build_dir, serve):
+    write_sources(tmp_path / "static")
+    manifest = avatar_assets.build(str(tmp_path / "static"), str(build_dir))
+    del manifest["frames"]["energetic"]
+    serve(manifest)
+    assert avatar_assets.page_assets(MIMEAccept([("*/*", 1)])) is None
+    assert "window.AVATAR_ASSETS = null;" in render_page()
+
+
+def test_assets_are_served_as_immutable(tmp_path, build_dir):
+    write_sources(tmp_path / "static")
+    manifest = avatar_assets.build(str(tmp_path / "static"), str(build_dir))
+    name = next(iter(manifest["sheets"]["sad"].values()))
+    client = ora.app.test_client()
+    response = client.get(avatar_assets.URL_PREFIX + name)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert client.get(avatar_assets.URL_PREFIX + name,
+                      headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+    assert client.get(avatar_assets.URL_PREFIX + "manifest.json").status_code == 404
+    assert client.get(avatar_assets.URL_PREFIX + "..%2Fapp.12345678abcd.png").status_code == 404
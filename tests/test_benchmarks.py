@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import requests
+
+from benchmarks import suite
+from benchmarks.openai_standin import CHAT_REPLY, CLASSIFY_REPLY, start_standin
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_measure_makes_at_least_min_calls():
+    calls = []
+    result = suite.measure(lambda: calls.append(1), seconds=0, min_calls=10)
+    assert result["calls"] == 10 and len(calls) == 11  # plus the warm-up call
+    assert result["p50_ms"] <= result["p99_ms"]
+
+
+def test_measure_spreads_calls_over_threads():
+    threads = set()
+    result = suite.measure(lambda: threads.add(threading.get_ident()), seconds=0.05, min_calls=8, concurrency=4)
+    assert result["calls"] >= 8 and len(threads) > 1
+
+
+def test_summarize_reports_milliseconds():
+    result = suite.summarize([0.001, 0.002, 0.003, 0.004], elapsed=2.0)
+    assert result == {"calls": 4, "throughput": 2.0, "p50_ms": 2.5, "p99_ms": 3.97, "mean_ms": 2.5}
+
+
+def test_compare_prints_ratios_against_a_baseline(tmp_path, capsys):
+    baseline = tmp_path / "before.json"
+    baseline.write_text(json.dumps({"commit": "abc123", "results": {
+        "case": {"throughput": 100.0, "p50_ms": 2.0, "p99_ms": 4.0}}}))
+    suite.compare({"case": {"throughput": 250.0, "p50_ms": 1.0, "p99_ms": 3.0},
+                   "new case": {"throughput": 1.0, "p50_ms": 1.0, "p99_ms": 1.0}}, str(baseline))
+    out = capsys.readouterr().out
+    assert "commit abc123" in out and "throughput 2.50x" in out and "2.000 -> 1.000 ms" in out
+    assert "new case" not in out
+
+
+def test_mlp_cases_compare_the_same_model(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    cases = suite.mlp_cases(str(tmp_path))
+    assert sorted(cases) == sorted(f"predict_proba/{kind}/{batch}" for kind in ("sklearn", "compact")
+                                   for batch in (1, 16, 256))
+    np.testing.assert_allclose(cases["predict_proba/compact/16"](), cases["predict_proba/sklearn/16"](), atol=1e-6)
+
+
+def test_standin_answers_like_the_api():
+    standin = start_standin()
+    try:
+        url = standin.base_url + "/chat/completions"
+        classify = requests.post(url, json={"messages": [
+            {"role": "system", "content": "You are an emotion classifier."}, {"role": "user", "content": "hi"}]})
+        chat = requests.post(url, json={"messages": [{"role": "user", "content": "hi"}]})
+        assert classify.json()["choices"][0]["message"]["content"] == CLASSIFY_REPLY
+        assert chat.json()["choices"][0]["message"]["content"] == CHAT_REPLY
+        assert requests.get(standin.base_url.rsplit("/v1", 1)[0] + "/stats").json()["requests"] == 2
+    finally:
+        standin.shutdown()
+
+
+def test_suite_writes_a_report(tmp_path):
+    out = tmp_path / "bench.json"
+    subprocess.run([sys.executable, "-m", "benchmarks.suite", "--only", "mlp", "--seconds", "0",
+                    "--min-calls", "2", "--out", str(out)], cwd=ROOT, check=True, capture_output=True)
+    report = json.loads(out.read_text())
+    assert {"commit", "python", "numpy", "results"} <= set(report)
+    assert all(name.startswith("predict_proba/") for name in report["results"])
@@ -0,0 +1,145 @@
+import contextvars
+import threading
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture
+def breaker(clock, monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return CircuitBreaker(failure_rate=0.5, min_calls=4, window=10, slow_call_seconds=2,
+                          open_seconds=30, probe_interval=5)
+
+
+def trip(breaker):
+    for _ in range(4):
+        breaker.record(False, 0.1)
+
+
+def test_stays_closed_below_min_calls(breaker):
+    for _ in range(3):
+        breaker.record(False, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_opens_at_failure_rate(breaker):
+    breaker.record(True, 0.1)
+    breaker.record(True, 0.1)
+    breaker.record(False, 0.1)
+    assert breaker.state == CLOSED
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_slow_calls_count_as_failures(breaker):
+    for _ in range(4):
+        breaker.record(True, 3.0)
+    assert breaker.state == OPEN
+
+
+def test_old_calls_leave_the_window(breaker, clock):
+    for _ in range(3):
+        breaker.record(False, 0.1)
+    clock.advance(11)
+    breaker.record(False, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["calls"] == 1
+
+
+def test_half_open_allows_one_probe_per_interval(breaker, clock):
+    trip(breaker)
+    clock.advance(29)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    clock.advance(5)
+    assert breaker.allow()
+    assert breaker.stats()["probes"] == 2
+
+
+def test_successful_probe_closes(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["calls"] == 0
+
+
+@pytest.mark.parametrize("ok, seconds", [(False, 0.1), (True, 3.0)])
+def test_failed_probe_reopens(breaker, clock, ok, seconds):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record(ok, seconds)
+    assert breaker.state == OPEN
+    assert breaker.stats()["opened"] == 2
+    clock.advance(29)
+    assert not breaker.allow()
+
+
+def test_calls_finishing_while_open_are_ignored(breaker, clock):
+    trip(breaker)
+    breaker.record(True, 0.1)
+    assert breaker.state == OPEN
+    clock.advance(30)
+    assert breaker.state == HALF_OPEN
+
+
+def record_elsewhere(breaker, ok, seconds=0.1):
+    """Record a call from another thread, which holds no probe."""
+    thread = threading.Thread(target=breaker.record, args=(ok, seconds))
+    thread.start()
+    thread.join()
+
+
+@pytest.mark.parametrize("ok", [True, False])
+def test_only_the_probe_decides_while_half_open(breaker, clock, ok):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow()
+    record_elsewhere(breaker, ok)  # a call that started before the circuit opened
+    assert breaker.state == HALF_OPEN
+    breaker.record(not ok, 0.1)
+    assert breaker.state == (OPEN if ok else CLOSED)
+
+
+def test_a_newer_probe_supersedes_an_older_one(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    older = contextvars.copy_context()
+    assert older.run(breaker.allow)
+    clock.advance(5)
+    assert breaker.allow()
+    older.run(breaker.record, True, 0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+
+
+def test_abandoned_probe_lets_the_next_one_go(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record(None, 0.1)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    breaker.record(None, 3.0)  # abandoned after it had already run slow
+    assert breaker.state == OPEN
+
+
+def test_abandoned_calls_only_count_when_slow(breaker):
+    for _ in range(4):
+        breaker.record(None, 0.1)
+    assert breaker.stats()["calls"] == 0
+    for _ in range(4):
+        breaker.record(None, 3.0)
+    assert breaker.state == OPEN
@@ -0,0 +1,118 @@
+import pytest
+
+import classification_cache
+from classification_cache import ClassificationCache, normalize_text
+
+ANSWER = {"emotion": "Tired", "intensity": 60}
+
+
+@pytest.fixture
+def make_cache(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(classification_cache, "time", clock)
+
+    def make(**settings):
+        settings.setdefault("namespace", "model:v1")
+        return ClassificationCache(str(tmp_path / "cache.sqlite3"), **settings)
+
+    return make
+
+
+def test_normalized_texts_share_an_entry(make_cache):
+    cache = make_cache()
+    cache.put("I'm  so tired\n", ANSWER)
+    assert cache.get("i'm so TIRED") == ANSWER
+    assert normalize_text("  A\tB  ") == "a b"
+
+
+def test_namespaces_are_separate(make_cache):
+    make_cache().put("so tired", ANSWER)
+    assert make_cache(namespace="model:v2").get("so tired") is None
+
+
+def test_entries_expire_after_ttl(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.put("so tired", ANSWER)
+    clock.advance(60)
+    assert cache.get("so tired") == ANSWER
+    clock.advance(1)
+    assert cache.get("so tired") is None
+    assert cache.peek("so tired") is None
+    # Expired entries are dropped by the next write
+    cache.put("so happy", ANSWER)
+    assert cache.stats()["size"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(make_cache, clock):
+    cache = make_cache(max_entries=2, touch_interval=0)
+    cache.put("first", ANSWER)
+    clock.advance(1)
+    cache.put("second", ANSWER)
+    clock.advance(1)
+    assert cache.get("first") == ANSWER
+    clock.advance(1)
+    cache.put("third", ANSWER)
+    assert cache.peek("second") is None
+    assert cache.peek("first") == ANSWER
+    assert cache.peek("third") == ANSWER
+    stats = cache.stats()
+    assert (stats["size"], stats["evictions"]) == (2, 1)
+
+
+def test_access_times_are_refreshed_at_most_every_touch_interval(make_cache, clock):
+    cache = make_cache(max_entries=2, touch_interval=60)
+    cache.put("first", ANSWER)
+    clock.advance(1)
+    cache.put("second", ANSWER)
+    clock.advance(1)
+    cache.get("first")  # too soon to count as a use
+    cache.put("third", ANSWER)
+    assert cache.peek("first") is None
+    assert cache.peek("second") == ANSWER
+
+
+def test_replacing_an_entry_keeps_the_size(make_cache):
+    cache = make_cache()
+    cache.put("so tired", ANSWER)
+    cache.put("so tired", {"emotion": "Sad", "intensity": 40})
+    assert cache.get("so tired") == {"emotion": "Sad", "intensity": 40}
+    assert cache.stats()["size"] == 1
+
+
+def test_stats_count_lookups_but_not_peeks(make_cache):
+    cache = make_cache()
+    cache.put("so tired", ANSWER)
+    cache.get("so tired")
+    cache.get("so tired")
+    cache.get("so happy")
+    cache.peek("so tired")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (2, 1, 0.6667)
+
+
+def test_disabled_cache(make_cache):
+    cache = make_cache(max_entries=0)
+    cache.put("so tired", ANSWER)
+    assert cache.get("so tired") is None
+    assert not cache.stats()["enabled"]
+    assert cache.acquire_lease("so tired", ttl=10)
+    assert cache.acquire_lease("so tired", ttl=10)
+
+
+def test_only_one_holder_per_lease(make_cache):
+    first, second = make_cache(), make_cache()
+    assert first.acquire_lease("so tired", ttl=10)
+    assert not second.acquire_lease("so tired", ttl=10)
+    assert second.lease_held("so tired")
+    assert second.acquire_lease("so happy", ttl=10)
+    first.release_lease("so tired")
+    assert not second.lease_held("so tired")
+    assert second.acquire_lease("so tired", ttl=10)
+
+
+def test_expired_leases_can_be_taken_over(make_cache, clock):
+    first, second = make_cache(), make_cache()
+    assert first.acquire_lease("so tired", ttl=10)
+    clock.advance(11)
+    assert not second.lease_held("so tired")
+    assert second.acquire_lease("so tired", ttl=10)
+    assert not first.acquire_lease("so tired", ttl=10)
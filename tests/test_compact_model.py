@@ -0,0 +1,106 @@
+import logging
+import os
+import warnings
+
+import numpy as np
+import pytest
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+import audio_emotion
+from compact_model import CompactMLP, export_model, quantize_int8
+
+LABELS = ["angry", "calm", "happy", "sad"]
+
+
+def training_data(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    features = rng.normal(loc=50, scale=20, size=(n, 180))
+    classes = features[:, :4].argmax(axis=1)
+    return features, classes
+
+
+@pytest.fixture(scope="module")
+def encoder():
+    return LabelEncoder().fit(LABELS)
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    features, classes = training_data()
+    model = Pipeline([("scaler", StandardScaler()),
+                      ("mlp", MLPClassifier(hidden_layer_sizes=(16, 8), max_iter=300, random_state=0))])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        return model.fit(features, classes)
+
+
+def test_matches_the_sklearn_pipeline(pipeline, encoder, tmp_path):
+    path = str(tmp_path / "model.npz")
+    export_model(pipeline, encoder, path)
+    compact = CompactMLP(path)
+    features, _ = training_data(50, seed=1)
+    np.testing.assert_allclose(compact.predict_proba(features), pipeline.predict_proba(features), rtol=1e-10, atol=1e-12)
+    assert compact.predict(features) == [LABELS[i] for i in pipeline.predict(features)]
+    assert compact.scaled
+
+
+def test_bare_mlp_is_marked_unscaled(pipeline, encoder, tmp_path):
+    path = str(tmp_path / "model.npz")
+    export_model(pipeline[-1], encoder, path)
+    assert not CompactMLP(path).scaled
+
+
+def test_files_without_the_flag_detect_an_identity_scaler(pipeline, encoder, tmp_path):
+    for model, scaled in ((pipeline, True), (pipeline[-1], False)):
+        path = str(tmp_path / "model.npz")
+        export_model(model, encoder, path)
+        with np.load(path) as archive:
+            arrays = {name: archive[name] for name in archive.files if name != "scaled"}
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+        assert CompactMLP(path).scaled is scaled
+
+
+@pytest.mark.parametrize("scaled", [True, False])
+def test_serving_warns_about_an_unscaled_compact_model(pipeline, encoder, tmp_path, monkeypatch, scaled):
+    path = str(tmp_path / "model.npz")
+    export_model(pipeline if scaled else pipeline[-1], encoder, path)
+    events = []
+    monkeypatch.setattr(audio_emotion, "log_event", lambda level, event, **fields: events.append((level, event)))
+    monkeypatch.setattr(audio_emotion, "COMPACT_MODEL_PATH", path)
+    monkeypatch.setattr(audio_emotion, "_model", None)
+    monkeypatch.setattr(audio_emotion, "_labels", None)
+    model, labels = audio_emotion.load_model()
+    assert isinstance(model, CompactMLP) and labels == LABELS
+    assert ((logging.WARNING, "audio_model_unscaled") in events) is not scaled
+
+
+def test_quantize_int8_round_trips_within_half_a_step():
+    weights = np.random.default_rng(2).normal(size=(180, 16))
+    weights[:, 3] = 0
+    q, scale = quantize_int8(weights)
+    assert q.dtype == np.int8 and scale.shape == (16,)
+    assert np.abs(q).max() <= 127 and scale[3] == 1.0
+    assert np.all(np.abs(q * scale - weights) <= scale / 2 + 1e-7)
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_reduced_precision_stays_close_to_float64(pipeline, encoder, tmp_path, precision):
+    reference_path, path = str(tmp_path / "float64.npz"), str(tmp_path / f"{precision}.npz")
+    export_model(pipeline, encoder, reference_path)
+    export_model(pipeline, encoder, path, precision=precision)
+    reference, compact = CompactMLP(reference_path), CompactMLP(path)
+    assert compact.dtype == np.float32
+    assert os.path.getsize(path) < os.path.getsize(reference_path) / 2
+    features, _ = training_data(200, seed=3)
+    expected, probabilities = reference.predict_proba(features), compact.predict_proba(features)
+    assert np.abs(probabilities - expected).max() < 0.05
+    assert np.mean(probabilities.argmax(axis=1) == expected.argmax(axis=1)) >= 0.97
+
+
+def test_unknown_precision_is_refused(pipeline, encoder, tmp_path):
+    with pytest.raises(ValueError):
+        export_model(pipeline, encoder, str(tmp_path / "model.npz"), precision="int4")
@@ -0,0 +1,106 @@
+import pytest
+
+import conversation_store
+from conversation_store import MemoryConversationStore, SQLiteConversationStore
+
+SYSTEM = {"role": "system", "content": "You are a compassionate assistant."}
+
+
+def turn(n):
+    return [{"role": "user", "content": f"question {n}"}, {"role": "assistant", "content": f"answer {n}"}]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(conversation_store, "time", clock)
+
+    def make(**settings):
+        if request.param == "memory":
+            settings.pop("touch_interval", None)
+            return MemoryConversationStore(**settings)
+        return SQLiteConversationStore(str(tmp_path / "conversations.sqlite3"), **settings)
+
+    return make
+
+
+def test_create_get_append(make_store):
+    store = make_store()
+    chat_id = store.create([SYSTEM])
+    assert store.append(chat_id, turn(1))
+    assert store.get(chat_id) == [SYSTEM, *turn(1)]
+
+
+@pytest.mark.parametrize("chat_id", [None, "", "not-a-chat-id", "0" * 32])
+def test_unknown_sessions(make_store, chat_id):
+    store = make_store()
+    assert store.get(chat_id) is None
+    assert not store.append(chat_id, turn(1))
+
+
+def test_idle_sessions_expire(make_store, clock):
+    store = make_store(ttl=60, touch_interval=0)
+    chat_id = store.create([SYSTEM])
+    clock.advance(50)
+    assert store.get(chat_id) is not None
+    clock.advance(50)
+    assert store.get(chat_id) is not None
+    clock.advance(61)
+    assert store.get(chat_id) is None
+
+
+def test_least_recently_used_sessions_are_evicted(make_store, clock):
+    store = make_store(max_sessions=2, touch_interval=0)
+    first = store.create([SYSTEM])
+    clock.advance(1)
+    second = store.create([SYSTEM])
+    clock.advance(1)
+    store.get(first)
+    clock.advance(1)
+    third = store.create([SYSTEM])
+    assert store.get(second) is None
+    assert store.get(first) is not None and store.get(third) is not None
+    assert store.stats()["sessions"] == 2
+    assert store.stats()["evictions"] == 1
+
+
+def test_sessions_keep_the_system_message_and_the_newest_turns(make_store):
+    store = make_store(max_messages=5)
+    chat_id = store.create([SYSTEM])
+    for n in range(4):
+        store.append(chat_id, turn(n))
+    assert store.get(chat_id) == [SYSTEM, *turn(2), *turn(3)]
+
+
+def test_sqlite_sessions_are_shared_between_stores(tmp_path):
+    path = str(tmp_path / "conversations.sqlite3")
+    chat_id = SQLiteConversationStore(path).create([SYSTEM])
+    other = SQLiteConversationStore(path)
+    assert other.append(chat_id, turn(1))
+    assert SQLiteConversationStore(path).get(chat_id) == [SYSTEM, *turn(1)]
+
+
+def test_sqlite_reads_refresh_last_use_at_most_every_touch_interval(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(conversation_store, "time", clock)
+    store = SQLiteConversationStore(str(tmp_path / "conversations.sqlite3"), ttl=100, touch_interval=60)
+    chat_id = store.create([SYSTEM])
+    clock.advance(59)
+    assert store.get(chat_id) is not None  # too soon to write
+    clock.advance(42)
+    assert store.get(chat_id) is None
+
+
+def test_sqlite_store_degrades_when_the_database_is_unusable(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path))  # a directory, not a database
+    chat_id = "0" * 32
+    assert store.create([SYSTEM]) is None
+    assert store.get(chat_id) is None
+    assert not store.append(chat_id, turn(1))
+    assert store.stats()["sessions"] == 0
+
+
+def test_chat_answers_400_when_the_store_is_unusable(tmp_path, monkeypatch):
+    import app as ora
+
+    monkeypatch.setattr(ora, "conversations", SQLiteConversationStore(str(tmp_path)))
+    response = ora.app.test_client().post("/chat", json={"chat_id": "0" * 32, "message": "Hi"})
+    assert (response.status_code, response.get_json()) == (400, {"error": "Invalid chat_id"})
@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from emotion_lexicon import (AUTOMATON, BASE_SCORES, CONTEXT_RULES, EMOTION_PATTERNS,
+                             EMOTIONS, INTENSIFIER_STEP, INTENSIFIERS, NEGATION_OPPOSITES, NEGATION_WORDS,
+                             PHRASE_SCORES, matched_terms, score_text, score_texts)
+
+FILLER = ["i", "am", "feel", "today", "the", "a", "it", "at", "!", "?", ",", "'", "really", "not"]
+
+
+def random_texts(count, seed=7):
+    rng = random.Random(seed)
+    vocabulary = AUTOMATON.terms + FILLER
+    for _ in range(count):
+        words = rng.choices(vocabulary, k=rng.randint(0, 12))
+        yield "".join(word + rng.choice([" ", "", "  ", "!", "?"]) for word in words)
+
+
+def substring_scores(text):
+    """The scores the classifier gave before the automaton: one substring
+    search per lexicon term."""
+    lower = text.lower()
+    scores = dict(BASE_SCORES)
+    for emotion, keywords in EMOTION_PATTERNS.items():
+        scores[emotion] += sum(keyword in lower for keyword in keywords)
+    for negation in NEGATION_WORDS:
+        if negation in lower:
+            negated = lower[lower.find(negation):]
+            for emotion, keywords in EMOTION_PATTERNS.items():
+                for keyword in keywords:
+                    if keyword in negated:
+                        scores[emotion] -= 1
+                        if emotion in NEGATION_OPPOSITES:
+                            scores[NEGATION_OPPOSITES[emotion]] += 0.5
+    for phrase, emotion_scores in PHRASE_SCORES.items():
+        if phrase in lower:
+            for emotion, score in emotion_scores.items():
+                scores[emotion] += score
+    for phrases, boosts in CONTEXT_RULES:
+        if any(phrase in lower for phrase in phrases):
+            for emotion, boost in boosts.items():
+                scores[emotion] += boost
+    exclamations, questions = text.count("!"), text.count("?")
+    if exclamations >= 3:
+        scores["Excited"] += 2
+        scores["Happy"] += 1
+        scores["Surprised"] += 1
+    elif exclamations:
+        scores["Excited"] += 1
+        scores["Happy"] += 0.5
+    if questions >= 3:
+        scores["Confused"] += 2
+        scores["Anxious"] += 1
+    elif questions:
+        scores["Confused"] += 0.5
+    boost = sum(INTENSIFIER_STEP for word in INTENSIFIERS if word in lower)
+    if boost:
+        for emotion, _ in sorted(scores.items(), key=lambda x: x[1], reverse=True)[:2]:
+            scores[emotion] += boost
+    if max(scores.values()) < 1:
+        scores["Neutral"] = 2
+    return scores
+
+
+def test_scan_matches_substring_search():
+    for text in random_texts(2000):
+        first, last = AUTOMATON.scan(text)
+        assert first == [text.find(term) for term in AUTOMATON.terms], text
+        assert last == [text.rfind(term) for term in AUTOMATON.terms], text
+
+
+def test_scores_match_substring_search():
+    for text in random_texts(2000, seed=3):
+        emotion, intensity, scores = score_text(text)
+        expected = substring_scores(text)
+        assert scores == pytest.approx(expected), text
+        assert expected[emotion] == pytest.approx(max(expected.values())), text
+
+
+@pytest.mark.parametrize("text, emotion", [
+    ("I feel great and joyful", "Happy"),
+    ("I feel sad and lonely", "Sad"),
+    ("It has been a long day", "Tired"),
+    ("", "Neutral"),
+])
+def test_obvious_texts(text, emotion):
+    result, intensity, scores = score_text(text)
+    assert result == emotion
+    assert set(scores) == set(EMOTIONS)
+    assert -100 <= intensity <= 100
+
+
+def test_score_texts_equals_score_text():
+    texts = list(random_texts(500, seed=11)) + ["", "I am so happy!!!", "I'm not sad at all?"]
+    assert score_texts(texts) == [score_text(text)[:2] for text in texts]
+    assert score_texts([]) == []
+
+
+def test_matched_terms_are_the_terms_in_the_text():
+    assert matched_terms("I am NOT Great") >= {"not", "great"}
+    assert matched_terms("") == set()
+    for text in random_texts(300, seed=11):
+        assert matched_terms(text) == {term for term in AUTOMATON.terms if term in text.lower()}
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+import soundfile
+
+import feature_cache
+from feature_cache import FeatureCache, extract_file, extract_files
+
+
+@pytest.fixture
+def clips(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"clip{i}.wav")
+        soundfile.write(path, (0.1 * rng.normal(size=22050)).astype(np.float32), 22050)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    """Counts serial extractions (workers=1 runs them in this process)."""
+    calls = []
+
+    def extract(path):
+        calls.append(path)
+        return extract_file(path)
+
+    monkeypatch.setattr(feature_cache, "extract_file", extract)
+    return calls
+
+
+def test_second_run_is_read_from_the_cache(clips, tmp_path, counted):
+    cache = FeatureCache(str(tmp_path / "cache"))
+    first = extract_files(clips, cache, workers=1)
+    second = extract_files(clips, cache, workers=1)
+    assert counted == clips
+    np.testing.assert_array_equal(first, second)
+    assert first.shape == (3, 180)
+    assert not [name for name in os.listdir(cache.directory) if name.endswith(".tmp")]
+
+
+def test_changed_files_are_extracted_again(clips, tmp_path, counted):
+    cache = FeatureCache(str(tmp_path / "cache"))
+    extract_files(clips, cache, workers=1)
+    soundfile.write(clips[1], np.zeros(11025, dtype=np.float32) + 0.01, 22050)
+    extract_files(clips, cache, workers=1)
+    assert counted == clips + [clips[1]]
+
+
+def test_keys_depend_on_the_feature_configuration(clips, tmp_path):
+    assert (FeatureCache(str(tmp_path / "a")).key(clips[0])
+            != FeatureCache(str(tmp_path / "b"), config="v2").key(clips[0]))
+
+
+def test_parallel_extraction_matches_serial(clips):
+    np.testing.assert_allclose(extract_files(clips, workers=2), extract_files(clips, workers=1), rtol=1e-6)
+
+
+def test_unreadable_entries_are_misses(clips, tmp_path):
+    cache = FeatureCache(str(tmp_path / "cache"))
+    key = cache.key(clips[0])
+    with open(os.path.join(cache.directory, key + ".npy"), "wb") as f:
+        f.write(b"not an array")
+    assert cache.get(key) is None
@@ -0,0 +1,153 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+import requests
+
+import llm_client
+from llm_client import AsyncLLMClient, LLMClient, LLMError
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+COMPLETION = {"choices": [{"message": {"content": " Hello "}}]}
+
+
+class Outcomes:
+    """Stands in for the circuit breaker, collecting recorded outcomes."""
+
+    slow_call_seconds = 10.0
+
+    def __init__(self):
+        self.recorded = []
+
+    def record(self, ok, seconds):
+        self.recorded.append(ok)
+
+
+@pytest.fixture
+def outcomes(monkeypatch):
+    outcomes = Outcomes()
+    monkeypatch.setattr(llm_client, "get_breaker", lambda: outcomes)
+    return outcomes
+
+
+def response(status, body=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = json.dumps(body or {}).encode("utf-8")
+    return resp
+
+
+def sync_client(monkeypatch, reply):
+    """An LLMClient whose session answers with `reply(payload)`: a status
+    and body, or an exception to raise."""
+    client = LLMClient("test", max_retries=0)
+
+    def post(url, json, timeout, stream):
+        result = reply(json)
+        if isinstance(result, BaseException):
+            raise result
+        return response(*result)
+
+    monkeypatch.setattr(client.session, "post", post)
+    return client
+
+
+@pytest.mark.parametrize("reply, ok", [
+    ((200, COMPLETION), True),
+    ((400, {"error": "bad request"}), True),
+    ((404, {"error": "no such model"}), True),
+    ((429, {"error": "slow down"}), False),
+    ((500, {"error": "oops"}), False),
+    ((503, {"error": "overloaded"}), False),
+    (requests.Timeout("read timed out"), False),
+    (requests.ConnectionError("refused"), False),
+])
+def test_only_upstream_trouble_counts_as_a_failure(monkeypatch, outcomes, reply, ok):
+    client = sync_client(monkeypatch, lambda payload: reply)
+    try:
+        assert client.chat_completion(MESSAGES, "gpt-test") == "Hello"
+    except LLMError:
+        pass
+    assert outcomes.recorded == [ok]
+
+
+def test_unexpected_errors_are_recorded_too(monkeypatch, outcomes):
+    client = sync_client(monkeypatch, lambda payload: RuntimeError("bug"))
+    with pytest.raises(RuntimeError):
+        client.chat_completion(MESSAGES, "gpt-test")
+    assert outcomes.recorded == [False]
+
+
+def test_errors_carry_the_status(monkeypatch, outcomes):
+    client = sync_client(monkeypatch, lambda payload: (401, {"error": "no key"}))
+    with pytest.raises(LLMError) as error:
+        client.chat_completion(MESSAGES, "gpt-test")
+    assert error.value.status == 401
+
+
+def async_client(handler):
+    client = AsyncLLMClient("test", base_url="http://upstream.test/v1", max_retries=0)
+    client._pools = [httpx.AsyncClient(base_url="http://upstream.test/v1/", transport=httpx.MockTransport(handler))]
+    return client
+
+
+async def collect(stream):
+    return [token async for token in stream]
+
+
+@pytest.mark.parametrize("status, ok", [(200, True), (400, True), (429, False), (502, False)])
+def test_async_calls_record_the_same_outcomes(outcomes, status, ok):
+    client = async_client(lambda request: httpx.Response(status, json=COMPLETION))
+
+    async def call():
+        try:
+            await client.chat_completion(MESSAGES, "gpt-test")
+        except LLMError:
+            pass
+        try:
+            await collect(client.stream_chat_completion(MESSAGES, "gpt-test"))
+        except LLMError:
+            pass
+
+    asyncio.run(call())
+    assert outcomes.recorded == [ok, ok]
+
+
+def test_async_transport_errors_are_failures(outcomes):
+    def handler(request):
+        raise httpx.ConnectError("refused")
+
+    client = async_client(handler)
+
+    async def call():
+        with pytest.raises(LLMError):
+            await client.chat_completion(MESSAGES, "gpt-test")
+        with pytest.raises(LLMError):
+            await collect(client.stream_chat_completion(MESSAGES, "gpt-test"))
+
+    asyncio.run(call())
+    assert outcomes.recorded == [False, False]
+
+
+def test_cancelled_calls_are_recorded_as_abandoned(outcomes):
+    async def handler(request):
+        await asyncio.sleep(10)
+
+    client = async_client(handler)
+
+    async def call():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.chat_completion(MESSAGES, "gpt-test"), 0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(collect(client.stream_chat_completion(MESSAGES, "gpt-test")), 0.01)
+
+    asyncio.run(call())
+    assert outcomes.recorded == [None, None]
+
+
+def test_stream_outcome_is_recorded_once(outcomes):
+    body = b'data: {"choices": [{"delta": {"content": "Hi"}}]}\n\ndata: [DONE]\n\n'
+    client = async_client(lambda request: httpx.Response(200, content=body))
+    assert asyncio.run(collect(client.stream_chat_completion(MESSAGES, "gpt-test"))) == ["Hi"]
+    assert outcomes.recorded == [True]
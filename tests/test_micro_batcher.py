@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+from micro_batcher import AsyncMicroBatcher, MicroBatcher
+
+
+class Recorder:
+    """Handler that records its batches and answers each item upper-cased."""
+
+    def __init__(self, answer=None):
+        self.batches = []
+        self.answer = answer or (lambda items: [item.upper() for item in items])
+
+    def __call__(self, items):
+        self.batches.append(items)
+        return self.answer(items)
+
+
+def submit_together(batcher, items):
+    futures = [batcher.submit(item) for item in items]
+    return [future.result(timeout=5) for future in futures]
+
+
+def test_items_within_the_window_share_one_call():
+    handler = Recorder()
+    batcher = MicroBatcher(handler, max_batch=8, window=0.2)
+    assert submit_together(batcher, ["a", "b", "c"]) == ["A", "B", "C"]
+    assert handler.batches == [["a", "b", "c"]]
+    stats = batcher.stats()
+    assert (stats["batches"], stats["items"], stats["mean_batch_size"]) == (1, 3, 3.0)
+
+
+def test_batches_are_capped_at_max_batch():
+    handler = Recorder()
+    batcher = MicroBatcher(handler, max_batch=2, window=0.2)
+    assert submit_together(batcher, ["a", "b", "c"]) == ["A", "B", "C"]
+    assert sorted(map(len, handler.batches)) == [1, 2]
+
+
+def test_a_failed_batch_resolves_every_item_to_none():
+    def fail(items):
+        raise RuntimeError("upstream down")
+
+    batcher = MicroBatcher(Recorder(fail), window=0.05)
+    assert submit_together(batcher, ["a", "b"]) == [None, None]
+    assert batcher.stats()["failed_batches"] == 1
+
+
+def test_a_wrong_number_of_results_resolves_every_item_to_none():
+    batcher = MicroBatcher(Recorder(lambda items: ["only one"]), window=0.05)
+    assert submit_together(batcher, ["a", "b"]) == [None, None]
+
+
+def test_slow_handlers_do_not_hold_up_the_next_batch():
+    release = threading.Event()
+
+    def answer(items):
+        if items == ["slow"]:
+            release.wait(5)
+        return items
+
+    batcher = MicroBatcher(Recorder(answer), window=0.01)
+    slow = batcher.submit("slow")
+    assert batcher.submit("fast").result(timeout=1) == "fast"
+    release.set()
+    assert slow.result(timeout=5) == "slow"
+
+
+def test_async_batcher():
+    handler = Recorder()
+
+    async def answer(items):
+        return handler(items)
+
+    async def run():
+        batcher = AsyncMicroBatcher(answer, max_batch=8, window=0.05)
+        return await asyncio.gather(*(batcher.submit(item) for item in ["a", "b", "c"]))
+
+    assert asyncio.run(run()) == ["A", "B", "C"]
+    assert handler.batches == [["a", "b", "c"]]
@@ -0,0 +1,86 @@
+import pytest
+
+import similarity_index
+from similarity_index import SimilarityIndex, shingles
+
+TIRED = {"emotion": "Tired", "intensity": 70}
+SENTENCE = "I'm so tired today, I barely slept"
+
+
+@pytest.fixture
+def make_index(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(similarity_index, "time", clock)
+
+    def make(**settings):
+        settings.setdefault("namespace", "model:v1")
+        return SimilarityIndex(str(tmp_path / "similar.sqlite3"), **settings)
+
+    return make
+
+
+def test_punctuation_and_case_do_not_matter(make_index):
+    index = make_index()
+    index.put(SENTENCE, TIRED)
+    assert index.get("im so TIRED today i barely slept") == (TIRED, 1.0)
+
+
+@pytest.mark.parametrize("threshold, hit", [(0.7, True), (0.8, False)])
+def test_threshold(make_index, threshold, hit):
+    index = make_index(threshold=threshold)
+    index.put(SENTENCE, TIRED)
+    match = index.get(SENTENCE + " at all")
+    if hit:
+        value, similarity = match
+        assert value == TIRED
+        assert threshold <= similarity < 1
+    else:
+        assert match is None
+
+
+@pytest.mark.parametrize("text", [
+    "I'm not tired today, I barely slept",
+    "Im not tired today, I barely slept",
+    "I'm so angry today, I barely slept",
+    "I'm so hungry today, I barely slept",
+])
+def test_different_emotional_evidence_never_matches(make_index, text):
+    index = make_index(threshold=0.0)
+    index.put(SENTENCE, TIRED)
+    assert shingles(text)[1] != shingles(SENTENCE)[1]
+    assert index.get(text) is None
+
+
+def test_lexicon_terms_include_negations_and_emotion_names():
+    _, terms = shingles("Dont say I feel happy")
+    assert {"dont", "happy"} <= set(terms)
+
+
+def test_namespaces_are_separate(make_index):
+    make_index().put(SENTENCE, TIRED)
+    assert make_index(namespace="model:v2").get(SENTENCE) is None
+
+
+def test_entries_expire_after_ttl(make_index, clock):
+    index = make_index(ttl=60)
+    index.put(SENTENCE, TIRED)
+    clock.advance(61)
+    assert index.get(SENTENCE) is None
+
+
+def test_size_is_bounded(make_index, clock):
+    index = make_index(max_entries=2, touch_interval=0)
+    texts = ["so tired today", "so sad today", "so happy today"]
+    for text in texts:
+        index.put(text, TIRED)
+        clock.advance(1)
+    assert index.get(texts[0]) is None
+    assert index.get(texts[2]) is not None
+    stats = index.stats()
+    assert (stats["size"], stats["evictions"], stats["hits"], stats["misses"]) == (2, 1, 1, 1)
+
+
+def test_threshold_above_one_disables_the_index(make_index):
+    index = make_index(threshold=1.5)
+    index.put(SENTENCE, TIRED)
+    assert index.get(SENTENCE) is None
+    assert not index.stats()["enabled"]
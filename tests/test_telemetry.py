@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import telemetry
+from telemetry import BUCKETS, Metrics
+
+
+@pytest.fixture
+def metrics(tmp_path, monkeypatch):
+    """A fresh metrics directory, also used by count(), stage() and log_event()."""
+    metrics = Metrics(str(tmp_path / "metrics"))
+    monkeypatch.setattr(telemetry, "metrics", metrics)
+    return metrics
+
+
+def sample(text, series):
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{series} not rendered")
+
+
+def test_counters_and_histograms_render(metrics):
+    metrics.inc("ora_requests_total", ("classify", "2xx"), amount=3)
+    metrics.observe("ora_stage_duration_seconds", ("llm_call",), 0.003)
+    metrics.observe("ora_stage_duration_seconds", ("llm_call",), 100.0)
+    metrics.inc("ora_requests_total", ("nonexistent", "2xx"))  # unknown series are ignored
+    text = metrics.render()
+    assert sample(text, 'ora_requests_total{endpoint="classify",status="2xx"}') == 3
+    assert sample(text, 'ora_stage_duration_seconds_bucket{stage="llm_call",le="0.0025"}') == 0
+    assert sample(text, 'ora_stage_duration_seconds_bucket{stage="llm_call",le="0.005"}') == 1
+    assert sample(text, f'ora_stage_duration_seconds_bucket{{stage="llm_call",le="{BUCKETS[-1]}"}}') == 1
+    assert sample(text, 'ora_stage_duration_seconds_bucket{stage="llm_call",le="+Inf"}') == 2
+    assert sample(text, 'ora_stage_duration_seconds_count{stage="llm_call"}') == 2
+    assert sample(text, 'ora_stage_duration_seconds_sum{stage="llm_call"}') == pytest.approx(100.003)
+
+
+def test_stage_times_blocks_and_counts_errors(metrics):
+    with telemetry.stage("cache_lookup"):
+        pass
+    with pytest.raises(ValueError):
+        with telemetry.stage("cache_lookup"):
+            raise ValueError
+    text = metrics.render()
+    assert sample(text, 'ora_stage_duration_seconds_count{stage="cache_lookup"}') == 2
+    assert sample(text, 'ora_stage_errors_total{stage="cache_lookup"}') == 1
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_exited_processes_are_retired_without_losing_counts(metrics):
+    metrics.inc("ora_admission_total", ("shed",))
+    for _ in range(2):
+        values = np.zeros(metrics.size)
+        values[metrics.offsets["ora_admission_total", ("shed",)]] = 5
+        values.tofile(metrics._path(exited_pid()))
+    series = 'ora_admission_total{outcome="shed"}'
+    assert sample(metrics.render(), series) == 11
+    names = sorted(os.listdir(metrics.directory))
+    assert names == sorted([f"{metrics.layout_id}-{os.getpid()}.metrics", f"{metrics.layout_id}-retired.metrics",
+                            f"{metrics.layout_id}.lock"])
+    assert sample(metrics.render(), series) == 11
+
+
+def test_files_of_another_layout_are_ignored(metrics):
+    metrics.inc("ora_admission_total", ("shed",))
+    np.ones(3).tofile(os.path.join(metrics.directory, f"{metrics.layout_id}-1.metrics"))
+    np.ones(metrics.size).tofile(os.path.join(metrics.directory, "000000000000-1.metrics"))
+    assert sample(metrics.render(), 'ora_admission_total{outcome="shed"}') == 1
+
+
+def test_reset_metrics_clears_the_directory(metrics):
+    metrics.inc("ora_admission_total", ("shed",))
+    open(os.path.join(metrics.directory, "keep.txt"), "w").close()
+    telemetry.reset_metrics(metrics.directory)
+    assert os.listdir(metrics.directory) == ["keep.txt"]
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def records(metrics, monkeypatch):
+    """log_event's records, captured in this thread instead of the queue."""
+    handler = Records()
+    log = logging.getLogger("ora.test")
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    log.handlers = [handler]
+    monkeypatch.setattr(telemetry, "log", log)
+    monkeypatch.setattr(telemetry, "_listener_pid", os.getpid())
+    return handler.records
+
+
+def test_sampled_events_follow_the_request(records, metrics):
+    token = telemetry._sampled.set(False)
+    try:
+        telemetry.log_event(logging.INFO, "routine", sampled=True)
+        telemetry.log_event(logging.WARNING, "problem", sampled=True)
+        telemetry.log_event(logging.INFO, "always")
+    finally:
+        telemetry._sampled.reset(token)
+    assert [record.getMessage() for record in records] == ["problem", "always"]
+    text = metrics.render()
+    assert sample(text, 'ora_log_events_total{outcome="sampled_out"}') == 1
+    assert sample(text, 'ora_log_events_total{outcome="emitted"}') == 2
+
+
+def test_events_below_the_level_are_dropped(records):
+    telemetry.log_event(logging.DEBUG, "noise", detail="x")
+    assert records == []
+
+
+def test_json_formatter_adds_the_fields(records):
+    telemetry.log_event(logging.WARNING, "audio_model_unscaled", path="model.pkl")
+    entry = json.loads(telemetry.JSONFormatter().format(records[0]))
+    assert entry["event"] == "audio_model_unscaled" and entry["level"] == "warning"
+    assert entry["path"] == "model.pkl" and entry["pid"] == os.getpid()
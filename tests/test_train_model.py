@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+import audio_features
+import train_model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_has_no_side_effects(tmp_path):
+    """A fresh interpreter imports the module without loading the heavy
+    dependencies, the model or an audio device, and writes nothing."""
+    script = (
+        "import json, sys; import train_model; "
+        "print(json.dumps({'modules': sorted(m for m in ('librosa', 'sklearn', 'sounddevice', 'gradio', 'openai') "
+        "if m in sys.modules), 'model': train_model._model is None}))"
+    )
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, env=env,
+                         capture_output=True, text=True, check=True)
+    assert json.loads(out.stdout) == {"modules": [], "model": True}
+    assert os.listdir(tmp_path) == []
+
+
+def test_extract_feature_is_the_shared_extractor():
+    t = np.arange(22050) / 22050
+    clip = (0.2 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    np.testing.assert_array_equal(train_model.extract_feature(clip, 22050),
+                                  audio_features.extract_feature(clip, 22050))
+
+
+def test_model_is_loaded_once(monkeypatch):
+    monkeypatch.setattr(train_model, "_model", None)
+    monkeypatch.setattr(train_model, "_encoder", None)
+    monkeypatch.chdir(ROOT)
+    model, encoder = train_model.load_trained_model()
+    again = train_model.load_trained_model()
+    assert again[0] is model and again[1] is encoder
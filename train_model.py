@@ -1,41 +1,45 @@
+"""
+Speech emotion model: training, loading, and a live record-and-chat loop.
+
+Importing this module has no side effects and only imports NumPy. librosa,
+sklearn, sounddevice, gradio and openai are imported by the functions that
+use them, so a headless worker that only wants extract_feature never loads an
+audio device, Gradio or the OpenAI SDK. The entry points are explicit:
+
+    python train_model.py train [--force]   # train on RAVDESS and save
+    python train_model.py run               # record, detect emotion, chat
+    python train_model.py ui                # Gradio emotion detector
+
+load_trained_model() loads the model on first use and memoizes it; warm_up()
+also pays librosa's first-call cost up front. benchmarks/bench_import.py
+keeps the import time of this module within budget.
+"""
 import os
 import pickle
-import openai
-import librosa
+
 import numpy as np
-import sounddevice as sd
-from dotenv import load_dotenv
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.neural_network import MLPClassifier
-from sklearn.model_selection import GridSearchCV
+
+MODEL_PATH, ENCODER_PATH = "trained_emotion_model.pkl", "label_encoder.pkl"
 
 
 # 📌 Load Training Data (RAVDESS Dataset)
 def load_training_data():
     """Loads and extracts features from the RAVDESS dataset."""
-    data_dir = "ravdess_data"  # Ensure this folder contains WAV files
+    from sklearn.preprocessing import LabelEncoder
 
-    features, labels = [], []
+    from feature_cache import FeatureCache, extract_files
 
-    for file in os.listdir(data_dir):
-        if file.endswith(".wav"):  
-            file_path = os.path.join(data_dir, file)
-            audio, sr = librosa.load(file_path, sr=44100)
-
-            # Extract features
-            mfccs = np.mean(librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=40).T, axis=0)
-            chroma = np.mean(librosa.feature.chroma_stft(y=audio, sr=sr).T, axis=0)
-            mel = np.mean(librosa.feature.melspectrogram(y=audio, sr=sr).T, axis=0)
-
-            # Combine features
-            feature_vector = np.hstack([mfccs, chroma, mel])
-            features.append(feature_vector)
+    data_dir = "ravdess_data"  # Ensure this folder contains WAV files
 
-            # Extract label (modify this based on dataset filename structure)
-            emotion_label = int(file.split("-")[2])  
-            labels.append(emotion_label)
+    # Extraction fans out over a process pool; unchanged files are read back
+    # from the feature cache instead of being re-extracted
+    files = sorted(file for file in os.listdir(data_dir) if file.endswith(".wav"))
+    cache = FeatureCache(os.getenv("FEATURE_CACHE_DIR", ".feature_cache"))
+    workers = int(os.getenv("TRAIN_WORKERS", "0")) or None
+    features = extract_files([os.path.join(data_dir, file) for file in files], cache, workers)
 
-    features, labels = np.array(features), np.array(labels)
+    # Extract label (modify this based on dataset filename structure)
+    labels = np.array([int(file.split("-")[2]) for file in files])
 
     # Encode labels into numbers
     encoder = LabelEncoder()
@@ -47,76 +51,88 @@ def load_training_data():
 # 📌 Train the Model
 def train_model():
     """Loads data, trains model, and saves it."""
-    X_train, y_train, encoder = load_training_data()
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
 
-    # Scale features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X_train)
+    from compact_model import export_model
 
-    # Train with optimized parameters
-    model = MLPClassifier(hidden_layer_sizes=(128, 64), activation="relu", solver="adam", 
-                          learning_rate="adaptive", max_iter=1000)
-    model.fit(X_scaled, y_train)
+    X_train, y_train, encoder = load_training_data()
+
+    # Scale features and train with optimized parameters. The scaler is
+    # saved with the MLP, so the pickle takes raw feature vectors just like
+    # the compact model
+    model = Pipeline([
+        ("scaler", StandardScaler()),
+        ("mlp", MLPClassifier(hidden_layer_sizes=(128, 64), activation="relu", solver="adam",
+                              learning_rate="adaptive", max_iter=1000)),
+    ])
+    model.fit(X_train, y_train)
 
     # Save trained model and encoder
-    with open("trained_emotion_model.pkl", "wb") as f:
+    with open(MODEL_PATH, "wb") as f:
         pickle.dump(model, f)
-    with open("label_encoder.pkl", "wb") as f:
+    with open(ENCODER_PATH, "wb") as f:
         pickle.dump(encoder, f)
+    # Pickle-free copy for serving, with the scaler folded in
+    export_model(model, encoder, "emotion_model.npz")
 
     print("✅ Model trained and saved successfully!")
 
-# Train model if not already trained
-if not os.path.exists("trained_emotion_model.pkl"):
-    print("🚀 Training model on RAVDESS dataset...")
-    train_model()
-else:
-    print("✅ Model already trained. Skipping training.")
+
+def ensure_trained(force=False):
+    """Train the model unless it is already saved (or `force` is set)."""
+    if force or not os.path.exists(MODEL_PATH):
+        print("🚀 Training model on RAVDESS dataset...")
+        train_model()
+    else:
+        print("✅ Model already trained. Skipping training.")
 
 # 📌 Load Trained Model
+_model = None
+_encoder = None
+
+
 def load_trained_model():
-    """Loads the trained model and encoder from disk."""
-    MODEL_PATH, ENCODER_PATH = "trained_emotion_model.pkl", "label_encoder.pkl"
+    """Loads the trained model and encoder from disk, once per process."""
+    global _model, _encoder
+    if _model is None:
+        if not os.path.exists(MODEL_PATH) or not os.path.exists(ENCODER_PATH):
+            raise FileNotFoundError("❌ Model or encoder file not found: run `python train_model.py train`")
 
-    if not os.path.exists(MODEL_PATH) or not os.path.exists(ENCODER_PATH):
-        print("❌ Error: Model or encoder file not found!")
-        exit()
+        with open(MODEL_PATH, "rb") as f:
+            model = pickle.load(f)
+        with open(ENCODER_PATH, "rb") as f:
+            _encoder = pickle.load(f)
+        _model = model
 
-    with open(MODEL_PATH, "rb") as f:
-        model = pickle.load(f)
-    with open(ENCODER_PATH, "rb") as f:
-        encoder = pickle.load(f)
+        print("✅ Model and encoder loaded successfully!")
+    return _model, _encoder
 
-    print("✅ Model and encoder loaded successfully!")
-    return model, encoder
 
-model, encoder = load_trained_model()
+def warm_up():
+    """Load the model and run one prediction on a short tone, so neither the
+    unpickling nor librosa's JIT compilation lands on the first real call."""
+    tone = 0.1 * np.sin(2 * np.pi * 440 * np.arange(16000, dtype=np.float32) / 16000)
+    predict_emotion(tone, 16000)
 
 # 📌 Extract Features for Prediction
 def extract_feature(audio_data, sample_rate):
-    """Extracts audio features for emotion recognition."""
-    result = np.array([])
+    """Extracts audio features for emotion recognition.
 
-    # Ensure correct sample rate
-    TARGET_SAMPLE_RATE = 44100
-    if sample_rate != TARGET_SAMPLE_RATE:
-        audio_data = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=TARGET_SAMPLE_RATE)
-        sample_rate = TARGET_SAMPLE_RATE
+    The vector is left unscaled, as in training: the saved model applies the
+    StandardScaler fitted on the training set. (Scaling a single sample on
+    its own turns every feature into 0.)
+    """
+    import audio_features
 
-    # Extract features
-    mfccs = np.mean(librosa.feature.mfcc(y=audio_data, sr=sample_rate, n_mfcc=40).T, axis=0)
-    chroma = np.mean(librosa.feature.chroma_stft(y=audio_data, sr=sample_rate).T, axis=0)
-    mel = np.mean(librosa.feature.melspectrogram(y=audio_data, sr=sample_rate).T, axis=0)
-
-    # Combine and normalize features
-    result = np.hstack([mfccs, chroma, mel])
-    result = StandardScaler().fit_transform(result.reshape(1, -1)).flatten()
-
-    return result
+    return audio_features.extract_feature(audio_data, sample_rate)
 
 # 📌 Record Audio for Prediction
 def record_audio(duration=5, sample_rate=44100):
     """Records real-time audio."""
+    import sounddevice as sd
+
     print(f"🎤 Recording for {duration} seconds... Please speak.")
     audio = sd.rec(int(duration * sample_rate), samplerate=sample_rate, channels=1, dtype='float32')
     sd.wait()
@@ -125,7 +141,11 @@ def record_audio(duration=5, sample_rate=44100):
 # 📌 Predict Emotion
 def analyze_emotion(audio_path):
     """Predicts emotion from recorded audio and returns probability distribution."""
-    
+    import librosa
+
+    model, encoder = load_trained_model()
+    audio_data, sample_rate = librosa.load(audio_path, sr=None)
+
     # Extract features from audio
     features = extract_feature(audio_data, sample_rate).reshape(1, -1)
 
@@ -145,20 +165,27 @@ def analyze_emotion(audio_path):
     return emotion_probs
 
 
-# def predict_emotion(audio_data, sample_rate):
-    
-#     """Predicts emotion from recorded audio."""
-#     features = extract_feature(audio_data, sample_rate).reshape(1, -1)
-#     predicted_proba = model.predict_proba(features)[0]
-#     predicted_label = np.argmax(predicted_proba)
-#     emotion = encoder.inverse_transform([predicted_label])[0]
+def predict_emotion(audio_data, sample_rate):
+    """Predicts emotion from recorded audio, or returns None if it holds no speech."""
+    from audio_features import speech_bounds
 
-#     print(f"🎭 Detected Emotion: {emotion}")
-#     return emotion
+    # Leading and trailing silence is cut before extraction
+    bounds = speech_bounds(audio_data)
+    if bounds is None:
+        print("🔇 No speech detected.")
+        return None
+    trimmed = 1 - (bounds[1] - bounds[0]) / len(audio_data)
+    audio_data = audio_data[bounds[0]:bounds[1]]
+    print(f"✂️ Trimmed {trimmed:.0%} of the recording as silence.")
+
+    model, encoder = load_trained_model()
+    features = extract_feature(audio_data, sample_rate).reshape(1, -1)
+    predicted_proba = model.predict_proba(features)[0]
+    predicted_label = model.classes_[np.argmax(predicted_proba)]
+    emotion = encoder.inverse_transform([predicted_label])[0]
 
-# 📌 Load OpenAI API Key
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+    print(f"🎭 Detected Emotion: {emotion}")
+    return emotion
 
 # 📌 Generate ChatGPT Response Based on Emotion
 def generate_chatgpt_response(messages):
@@ -167,6 +194,12 @@ def generate_chatgpt_response(messages):
     #     # {"role": "system", "content": "You are a friendly and empathetic assistant. Start a conversation based on user emotion."},
     #     # {"role": "user", "content": f"I'm feeling {emotion}. Let's talk about it."}
     # ]
+    import openai
+    from dotenv import load_dotenv
+
+    # 📌 Load OpenAI API Key
+    load_dotenv()
+    openai.api_key = os.getenv("OPENAI_API_KEY")
 
     try:
         response = openai.ChatCompletion.create(
@@ -179,7 +212,10 @@ def generate_chatgpt_response(messages):
         return "Sorry, I encountered an error generating a response."
 
 # 📌 Main Program Loop
-if __name__ == "__main__":
+def run():
+    """Record, detect the emotion, and hold a ChatGPT conversation about it."""
+    ensure_trained()
+    warm_up()
     print("🎙️ Real-Time Speech Emotion Detection + ChatGPT")
     print("Press Ctrl+C to exit the program.\n")
 
@@ -231,50 +267,61 @@ if __name__ == "__main__":
             print("❌ Could not detect emotion. Please try again.")
 
 
-import gradio as gr
-import librosa
-import numpy as np
-import pickle
-from sklearn.preprocessing import StandardScaler
+# 🔹 Gradio UI
+def build_interface():
+    """Record or upload audio in the browser and show the detected emotion."""
+    import gradio as gr
+    import librosa
 
-# 🔹 Load trained model and encoder
-with open("trained_emotion_model.pkl", "rb") as f:
-    model = pickle.load(f)
+    # 🔹 Define function to predict emotion
+    def predict_uploaded_emotion(audio):
+        try:
+            model, encoder = load_trained_model()
 
-with open("label_encoder.pkl", "rb") as f:
-    encoder = pickle.load(f)
+            # Load audio file
+            y, sr = librosa.load(audio, sr=44100)
 
-# 🔹 Define function to predict emotion
-def predict_emotion(audio):
-    try:
-        # Load audio file
-        y, sr = librosa.load(audio, sr=44100)
+            # Extract features
+            features = extract_feature(y, sr).reshape(1, -1)
 
-        # Extract features
-        mfccs = np.mean(librosa.feature.mfcc(y=y, sr=sr, n_mfcc=40).T, axis=0)
-        chroma = np.mean(librosa.feature.chroma_stft(y=y, sr=sr).T, axis=0)
-        mel = np.mean(librosa.feature.melspectrogram(y=y, sr=sr).T, axis=0)
+            # Predict emotion
+            predicted_label = model.predict(features)[0]
+            emotion = encoder.inverse_transform([predicted_label])[0]
 
-        # Combine and normalize features
-        features = np.hstack((mfccs, chroma, mel)).reshape(1, -1)
-        features = StandardScaler().fit_transform(features)
+            return f"Detected Emotion: {emotion} 😊"
 
-        # Predict emotion
-        predicted_label = model.predict(features)[0]
-        emotion = encoder.inverse_transform([predicted_label])[0]
+        except Exception as e:
+            return f"Error: {str(e)}"
 
-        return f"Detected Emotion: {emotion} 😊"
+    return gr.Interface(
+        fn=predict_uploaded_emotion,
+        inputs="audio",
+        outputs="text",
+        title="🎤 Emotion Detector",
+        description="Record or upload an audio file, and the AI will detect the emotion!",
+        live=True,
+    )
 
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-# 🔹 Create Gradio UI
-iface = gr.Interface(
-    fn=predict_emotion,
-    inputs="audio",
-    outputs="text",
-    title="🎤 Emotion Detector",
-    description="Record or upload an audio file, and the AI will detect the emotion!",
-    live=True,
-)
 
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the speech emotion model or run the live loop")
+    commands = parser.add_subparsers(dest="command")
+    train = commands.add_parser("train", help="train on RAVDESS and save the model")
+    train.add_argument("--force", action="store_true", help="retrain even if a model is saved")
+    commands.add_parser("run", help="record audio, detect emotion and chat (the default)")
+    commands.add_parser("ui", help="serve the Gradio emotion detector")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        ensure_trained(force=args.force)
+    elif args.command == "ui":
+        load_trained_model()
+        build_interface().launch()
+    else:
+        run()
+
+
+if __name__ == "__main__":
+    main()